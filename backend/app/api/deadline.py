@@ -0,0 +1,43 @@
+# backend/app/api/deadline.py
+"""
+Per-request deadlines for OpenAI calls.
+
+Every HTTP request runs inside a deadline scope, so the retry policy never keeps
+retrying (or waiting on) OpenAI after the request's budget is spent. Clients can
+ask for a shorter budget with the X-Request-Timeout header (seconds).
+"""
+import logging
+import os
+
+from app.clients.retry_policy import deadline_scope
+
+logger = logging.getLogger(__name__)
+
+OPENAI_REQUEST_DEADLINE_SECONDS = float(os.getenv("OPENAI_REQUEST_DEADLINE_SECONDS", "180"))
+DEADLINE_HEADER = b"x-request-timeout"
+
+def _requested_timeout(scope) -> float:
+    for name, value in scope.get("headers", []):
+        if name == DEADLINE_HEADER:
+            try:
+                requested = float(value.decode("latin-1"))
+            except ValueError:
+                logger.warning(f"⚠️ Ignoring invalid X-Request-Timeout: {value!r}")
+                break
+            if requested > 0:
+                return min(requested, OPENAI_REQUEST_DEADLINE_SECONDS)
+            break
+    return OPENAI_REQUEST_DEADLINE_SECONDS
+
+class RequestDeadlineMiddleware:
+    """ASGI middleware that runs each HTTP request (including streamed bodies) under a deadline"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or OPENAI_REQUEST_DEADLINE_SECONDS <= 0:
+            await self.app(scope, receive, send)
+            return
+        with deadline_scope(_requested_timeout(scope)):
+            await self.app(scope, receive, send)
@@ -0,0 +1,40 @@
+# backend/app/api/file_responses.py
+"""
+Conditional and ranged responses for files in the image store.
+
+Stored images are content-addressed, so their ID already is a strong validator:
+ETags are built from it (plus a derivative's width and format) without hashing
+or even stat-ing the file, and a matching If-None-Match gets an empty 304 before
+the file is opened (but after the index lookup, so unknown IDs still get a 404). Everything else goes out as a FileResponse, which answers
+Range / If-Range requests with 206 (or 416), streams from disk in chunks instead
+of reading the file into memory, and hands the path to the server when it
+supports the ASGI pathsend extension.
+"""
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+def make_etag(*parts: str) -> str:
+    """Strong ETag from content-derived parts, e.g. make_etag(image_id, "256", "webp")"""
+    return '"' + "-".join(parts) + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/ prefixes are ignored; call it only once the
+    resource is known to exist, since "*" matches any existing representation"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+def not_modified(etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    # A 304 repeats the headers a 200 would have carried for caching (ETag, Cache-Control, Vary)
+    return Response(status_code=304, headers={**(headers or {}), "ETag": etag})
+
+def serve_file(request: Request, path: str, media_type: str, etag: str,
+               headers: Optional[Dict[str, str]] = None) -> Response:
+    """304 if the client already has etag, otherwise the file (or the requested byte range)"""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, headers)
+    return FileResponse(path, media_type=media_type, headers={**(headers or {}), "ETag": etag})
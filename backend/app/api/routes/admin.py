@@ -0,0 +1,102 @@
+# backend/app/api/routes/admin.py
+"""
+Admin endpoints: OpenAI token, image and cost accounting per participant and tool,
+and listing / garbage collection of the image store.
+Every endpoint requires ADMIN_API_TOKEN in the X-Admin-Token header; without a
+configured token they all answer 403.
+"""
+from fastapi import APIRouter, Header, HTTPException
+from datetime import datetime
+from typing import Optional
+from app.clients.usage_tracker import GROUP_COLUMNS, TOOLS, WINDOWS, usage_tracker
+from app.services.image_cache import image_cache
+from app.services.image_store import image_store
+import asyncio
+import hmac
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
+if not ADMIN_API_TOKEN:
+    logger.warning("🔒 ADMIN_API_TOKEN is not set; /admin endpoints are disabled")
+
+def _check_token(token: Optional[str]):
+    # Fail closed: per-participant usage and image GC must never be open by default
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_API_TOKEN is not set)")
+    if not hmac.compare_digest(token or "", ADMIN_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@router.get("/usage")
+async def get_usage(
+    group_by: str = "user_id,tool",
+    window: str = "hour",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    tool: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """OpenAI usage totals grouped by any of user_id, tool, call_site, model and image_size,
+    per time window (minute, hour, day or all)"""
+    _check_token(x_admin_token)
+    columns = [column.strip() for column in group_by.split(",") if column.strip()]
+    unknown = [column for column in columns if column not in GROUP_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by {', '.join(unknown)}; use {', '.join(GROUP_COLUMNS)}")
+    if window != "all" and window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(WINDOWS)}, all")
+    if tool is not None and tool.upper() not in TOOLS:
+        raise HTTPException(status_code=400, detail=f"tool must be one of {', '.join(TOOLS)}")
+
+    rows = await asyncio.to_thread(
+        usage_tracker.query,
+        columns,
+        None if window == "all" else window,
+        since.timestamp() if since else None,
+        until.timestamp() if until else None,
+        user_id,
+        tool.upper() if tool else None
+    )
+    for row in rows:
+        if "window_start" in row:
+            row["window_start"] = datetime.fromtimestamp(row["window_start"]).isoformat()
+    return {
+        "group_by": columns,
+        "window": window,
+        "rows": rows,
+        "tracker": usage_tracker.get_stats()
+    }
+
+@router.get("/images")
+async def list_images(
+    limit: int = 100,
+    before: Optional[float] = None,
+    mime: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Stored images, newest first; pass next_before as `before` to get the next page"""
+    _check_token(x_admin_token)
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    records = await asyncio.to_thread(image_store.list_images, limit, before, mime)
+    return {
+        "images": [record.to_dict() for record in records],
+        "next_before": records[-1].created if len(records) == limit else None,
+        "store": await asyncio.to_thread(image_store.get_stats),
+        "cache": image_cache.get_stats()
+    }
+
+@router.post("/images/gc")
+async def collect_images(
+    verify: bool = False,
+    dry_run: bool = False,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Delete stale temp files; verify also drops index entries whose file is missing
+    (stats every file). Stored images are kept for good, so nothing else is collected."""
+    _check_token(x_admin_token)
+    return await asyncio.to_thread(image_store.gc, verify, dry_run)
@@ -1,14 +1,19 @@
 # backend/app/api/routes/chat.py
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Request
+from app.api.sse import sse_metrics, sse_response, stream_registry
+from app.clients.retry_policy import retry_stats
+from app.clients.usage_tracker import set_usage_user, usage_tracker
+from app.logging_config import get_logging_stats
 from app.schemas.chat import ChatRequest, ChatResponse
-from app.services.conversation_service import process_conversation
-from app.services.chat_service import get_text_response_stream
-from app.services.intent_service import analyze_intent
-from app.services.image_storage_service import store_image
-from app.services.image_service import get_image_response_stream
-from app.services.image_modification_service import edit_image_region_stream
-import json
+from app.services.conversation_service import process_conversation_async, process_both_stream_async
+from app.services.chat_service import get_text_response_stream_async
+from app.services.speculation_service import analyze_intent_speculative, speculation_stats
+from app.services.image_cache import image_cache
+from app.services.image_storage_service import image_normalizer, is_image_id, is_inline_image, resolve_image_ref, store_image
+from app.services.conversation_store import ConversationNotFoundError, prepare_conversation, record_turn, sync_point
+from app.services.image_service import get_image_response_stream_async
+from app.services.image_modification_service import edit_image_region_stream_async
+import asyncio
 import logging
 
 # Set up logging
@@ -16,24 +21,53 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def _done_event(request: ChatRequest, content: str = "", image_url: str = None) -> dict:
+    """Final SSE event; records the turn when the client uses a server-side conversation"""
+    event = {'type': 'done'}
+    message_id = record_turn(request, content, image_url)
+    if message_id:
+        event.update(conversation_id=request.conversation_id, message_id=message_id, **sync_point(request))
+    return event
+
+def _resolve_image_ids(request: ChatRequest):
+    """Expand bare IDs from /images/upload into /images/ URLs"""
+    if isinstance(request.user_image, str):
+        request.user_image = resolve_image_ref(request.user_image)
+    for msg in request.conversation_history:
+        msg.image_url = resolve_image_ref(msg.image_url)
+    region = request.image_region
+    if region:
+        region.image_url = resolve_image_ref(region.image_url)
+        if region.mask_id and not region.mask_data:
+            if not is_image_id(region.mask_id):
+                raise HTTPException(status_code=400, detail="Invalid mask_id")
+            region.mask_data = resolve_image_ref(region.mask_id)
+
+async def _prepare_conversation(request: ChatRequest):
+    set_usage_user(request.user_id)
+    _resolve_image_ids(request)
+    try:
+        await prepare_conversation(request)
+    except ConversationNotFoundError as e:
+        # Client should resend the full history without last_message_id
+        logger.info(f"Conversation state not found: {e}")
+        raise HTTPException(status_code=409, detail=str(e))
+
 @router.post("/", response_model=ChatResponse)
 async def chat_with_ai(request: ChatRequest):
     """Main chat endpoint that handles text and images"""
     logger.info(f"Chat request received - input length: {len(request.user_input)}, history: {len(request.conversation_history)} messages")
     
+    await _prepare_conversation(request)
+    
     is_image_edit = request.image_region and request.image_region.image_url
     
     if not is_image_edit:
         for i, msg in enumerate(request.conversation_history):
             if msg.image_url:
-                is_base64 = (msg.image_url.startswith('data:image') or 
-                            (not msg.image_url.startswith('/') and 
-                             not msg.image_url.startswith('http') and 
-                             len(msg.image_url) > 100))
-                
-                if is_base64:
+                if is_inline_image(msg.image_url):
                     try:
-                        image_url = store_image(msg.image_url)
+                        image_url = await asyncio.to_thread(store_image, msg.image_url)
                         msg.image_url = image_url
                         logger.debug(f"Converted history[{i}] image to URL")
                     except Exception as e:
@@ -41,89 +75,107 @@ async def chat_with_ai(request: ChatRequest):
     
     if request.image_region and request.image_region.image_url:
         image_region_url = request.image_region.image_url
-        if image_region_url.startswith('data:image') or (
-            not image_region_url.startswith('/') and 
-            not image_region_url.startswith('http') and 
-            len(image_region_url) > 100
-        ):
+        if is_inline_image(image_region_url):
             try:
-                request.image_region.image_url = store_image(image_region_url)
+                request.image_region.image_url = await asyncio.to_thread(store_image, image_region_url)
                 logger.debug("Converted image_region URL")
             except Exception as e:
                 logger.warning(f"Failed to convert image_region URL: {e}")
     
     try:
-        response = process_conversation(request)
+        response = await process_conversation_async(request)
         logger.info(f"Chat request completed - type: {response.type}")
+        response.message_id = record_turn(request, response.content, response.image_url)
+        if response.message_id:
+            response.conversation_id = request.conversation_id
+            sync = sync_point(request)
+            response.history_length = sync["history_length"]
+            response.history_message_id = sync["history_message_id"]
         return response
     except Exception as e:
         logger.error(f"Chat request failed: {type(e).__name__}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/stream")
-async def chat_with_ai_stream(request: ChatRequest):
+async def chat_with_ai_stream(request: ChatRequest, http_request: Request):
     """Streaming chat endpoint for text and image responses"""
     logger.info(f"Streaming chat request - input length: {len(request.user_input)}")
     
+    await _prepare_conversation(request)
+    
     try:
-        intent = analyze_intent(request)
+        # The text stream may already be running (speculatively) while the intent resolves
+        intent, speculation = await analyze_intent_speculative(request)
         logger.debug(f"Streaming intent: {intent}")
         
         if intent == "text_solo":
-            def generate():
-                chunk_count = 0
-                for chunk in get_text_response_stream(request):
-                    chunk_count += 1
-                    yield f"data: {json.dumps({'type': 'text', 'content': chunk})}\n\n"
-                yield f"data: {json.dumps({'type': 'done'})}\n\n"
-                logger.debug(f"Text streaming completed: {chunk_count} chunks")
+            async def generate():
+                text_chunks = []
+                chunks = speculation.stream() if speculation else get_text_response_stream_async(request)
+                async for chunk in chunks:
+                    text_chunks.append(chunk)
+                    yield {'type': 'text', 'content': chunk}
+                yield _done_event(request, "".join(text_chunks))
+                logger.debug(f"Text streaming completed: {len(text_chunks)} chunks")
             
-            return StreamingResponse(generate(), media_type="text/plain")
+            return sse_response(http_request, generate(), "chat_text",
+                                on_close=speculation.cancel if speculation else None)
         elif intent == "image_solo":
             is_image_edit = request.image_region and request.image_region.image_url
             
             if is_image_edit:
                 logger.debug("Image editing stream requested")
-                def generate():
-                    for event in edit_image_region_stream(request):
+                async def generate():
+                    async for event in edit_image_region_stream_async(request):
                         if event['type'] == 'status':
-                            yield f"data: {json.dumps({'type': 'status', 'message': event['message']})}\n\n"
+                            yield {'type': 'status', 'message': event['message']}
                         elif event['type'] == 'partial_image':
-                            yield f"data: {json.dumps({'type': 'partial_image', 'index': event['index'], 'image_b64': event['image_b64']})}\n\n"
+                            yield {'type': 'partial_image', 'index': event['index'], 'image_b64': event['image_b64']}
                         elif event['type'] == 'completed':
-                            yield f"data: {json.dumps({'type': 'image_solo', 'content': 'Edited', 'image_url': event['image_url']})}\n\n"
-                            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                            yield {'type': 'image_solo', 'content': 'Edited', 'image_url': event['image_url']}
+                            yield _done_event(request, "Edited", event['image_url'])
                             break
                         elif event['type'] == 'error':
-                            yield f"data: {json.dumps({'type': 'error', 'message': event['message']})}\n\n"
-                            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                            yield {'type': 'error', 'message': event['message']}
+                            yield {'type': 'done'}
                             break
-                return StreamingResponse(generate(), media_type="text/plain")
+                return sse_response(http_request, generate(), "chat_image_edit")
             else:
                 logger.debug("Image generation stream requested")
-                def generate():
-                    yield f"data: {json.dumps({'type': 'status', 'message': 'Generating image, may take a moment...'})}\n\n"
+                async def generate():
+                    yield {'type': 'status', 'message': 'Generating image, may take a moment...'}
                     
-                    for event in get_image_response_stream(request):
+                    async for event in get_image_response_stream_async(request):
                         if event['type'] == 'partial_image':
-                            yield f"data: {json.dumps({'type': 'partial_image', 'index': event['index'], 'image_b64': event['image_b64']})}\n\n"
+                            yield {'type': 'partial_image', 'index': event['index'], 'image_b64': event['image_b64']}
                         elif event['type'] == 'completed':
-                            yield f"data: {json.dumps({'type': 'image_solo', 'content': 'Generated', 'image_url': event['image_url']})}\n\n"
-                            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                            yield {'type': 'image_solo', 'content': 'Generated', 'image_url': event['image_url']}
+                            yield _done_event(request, "Generated", event['image_url'])
                             break
                         elif event['type'] == 'error':
-                            yield f"data: {json.dumps({'type': 'error', 'message': event['message']})}\n\n"
-                            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                            yield {'type': 'error', 'message': event['message']}
+                            yield {'type': 'done'}
                             break
                 
-                return StreamingResponse(generate(), media_type="text/plain")
+                return sse_response(http_request, generate(), "chat_image")
         else:
-            logger.debug("Both intent detected, using regular endpoint")
-            response = process_conversation(request, intent)
-            def generate():
-                yield f"data: {json.dumps(response.dict())}\n\n"
-                yield f"data: {json.dumps({'type': 'done'})}\n\n"
-            return StreamingResponse(generate(), media_type="text/plain")
+            logger.debug("Both intent detected, streaming text and image together")
+            async def generate():
+                text_chunks = []
+                image_url = None
+                async for event in process_both_stream_async(request):
+                    if event['type'] == 'text':
+                        text_chunks.append(event['content'])
+                        yield {'type': 'text', 'content': event['content']}
+                    elif event['type'] == 'partial_image':
+                        yield {'type': 'partial_image', 'index': event['index'], 'image_b64': event['image_b64']}
+                    elif event['type'] == 'completed':
+                        image_url = event['image_url']
+                        yield {'type': 'image_solo', 'content': 'Generated', 'image_url': event['image_url']}
+                    elif event['type'] == 'error':
+                        yield {'type': 'error', 'message': event['message']}
+                yield _done_event(request, "".join(text_chunks), image_url)
+            return sse_response(http_request, generate(), "chat_both")
             
     except Exception as e:
         logger.error(f"Streaming chat failed: {type(e).__name__}: {e}")
@@ -132,5 +184,16 @@ async def chat_with_ai_stream(request: ChatRequest):
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "Visual4Math Chat API"}
+    return {
+        "status": "healthy",
+        "service": "Visual4Math Chat API",
+        "speculation": speculation_stats.get_stats(),
+        "streams": sse_metrics.get_stats(),
+        "resumable_streams": stream_registry.get_stats(),
+        "openai_calls": retry_stats.get_stats(),
+        "openai_usage": usage_tracker.get_stats(),
+        "logging": get_logging_stats(),
+        "image_normalizer": image_normalizer.get_stats(),
+        "image_cache": image_cache.get_stats()
+    }
 
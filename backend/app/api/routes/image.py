@@ -1,12 +1,15 @@
 # backend/app/api/routes/image.py
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request, Header
+from app.api.sse import resumable_sse_response, sse_response, stream_registry
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 from datetime import datetime
-from app.services.image_service import get_image_response, get_image_response_stream
+from app.services.image_service import get_image_response_async, get_image_response_stream_async
 from app.services.image_storage_service import store_metadata
+from app.services.image_job_service import QueueFullError, create_image_job, follow_job, image_job_queue
+from app.clients.image_scheduler import image_scheduler
 from app.schemas.chat import ChatRequest
+import asyncio
 import json
 import logging
 import io
@@ -18,6 +21,7 @@ class ImagePrompt(BaseModel):
     prompt: str
     layout_info: Optional[Dict[str, Any]] = None
     metadata: Optional[Dict[str, Any]] = None
+    user_id: Optional[str] = None
 
 @router.post("/generate-image")
 async def generate_image_from_prompt(data: ImagePrompt):
@@ -26,11 +30,12 @@ async def generate_image_from_prompt(data: ImagePrompt):
         request = ChatRequest(
             user_input=data.prompt,
             user_image=None,
-            conversation_history=[]
+            conversation_history=[],
+            user_id=data.user_id
         )
         
         # Generate image
-        image_url = get_image_response(request)
+        image_url = await get_image_response_async(request)
         
         # Check if image generation succeeded (image_url should not be empty)
         if not image_url or image_url == "":
@@ -67,7 +72,7 @@ async def generate_image_from_prompt(data: ImagePrompt):
         
         # Store metadata alongside image (only if image generation succeeded)
         try:
-            store_metadata(image_id, metadata)
+            await asyncio.to_thread(store_metadata, image_id, metadata)
             logger.info(f"✅ Metadata stored successfully for image: {image_id}")
         except Exception as meta_error:
             logger.warning(f"⚠️ Failed to store metadata (non-critical): {meta_error}")
@@ -80,12 +85,17 @@ async def generate_image_from_prompt(data: ImagePrompt):
 
 @router.post("/generate-image-stream")
 async def generate_image_from_prompt_stream(
+    http_request: Request,
     prompt: str = Form(...),
     layout_image: Optional[UploadFile] = File(None),
     layout_info: Optional[str] = Form(None),
-    metadata: Optional[str] = Form(None)
+    metadata: Optional[str] = Form(None),
+    user_id: Optional[str] = Form(None)
 ):
-    """Stream image generation with partial images. Supports both FormData (with layout image) and JSON fallback."""
+    """Stream image generation with partial images. Supports both FormData (with layout image) and JSON fallback.
+    The first event carries a stream_id; if the connection drops, the generation keeps
+    running and the client can resume with GET /image/streams/{stream_id}.
+    """
     try:
         # Parse layout_info and metadata if provided as JSON strings
         layout_info_dict = None
@@ -112,15 +122,16 @@ async def generate_image_from_prompt_stream(
         request = ChatRequest(
             user_input=prompt,
             user_image=layout_image_bytes,  # Pass image bytes
-            conversation_history=[]
+            conversation_history=[],
+            user_id=user_id
         )
         
         async def generate():
             try:
-                for event in get_image_response_stream(request):
+                async for event in get_image_response_stream_async(request):
                     if event['type'] == 'partial_image':
                         # Yield partial image as base64 data URL
-                        yield f"data: {json.dumps({'type': 'partial_image', 'index': event['index'], 'image_b64': event['image_b64']})}\n\n"
+                        yield {'type': 'partial_image', 'index': event['index'], 'image_b64': event['image_b64']}
                     elif event['type'] == 'completed':
                         # Extract image_id from URL
                         image_url = event['image_url']
@@ -144,18 +155,105 @@ async def generate_image_from_prompt_stream(
                         
                         # Store metadata
                         try:
-                            store_metadata(image_id, metadata_obj)
+                            await asyncio.to_thread(store_metadata, image_id, metadata_obj)
                         except Exception:
                             pass
                         
-                        yield f"data: {json.dumps({'type': 'completed', 'image_url': image_url})}\n\n"
+                        yield {'type': 'completed', 'image_url': image_url}
                     elif event['type'] == 'error':
-                        yield f"data: {json.dumps({'type': 'error', 'message': event['message']})}\n\n"
+                        yield {'type': 'error', 'message': event['message']}
             except Exception as e:
                 logger.error(f"❌ Streaming error: {e}")
-                yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+                yield {'type': 'error', 'message': str(e)}
         
-        return StreamingResponse(generate(), media_type="text/event-stream")
+        stream = stream_registry.start(generate(), "image_generate")
+        return resumable_sse_response(http_request, stream)
     except Exception as e:
         logger.error(f"❌ Image generation streaming failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/streams/{stream_id}")
+async def resume_image_stream(
+    stream_id: str,
+    http_request: Request,
+    last_event_id: Optional[int] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """Resume an image generation stream, replaying the events after Last-Event-ID"""
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    if last_event_id is None:
+        try:
+            last_event_id = int(last_event_id_header) if last_event_id_header else -1
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    stream_registry.resumed += 1
+    logger.info(f"🔁 Resuming image stream {stream_id} after event {last_event_id}")
+    return resumable_sse_response(http_request, stream, last_event_id)
+
+@router.post("/jobs", status_code=202)
+async def create_image_job_route(
+    prompt: str = Form(...),
+    layout_image: Optional[UploadFile] = File(None),
+    layout_info: Optional[str] = Form(None),
+    metadata: Optional[str] = Form(None),
+    user_id: Optional[str] = Form(None)
+):
+    """Queue an image generation and return its job ID immediately.
+    Follow it with GET /image/jobs/{job_id} (polling) or /image/jobs/{job_id}/events (SSE).
+    """
+    layout_info_dict = None
+    if layout_info:
+        try:
+            layout_info_dict = json.loads(layout_info)
+        except json.JSONDecodeError:
+            logger.warning("Failed to parse layout_info JSON")
+    
+    metadata_dict = None
+    if metadata:
+        try:
+            metadata_dict = json.loads(metadata)
+        except json.JSONDecodeError:
+            logger.warning("Failed to parse metadata JSON")
+    
+    layout_image_bytes = await layout_image.read() if layout_image else None
+    job = create_image_job(prompt, user_id, layout_image_bytes, layout_info_dict, metadata_dict)
+    try:
+        await image_job_queue.submit(job)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return image_job_queue.get_state(job.job_id)
+
+@router.get("/jobs/stats")
+async def image_job_stats():
+    """Queue depth, running jobs and wait-time metrics of the image job queue"""
+    return image_job_queue.get_stats()
+
+@router.get("/scheduler/stats")
+async def image_scheduler_stats():
+    """In-flight and waiting image calls, rate limit state and per-user wait-time histograms"""
+    return image_scheduler.get_stats()
+
+@router.get("/jobs/{job_id}")
+async def get_image_job(job_id: str):
+    """Current job state (status, queue position, image_url when completed)"""
+    state = image_job_queue.get_state(job_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return state
+
+@router.get("/jobs/{job_id}/events")
+async def subscribe_image_job(job_id: str, http_request: Request):
+    """SSE subscription to a job's status changes, partial images and result"""
+    if image_job_queue.get_state(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return sse_response(http_request, follow_job(job_id), "image_job")
+
+@router.delete("/jobs/{job_id}")
+async def cancel_image_job(job_id: str):
+    """Cancel a queued or running job"""
+    if image_job_queue.get_state(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    cancelled = await image_job_queue.cancel(job_id)
+    return {"job_id": job_id, "cancelled": cancelled}
@@ -2,34 +2,81 @@
 """
 Endpoint to serve stored images by ID.
 This allows frontend to load images using URLs like /images/{image_id}
+Smaller or re-encoded derivatives are served with ?w=256&fmt=webp; without fmt the
+format is negotiated from the Accept header
+Responses carry content-hash ETags (If-None-Match gets a 304) and support Range requests
+Images can also be uploaded directly (POST /images/upload) and referenced by ID
 """
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
-from app.services.image_storage_service import get_image_path
+from fastapi import APIRouter, HTTPException, Request
+from typing import Optional
+from app.api.file_responses import etag_matches, make_etag, not_modified, serve_file
+from app.api.uploads import receive_image_upload
+from app.services.image_storage_service import (
+    IMAGE_DERIVATIVE_WIDTHS, VARIANT_FORMATS, ImageTooLargeError, ImageUploadError,
+    derivative_width, get_image_record, get_image_variant_path, negotiate_format
+)
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+@router.post("/upload")
+async def upload_image(request: Request):
+    """
+    Upload an image as multipart/form-data (field "file"). The body is streamed to
+    the content-addressed store; the returned image_id can be used anywhere an
+    image URL is accepted (chat history, edit regions and masks, tracking).
+    """
+    try:
+        image_id, size = await receive_image_upload(request)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageUploadError as e:
+        logger.warning(f"⚠️ Rejected upload: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"image_id": image_id, "url": f"/images/{image_id}", "size": size}
+
 @router.get("/{image_id}")
-async def get_image(image_id: str):
-    """Serve a stored image by its ID"""
+async def get_image(image_id: str, request: Request, w: Optional[int] = None, fmt: Optional[str] = None):
+    """
+    Serve a stored image by its ID. With w (rounded up to one of IMAGE_DERIVATIVE_WIDTHS)
+    and/or fmt, serve a derivative that fits in w x w px, generated once and cached
+    """
     try:
         # Validate image_id (should be hex string, no path traversal)
         if not image_id or '/' in image_id or '..' in image_id:
             raise HTTPException(status_code=400, detail="Invalid image ID")
         
-        image_path = get_image_path(image_id)
-        if not image_path:
+        headers = {"Cache-Control": "public, max-age=31536000"}  # Cache for 1 year
+        # Revalidations are answered after the (indexed) lookup too, so unknown IDs get a 404, never a 304
+        record = get_image_record(image_id)
+        if not record:
             logger.warning(f"⚠️ Image not found: {image_id}")
             raise HTTPException(status_code=404, detail="Image not found")
         
-        logger.info(f"📤 Serving image: {image_id}")
-        return FileResponse(
-            image_path,
-            media_type="image/png",
-            headers={"Cache-Control": "public, max-age=31536000"}  # Cache for 1 year
-        )
+        if w is None and fmt is None:
+            logger.info(f"📤 Serving image: {image_id}")
+            return serve_file(request, record.path, record.mime, make_etag(image_id), headers)
+        
+        if w is not None and w <= 0:
+            raise HTTPException(status_code=400, detail="w must be a positive width")
+        if fmt is None:
+            fmt = negotiate_format(request.headers.get("accept", ""), record.mime)
+            headers["Vary"] = "Accept"
+        fmt = fmt.lower()
+        if fmt not in VARIANT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"fmt must be one of {', '.join(VARIANT_FORMATS)}")
+        size = derivative_width(w) if w else max(record.width or 0, record.height or 0) or IMAGE_DERIVATIVE_WIDTHS[-1]
+        etag = make_etag(image_id, str(size), fmt)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag, headers)
+        
+        variant_path = await asyncio.to_thread(get_image_variant_path, image_id, size, fmt)
+        if not variant_path:
+            raise HTTPException(status_code=404, detail="Image not found")
+        logger.info(f"📤 Serving image: {image_id} ({fmt}, {size}px)")
+        return serve_file(request, variant_path, VARIANT_FORMATS[fmt][1], etag, headers)
     except HTTPException:
         raise
     except Exception as e:
@@ -1,7 +1,7 @@
 # backend/app/api/routes/manipulatives.py
 from fastapi import APIRouter, HTTPException
 from app.schemas.manipulatives import ManipulativesRequest, ManipulativesResponse, ManipulativeElement
-from app.services.math2visual_service import generate_manipulatives_from_mwp, get_svg_dataset_path, get_additional_icons_path, get_my_icons_path, read_svg_content
+from app.services.math2visual_service import generate_manipulatives_from_mwp_async, get_svg_dataset_path, get_additional_icons_path, get_my_icons_path, read_svg_content
 import logging
 import os
 
@@ -16,7 +16,7 @@ async def generate_manipulatives(request: ManipulativesRequest):
     """
     try:
         logger.info(f"🎯 Generating manipulatives for: {request.problem_text[:100]}...")
-        result = generate_manipulatives_from_mwp(request.problem_text)
+        result = await generate_manipulatives_from_mwp_async(request.problem_text)
         
         # Convert to response format
         elements = [
@@ -0,0 +1,17 @@
+# backend/app/api/routes/metrics.py
+"""
+Prometheus scrape endpoint: per-route request latency, per-stage timings and
+OpenAI time to first byte / total latency as histograms (see app.tracing).
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.tracing import render_prometheus
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Export histograms in Prometheus text exposition format"""
+    return PlainTextResponse(render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,7 +1,10 @@
 # backend/app/api/routes/parse.py
 from fastapi import APIRouter, HTTPException
 from app.schemas.parse import ParseRequest, ParseResponse, LayoutItem
-from app.clients.openai_client import client
+from app.clients.openai_client import run_sync
+from app.clients.llm_cache import cached_chat_completion
+from app.clients.single_flight import single_flight, make_flight_key
+from app.logging_config import log_payload
 from typing import List, Dict, Optional
 import json
 import logging
@@ -9,11 +12,25 @@ import logging
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-def parse_math_word_problem(problem_text: str) -> ParseResponse:
+def _is_json_object(text: str) -> bool:
+    """Only cache parser responses that are valid JSON objects."""
+    try:
+        return isinstance(json.loads(text), dict)
+    except (json.JSONDecodeError, TypeError):
+        return False
+
+async def parse_math_word_problem_async(problem_text: str) -> ParseResponse:
     """
     Parse a math word problem using GPT to extract objects and create individual boxes.
     Returns a layout with individual boxes for each item (one box per item, no unnecessary containers).
+    Concurrent requests for the same problem share a single GPT call.
     """
+    return await single_flight.do(
+        make_flight_key("parse_mwp", problem_text),
+        lambda: _parse_math_word_problem(problem_text)
+    )
+
+async def _parse_math_word_problem(problem_text: str) -> ParseResponse:
     canvas_width = 800
     canvas_height = 600
     
@@ -92,14 +109,11 @@ Example 4 - DIVISION: "There are 6 stars that need to be shared equally among 3
 Return ONLY valid JSON, no other text."""
     
     try:
-        logger.info("=" * 80)
-        logger.info("📋 COMPLETE PROMPT FOR LAYOUT GENERATION (PARSING):")
-        logger.info("=" * 80)
-        logger.info(prompt)
-        logger.info("=" * 80)
-        logger.info(f"📏 Prompt length: {len(prompt)} characters")
+        log_payload(logger, "📋 Layout parsing prompt", prompt)
         logger.info("🤖 Using GPT to parse math word problem...")
-        response = client.chat.completions.create(
+        result_text = await cached_chat_completion(
+            "parse_mwp",
+            validate=_is_json_object,
             model="gpt-4o-mini",  # Using mini for faster/cheaper parsing
             messages=[
                 {"role": "system", "content": "You are a math problem parser. Extract objects, containers, and spatial relationships from word problems. Return only valid JSON."},
@@ -108,8 +122,6 @@ Return ONLY valid JSON, no other text."""
             temperature=0.3,  # Lower temperature for more consistent parsing
             response_format={"type": "json_object"}
         )
-        
-        result_text = response.choices[0].message.content
         logger.info(f"📝 GPT response: {result_text[:200]}...")
         
         parsed_data = json.loads(result_text)
@@ -342,6 +354,10 @@ Return ONLY valid JSON, no other text."""
         logger.error(f"❌ Error calling GPT: {str(e)}")
         raise
 
+def parse_math_word_problem(problem_text: str) -> ParseResponse:
+    """Synchronous adapter around parse_math_word_problem_async."""
+    return run_sync(parse_math_word_problem_async(problem_text))
+
 @router.post("/parse-mwp", response_model=ParseResponse)
 async def parse_mwp(request: ParseRequest):
     """
@@ -351,7 +367,7 @@ async def parse_mwp(request: ParseRequest):
     """
     try:
         logger.info(f"Parsing math word problem: {request.problem_text[:100]}...")
-        result = parse_math_word_problem(request.problem_text)
+        result = await parse_math_word_problem_async(request.problem_text)
         logger.info(f"Parsed successfully: {len(result.layout)} layout items")
         return result
     except Exception as e:
@@ -11,12 +11,24 @@ from app.models.tracking import (
     ALLOWED_USER_IDS
 )
 from app.services.dataset_storage_service import dataset_storage
+from app.services.image_storage_service import is_image_id, resolve_image_ref
 from datetime import datetime
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/tracking", tags=["Tracking"])
 
+def _submitted_image_url(image_url: Optional[str], image_id: Optional[str], field: str) -> str:
+    """Image URL of a submission, which may reference an uploaded image by ID instead"""
+    if image_id:
+        if not is_image_id(image_id):
+            raise HTTPException(status_code=400, detail=f"Invalid {field}_id")
+        return f"/images/{image_id}"
+    if not image_url:
+        raise HTTPException(status_code=400, detail=f"{field}_url or {field}_id is required")
+    return resolve_image_ref(image_url)
+
 @router.post("/auth", response_model=UserAuthResponse)
 async def authenticate_user(auth: UserAuthRequest, db: Session = Depends(get_db)):
     """Authenticate user and create session"""
@@ -82,6 +94,7 @@ async def end_session(request: SessionEndRequest, db: Session = Depends(get_db))
 @router.post("/tool-a/image")
 async def submit_tool_a_image(submission: ToolAImageSubmission, db: Session = Depends(get_db)):
     """Submit Tool A generated image"""
+    submission.image_url = _submitted_image_url(submission.image_url, submission.image_id, "image")
     try:
         # Save to SQLite (backward compatibility)
         image = ToolAGeneratedImage(
@@ -120,6 +133,7 @@ async def submit_tool_a_image(submission: ToolAImageSubmission, db: Session = De
 @router.post("/tool-b/layout")
 async def submit_tool_b_layout(submission: ToolBLayoutSubmission, db: Session = Depends(get_db)):
     """Submit Tool B layout screenshot"""
+    submission.screenshot_url = _submitted_image_url(submission.screenshot_url, submission.screenshot_id, "screenshot")
     try:
         # Save to SQLite (backward compatibility)
         layout = ToolBLayoutScreenshot(
@@ -154,6 +168,7 @@ async def submit_tool_b_layout(submission: ToolBLayoutSubmission, db: Session =
 @router.post("/tool-b/image")
 async def submit_tool_b_image(submission: ToolBImageSubmission, db: Session = Depends(get_db)):
     """Submit Tool B generated image"""
+    submission.image_url = _submitted_image_url(submission.image_url, submission.image_id, "image")
     try:
         # Save to SQLite (backward compatibility)
         image = ToolBGeneratedImage(
@@ -226,6 +241,7 @@ async def submit_tool_c_canvas(submission: ToolCCanvasSubmission, db: Session =
 @router.post("/tool-c/image")
 async def submit_tool_c_image(submission: ToolCImageSubmission, db: Session = Depends(get_db)):
     """Submit Tool C generated/saved image"""
+    submission.image_url = _submitted_image_url(submission.image_url, submission.image_id, "image")
     try:
         # Save to SQLite (backward compatibility)
         image = ToolCGeneratedImage(
@@ -0,0 +1,331 @@
+# backend/app/api/sse.py
+"""
+Shared Server-Sent Events streaming for the chat and image routes.
+
+Events are framed as `text/event-stream` with incrementing event IDs, and a
+heartbeat comment is sent while the upstream is quiet so proxies keep the
+connection open. The client connection is polled while waiting; when it goes
+away the upstream generator is cancelled, which closes the OpenAI stream instead
+of letting an abandoned image generation run to the end.
+
+Resumable streams (used for image generation) instead keep running when the
+client drops: their events go into a bounded replay buffer under a stream ID, and
+a reconnecting client receives everything after its Last-Event-ID.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_DISCONNECT_POLL_SECONDS = float(os.getenv("SSE_DISCONNECT_POLL_SECONDS", "1"))
+SSE_REPLAY_MAX_EVENTS = int(os.getenv("SSE_REPLAY_MAX_EVENTS", "64"))
+SSE_REPLAY_MAX_BYTES = int(os.getenv("SSE_REPLAY_MAX_BYTES", str(16 * 1024 * 1024)))
+SSE_REPLAY_TTL_SECONDS = float(os.getenv("SSE_REPLAY_TTL_SECONDS", "600"))
+# Streams kept for replay at once; the oldest finished ones are dropped first
+SSE_REPLAY_MAX_STREAMS = int(os.getenv("SSE_REPLAY_MAX_STREAMS", "32"))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # Disable response buffering in nginx
+    "X-Accel-Buffering": "no",
+}
+
+def format_sse(data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """Frame one event; the payload stays on a single `data:` line"""
+    frame = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{frame}data: {json.dumps(data)}\n\n"
+
+class SSEMetrics:
+    """Per-stream counters for duration, bytes sent and cancellations"""
+
+    def __init__(self):
+        self.streams: Dict[str, Dict[str, float]] = {}
+
+    def _stream(self, name: str) -> Dict[str, float]:
+        return self.streams.setdefault(name, {
+            "started": 0, "completed": 0, "cancelled": 0, "detached": 0, "errors": 0, "active": 0,
+            "events": 0, "bytes": 0, "total_duration": 0.0, "max_duration": 0.0
+        })
+
+    def start(self, name: str):
+        stream = self._stream(name)
+        stream["started"] += 1
+        stream["active"] += 1
+
+    def finish(self, name: str, outcome: str, duration: float, events: int, sent_bytes: int):
+        stream = self._stream(name)
+        stream["active"] -= 1
+        stream[outcome] += 1
+        stream["events"] += events
+        stream["bytes"] += sent_bytes
+        stream["total_duration"] += duration
+        stream["max_duration"] = max(stream["max_duration"], duration)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {}
+        for name, stream in self.streams.items():
+            finished = stream["completed"] + stream["cancelled"] + stream["detached"] + stream["errors"]
+            stats[name] = {
+                **stream,
+                "avg_duration": stream["total_duration"] / finished if finished else 0.0
+            }
+        return stats
+
+# Global instance
+sse_metrics = SSEMetrics()
+
+_DONE = object()
+
+async def sse_stream(request: Request, events: AsyncIterator[Dict[str, Any]], name: str) -> AsyncIterator[str]:
+    """
+    Relay event dicts from `events` as SSE frames, with heartbeats and
+    disconnect detection. The upstream runs in its own task so it can be
+    cancelled while it is waiting on OpenAI.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await queue.put(_DONE)
+
+    start_time = time.perf_counter()
+    sent_events = 0
+    sent_bytes = 0
+    outcome = "completed"
+    last_sent = time.monotonic()
+    sse_metrics.start(name)
+    producer = asyncio.create_task(pump())
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=SSE_DISCONNECT_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    outcome = "cancelled"
+                    logger.info(f"🔌 Client disconnected from {name} stream after {time.perf_counter() - start_time:.1f}s - cancelling upstream")
+                    return
+                if time.monotonic() - last_sent >= SSE_HEARTBEAT_SECONDS:
+                    last_sent = time.monotonic()
+                    sent_bytes += len(": heartbeat\n\n")
+                    yield ": heartbeat\n\n"
+                continue
+
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                outcome = "errors"
+                logger.error(f"❌ {name} stream failed: {type(item).__name__}: {item}")
+                frame = format_sse({'type': 'error', 'message': str(item)}, sent_events)
+                frame += format_sse({'type': 'done'}, sent_events + 1)
+                sent_events += 2
+            else:
+                frame = format_sse(item, sent_events)
+                sent_events += 1
+            sent_bytes += len(frame)
+            last_sent = time.monotonic()
+            yield frame
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        producer.cancel()
+        duration = time.perf_counter() - start_time
+        sse_metrics.finish(name, outcome, duration, sent_events, sent_bytes)
+        logger.debug(f"SSE {name}: {outcome} after {duration:.1f}s, {sent_events} events, {sent_bytes} bytes")
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that calls on_close however the response ends, including when
+    the client is gone before the body is iterated (and the generator never starts)"""
+
+    def __init__(self, *args, on_close: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+def sse_response(request: Request, events: AsyncIterator[Dict[str, Any]], name: str,
+                 on_close: Optional[Callable[[], None]] = None) -> StreamingResponse:
+    """StreamingResponse for an async iterator of event dicts; on_close releases work
+    started for the response (e.g. a speculative stream) once it is over"""
+    return ClosingStreamingResponse(sse_stream(request, events, name), media_type="text/event-stream",
+                                    headers=SSE_HEADERS, on_close=on_close)
+
+class ResumableStream:
+    """Events of one upstream generation, kept in a bounded buffer for replay"""
+
+    def __init__(self, stream_id: str, name: str):
+        self.stream_id = stream_id
+        self.name = name
+        self.frames: Deque[Tuple[int, str]] = deque()
+        self.size = 0
+        self.next_id = 0
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def append(self, event: Dict[str, Any]):
+        frame = format_sse(event, self.next_id)
+        self.frames.append((self.next_id, frame))
+        self.next_id += 1
+        self.size += len(frame)
+        # Drop the oldest frames (usually partial images) but always keep the newest
+        while len(self.frames) > 1 and (len(self.frames) > SSE_REPLAY_MAX_EVENTS or self.size > SSE_REPLAY_MAX_BYTES):
+            self.size -= len(self.frames.popleft()[1])
+        self._notify()
+
+    def finish(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def frames_after(self, last_event_id: int) -> List[Tuple[int, str]]:
+        return [(event_id, frame) for event_id, frame in self.frames if event_id > last_event_id]
+
+    async def wait_for_change(self, cursor: int, timeout: float) -> bool:
+        """Wait until there are frames after cursor or the stream finished. Frames appended
+        while the caller was yielding count too, so they don't wait for the timeout."""
+        if self.done or self.next_id - 1 > cursor:
+            return True
+        changed = self._changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+class StreamRegistry:
+    """Running and recently finished resumable streams by stream ID"""
+
+    def __init__(self):
+        self.streams: Dict[str, ResumableStream] = {}
+        self.resumed = 0
+        self.evicted = 0
+
+    def _expire(self):
+        now = time.monotonic()
+        for stream_id, stream in list(self.streams.items()):
+            if stream.done and now - stream.finished_at > SSE_REPLAY_TTL_SECONDS:
+                del self.streams[stream_id]
+
+    def _make_room(self):
+        """Keep at most SSE_REPLAY_MAX_STREAMS - 1 streams before adding one: the oldest
+        finished go first, then the oldest running (which keep running, but can't be resumed)"""
+        excess = len(self.streams) - max(0, SSE_REPLAY_MAX_STREAMS - 1)
+        if excess <= 0:
+            return
+        finished = sorted((s for s in self.streams.values() if s.done), key=lambda s: s.finished_at)
+        running = [s for s in self.streams.values() if not s.done]  # in start order
+        for stream in (finished + running)[:excess]:
+            del self.streams[stream.stream_id]
+            self.evicted += 1
+            if not stream.done:
+                logger.warning(f"⚠️ Too many resumable streams - {stream.name} stream {stream.stream_id} "
+                               f"can no longer be resumed")
+
+    def start(self, events: AsyncIterator[Dict[str, Any]], name: str) -> ResumableStream:
+        """Run `events` to completion in the background, independent of any client"""
+        self._expire()
+        self._make_room()
+        stream = ResumableStream(uuid.uuid4().hex, name)
+        stream.append({'type': 'stream', 'stream_id': stream.stream_id})
+
+        async def pump():
+            try:
+                async for event in events:
+                    stream.append(event)
+            except Exception as e:
+                logger.error(f"❌ {name} stream {stream.stream_id} failed: {type(e).__name__}: {e}")
+                stream.append({'type': 'error', 'message': str(e)})
+                stream.append({'type': 'done'})
+            finally:
+                stream.finish()
+
+        stream.task = asyncio.create_task(pump())
+        self.streams[stream.stream_id] = stream
+        return stream
+
+    def get(self, stream_id: str) -> Optional[ResumableStream]:
+        self._expire()
+        return self.streams.get(stream_id)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "streams": len(self.streams),
+            "running": sum(1 for s in self.streams.values() if not s.done),
+            "buffered_bytes": sum(s.size for s in self.streams.values()),
+            "resumed": self.resumed,
+            "evicted": self.evicted
+        }
+
+# Global instance
+stream_registry = StreamRegistry()
+
+async def resumable_sse_stream(request: Request, stream: ResumableStream, last_event_id: int = -1) -> AsyncIterator[str]:
+    """Replay buffered frames after last_event_id, then follow the stream live.
+    A disconnect only detaches this client; the generation keeps running.
+    """
+    name = stream.name
+    start_time = time.perf_counter()
+    sent_events = 0
+    sent_bytes = 0
+    outcome = "completed"
+    last_sent = time.monotonic()
+    cursor = last_event_id
+    sse_metrics.start(name)
+    try:
+        while True:
+            for event_id, frame in stream.frames_after(cursor):
+                cursor = event_id
+                sent_events += 1
+                sent_bytes += len(frame)
+                last_sent = time.monotonic()
+                yield frame
+            if stream.done and cursor >= stream.next_id - 1:
+                return
+            if await stream.wait_for_change(cursor, SSE_DISCONNECT_POLL_SECONDS):
+                continue
+            if await request.is_disconnected():
+                outcome = "detached"
+                logger.info(f"🔌 Client detached from {name} stream {stream.stream_id} - generation continues")
+                return
+            if time.monotonic() - last_sent >= SSE_HEARTBEAT_SECONDS:
+                last_sent = time.monotonic()
+                sent_bytes += len(": heartbeat\n\n")
+                yield ": heartbeat\n\n"
+    except asyncio.CancelledError:
+        outcome = "detached"
+        raise
+    finally:
+        duration = time.perf_counter() - start_time
+        sse_metrics.finish(name, outcome, duration, sent_events, sent_bytes)
+
+def resumable_sse_response(request: Request, stream: ResumableStream, last_event_id: int = -1) -> StreamingResponse:
+    """StreamingResponse following a resumable stream from last_event_id"""
+    headers = {**SSE_HEADERS, "X-Stream-ID": stream.stream_id}
+    return StreamingResponse(resumable_sse_stream(request, stream, last_event_id), media_type="text/event-stream", headers=headers)
@@ -0,0 +1,61 @@
+# backend/app/api/tracing.py
+"""
+Tracing middleware: gives every HTTP request a trace and times it per route.
+
+The request ID comes from the client's X-Request-ID header when present (so the
+frontend can correlate its own logs) and is echoed back on the response. Requests
+are timed until the last body chunk, so streamed responses count in full.
+"""
+import re
+import uuid
+
+from app.tracing import Trace, finish_trace, trace_scope
+
+REQUEST_ID_HEADER = b"x-request-id"
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+# Label for requests that matched no API route (static files, 404s), to keep label cardinality bounded
+UNMATCHED_ROUTE = "<unmatched>"
+
+def _request_id(scope) -> str:
+    for name, value in scope.get("headers", []):
+        if name == REQUEST_ID_HEADER:
+            candidate = value.decode("latin-1")
+            if _VALID_REQUEST_ID.match(candidate):
+                return candidate
+            break
+    return uuid.uuid4().hex
+
+def _route_template(scope) -> str:
+    # FastAPI stores the matched route in the (shared) scope during routing
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+class TracingMiddleware:
+    """ASGI middleware that runs each HTTP request under a trace and records its latency"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(_request_id(scope), scope["method"], scope["path"])
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((REQUEST_ID_HEADER, trace.request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with trace_scope(trace):
+            try:
+                await self.app(scope, receive, send_with_request_id)
+            finally:
+                finish_trace(trace, _route_template(scope), status)
@@ -0,0 +1,122 @@
+# backend/app/api/uploads.py
+"""
+Streaming multipart parser for image uploads.
+
+Starlette's request.form() buffers every file (in memory, then a spooled temp file)
+before the handler runs. receive_image_upload() instead feeds the request body
+through python-multipart as it arrives and writes the "file" part straight into an
+ImageWriter, which hashes it incrementally and moves it to its content-addressed
+name once the body is complete.
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from app.services.image_storage_service import ImageTooLargeError, ImageUploadError, ImageWriter
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_FIELD = b"file"
+# Part data is batched up to this size before each (threaded) disk write
+UPLOAD_WRITE_CHUNK_BYTES = int(os.getenv("UPLOAD_WRITE_CHUNK_BYTES", str(256 * 1024)))
+# Allowance for the multipart framing on top of IMAGE_UPLOAD_MAX_BYTES when checking Content-Length
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+class _FilePartCollector:
+    """python-multipart callbacks that pick out the data of the first file part named UPLOAD_FIELD"""
+
+    def __init__(self):
+        self.pending: List[bytes] = []
+        self.pending_bytes = 0
+        self.found = False
+        self.finished = False
+        self._active = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._field = bytearray()
+        self._value = bytearray()
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": lambda data, start, end: self._field.extend(data[start:end]),
+            "on_header_value": lambda data, start, end: self._value.extend(data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_end(self):
+        self._headers[bytes(self._field).lower()] = bytes(self._value)
+        self._field.clear()
+        self._value.clear()
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if not self.found and options.get(b"name") == UPLOAD_FIELD and b"filename" in options:
+            self.found = self._active = True
+
+    def _on_part_data(self, data, start, end):
+        if self._active:
+            self.pending.append(data[start:end])
+            self.pending_bytes += end - start
+
+    def _on_part_end(self):
+        if self._active:
+            self._active = False
+            self.finished = True
+
+    def take(self) -> bytes:
+        chunk = b"".join(self.pending)
+        self.pending.clear()
+        self.pending_bytes = 0
+        return chunk
+
+def _boundary(request: Request) -> bytes:
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise ImageUploadError("Expected a multipart/form-data body with a 'file' field")
+    return options[b"boundary"]
+
+async def receive_image_upload(request: Request, writer: Optional[ImageWriter] = None) -> Tuple[str, int]:
+    """Stream the request's 'file' part into the image store; returns (image_id, size)"""
+    boundary = _boundary(request)
+    writer = writer or ImageWriter()
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and \
+            int(content_length) > writer.max_bytes + _MULTIPART_OVERHEAD_BYTES:
+        writer.abort()
+        raise ImageTooLargeError(f"Image exceeds the {writer.max_bytes} byte upload limit")
+
+    collector = _FilePartCollector()
+    parser = MultipartParser(boundary, collector.callbacks())
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except Exception as e:
+                raise ImageUploadError(f"Malformed multipart body: {e}")
+            if collector.pending_bytes >= UPLOAD_WRITE_CHUNK_BYTES or (collector.finished and collector.pending):
+                await asyncio.to_thread(writer.write, collector.take())
+            if collector.finished:
+                # The rest of the body (other fields, closing boundary) isn't needed
+                break
+        if not collector.finished:
+            raise ImageUploadError("No complete 'file' part in the upload")
+        image_id = await asyncio.to_thread(writer.commit)
+    except BaseException:
+        writer.abort()
+        raise
+    logger.info(f"📤 Upload stored as {image_id} ({writer.size} bytes)")
+    return image_id, writer.size
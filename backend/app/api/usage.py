@@ -0,0 +1,48 @@
+# backend/app/api/usage.py
+"""
+Attributes each HTTP request's OpenAI calls to a participant and a study tool.
+
+The user comes from the X-User-ID header (handlers that receive a user_id in the
+body refine it with set_usage_user). The tool comes from the X-Tool header (A, B
+or C), or otherwise from the route: Tool A is the chat interface, Tool B parses
+problems and generates layout images, Tool C generates manipulatives.
+"""
+from app.clients.usage_tracker import TOOLS, usage_scope
+
+USER_ID_HEADER = b"x-user-id"
+TOOL_HEADER = b"x-tool"
+
+TOOL_BY_PATH_PREFIX = (
+    ("/chat", "A"),
+    ("/image", "B"),
+    ("/parse", "B"),
+    ("/manipulatives", "C"),
+)
+
+def _tool_for_path(path: str):
+    for prefix, tool in TOOL_BY_PATH_PREFIX:
+        if path == prefix or path.startswith(prefix + "/"):
+            return tool
+    return None
+
+class UsageContextMiddleware:
+    """ASGI middleware that runs each HTTP request under a usage context (user, tool)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        user_id = None
+        tool = None
+        for name, value in scope.get("headers", []):
+            if name == USER_ID_HEADER:
+                user_id = value.decode("latin-1").strip()[:128] or None
+            elif name == TOOL_HEADER:
+                tool = value.decode("latin-1").strip().upper()
+        if tool not in TOOLS:
+            tool = _tool_for_path(scope["path"])
+        with usage_scope(user_id, tool):
+            await self.app(scope, receive, send)
@@ -0,0 +1,472 @@
+# backend/app/clients/image_scheduler.py
+"""
+Fair-share scheduler for OpenAI image calls.
+
+All study participants share one org rate limit for gpt-image, so every
+images.generate / images.edit call goes through this scheduler instead of hitting
+the client directly. Waiting calls are served by priority class first
+(interactive edit > generation > background), and within a class round-robin across
+users, preferring the user with the fewest calls in flight. A token bucket paces
+call starts and follows the x-ratelimit-* and Retry-After headers OpenAI returns.
+Per-user wait times are kept as histograms for /image/scheduler/stats.
+
+State is guarded by a thread lock so async callers on any event loop and sync
+callers in worker threads share the same queues.
+"""
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from app.clients.openai_client import async_client, client
+from app.clients.retry_policy import IMAGE_POLICY, call_with_retry, call_with_retry_sync, retry_after_seconds
+from app.clients.usage_tracker import usage_tracker
+from app.tracing import span
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SCHEDULER_MAX_CONCURRENT = int(os.getenv("IMAGE_SCHEDULER_MAX_CONCURRENT", "8"))
+IMAGE_SCHEDULER_RPM = float(os.getenv("IMAGE_SCHEDULER_RPM", "50"))
+IMAGE_SCHEDULER_BURST = float(os.getenv("IMAGE_SCHEDULER_BURST", "5"))
+
+# Priority classes, highest first
+PRIORITY_INTERACTIVE_EDIT = "interactive_edit"
+PRIORITY_GENERATION = "generation"
+PRIORITY_BACKGROUND = "background"
+PRIORITIES = (PRIORITY_INTERACTIVE_EDIT, PRIORITY_GENERATION, PRIORITY_BACKGROUND)
+
+ANONYMOUS_USER = "anonymous"
+
+# Upper bounds (seconds) of the wait-time histogram buckets; the last bucket is open
+WAIT_BUCKETS = (0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset durations like '1s', '6m0s' or '20ms' (or plain seconds)"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+def _rewind_files(kwargs: Dict[str, Any]):
+    """Retries upload the image/mask again, so start reading them from the top"""
+    for value in kwargs.values():
+        if hasattr(value, "seek"):
+            value.seek(0)
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+class _Ticket:
+    """One call waiting for (or holding) a scheduler slot"""
+
+    def __init__(self, user_key: str, priority: str):
+        self.user_key = user_key
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.released = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+        self.event: Optional[threading.Event] = None
+
+    def wake(self):
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        else:
+            self.event.set()
+
+class _WaitHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(WAIT_BUCKETS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        index = next((i for i, bound in enumerate(WAIT_BUCKETS) if seconds <= bound), len(WAIT_BUCKETS))
+        self.counts[index] += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        count = sum(self.counts)
+        labels = [str(bound) for bound in WAIT_BUCKETS] + ["+Inf"]
+        return {
+            "count": count,
+            "wait_seconds_avg": self.total / count if count else 0.0,
+            "wait_seconds_max": self.max,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+class _ScheduledStream:
+    """Async image stream that gives its slot back once it completes, fails or is closed"""
+
+    def __init__(self, stream, release: Callable[..., None]):
+        self._stream = stream
+        self._iterator = stream.__aiter__()
+        self._release = release
+
+    def _done(self, event=None, failed: bool = False):
+        release, self._release = self._release, None
+        if release is not None:
+            release(event, failed)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            event = await self._iterator.__anext__()
+        except StopAsyncIteration:
+            self._done()
+            raise
+        except BaseException as e:
+            self._done(failed=isinstance(e, Exception))
+            raise
+        # Callers stop reading at the completed event, so free the slot right there
+        if str(getattr(event, 'type', '')).endswith('.completed'):
+            self._done(event)
+        return event
+
+    async def close(self):
+        self._done()
+        await self._stream.close()
+
+    def __del__(self):
+        self._done()
+
+class _ScheduledSyncStream:
+    """Sync counterpart of _ScheduledStream"""
+
+    def __init__(self, stream, release: Callable[..., None]):
+        self._stream = stream
+        self._iterator = iter(stream)
+        self._release = release
+
+    def _done(self, event=None, failed: bool = False):
+        release, self._release = self._release, None
+        if release is not None:
+            release(event, failed)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            event = next(self._iterator)
+        except StopIteration:
+            self._done()
+            raise
+        except BaseException as e:
+            self._done(failed=isinstance(e, Exception))
+            raise
+        if str(getattr(event, 'type', '')).endswith('.completed'):
+            self._done(event)
+        return event
+
+    def close(self):
+        self._done()
+        self._stream.close()
+
+    def __del__(self):
+        self._done()
+
+class ImageCallScheduler:
+    """Priority classes, per-user fair queuing and a header-driven token bucket"""
+
+    def __init__(self, max_concurrent: int, requests_per_minute: float, burst: float):
+        self.max_concurrent = max_concurrent
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self._refilled_at = time.monotonic()
+        self.blocked_until = 0.0
+        # RLock: streams may release their slot from __del__ while the lock is held
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        self._timer_due = 0.0
+        # priority -> user -> waiting tickets
+        self._queues: Dict[str, Dict[str, Deque[_Ticket]]] = {p: {} for p in PRIORITIES}
+        # Round-robin order: sequence number of each user's last granted call
+        self._served = 0
+        self._served_at: Dict[str, int] = {}
+        self.in_flight = 0
+        self._in_flight_by_user: Dict[str, int] = {}
+        self.wait_histograms: Dict[str, _WaitHistogram] = {}
+        self.granted = {p: 0 for p in PRIORITIES}
+        self.counters = {"rate_limited": 0, "cancelled": 0, "errors": 0}
+
+    # --- queueing ---
+
+    def _enqueue(self, ticket: _Ticket):
+        with self._lock:
+            queue = self._queues[ticket.priority]
+            queue.setdefault(ticket.user_key, deque()).append(ticket)
+            self._dispatch()
+
+    def _has_waiting(self) -> bool:
+        return any(self._queues[p] for p in PRIORITIES)
+
+    def _pick(self) -> _Ticket:
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            if not queue:
+                continue
+            # Fewest calls in flight wins; ties go to whoever was served longest ago
+            user_key = min(queue, key=lambda key: (self._in_flight_by_user.get(key, 0), self._served_at.get(key, -1)))
+            tickets = queue[user_key]
+            ticket = tickets.popleft()
+            if not tickets:
+                del queue[user_key]
+            self._served += 1
+            self._served_at[user_key] = self._served
+            return ticket
+        raise LookupError("No waiting image calls")
+
+    def _take_token(self) -> float:
+        """Take a token and return 0, or return how long to wait for the next one"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate if self.rate > 0 else 1.0
+
+    def _dispatch(self):
+        while self.in_flight < self.max_concurrent and self._has_waiting():
+            wait = self._take_token()
+            if wait > 0:
+                self._schedule_dispatch(wait)
+                return
+            ticket = self._pick()
+            ticket.granted = True
+            self.in_flight += 1
+            self._in_flight_by_user[ticket.user_key] = self._in_flight_by_user.get(ticket.user_key, 0) + 1
+            self.granted[ticket.priority] += 1
+            waited = time.monotonic() - ticket.enqueued_at
+            self.wait_histograms.setdefault(ticket.user_key, _WaitHistogram()).observe(waited)
+            if waited > 1.0:
+                logger.info(f"🚦 Image call for {ticket.user_key} ({ticket.priority}) waited {waited:.1f}s")
+            ticket.wake()
+
+    def _schedule_dispatch(self, wait: float):
+        due = time.monotonic() + wait
+        if self._timer is not None and self._timer_due <= due:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(wait, self._on_timer)
+        self._timer.daemon = True
+        self._timer_due = due
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _release(self, ticket: _Ticket):
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self.in_flight -= 1
+            remaining = self._in_flight_by_user[ticket.user_key] - 1
+            if remaining:
+                self._in_flight_by_user[ticket.user_key] = remaining
+            else:
+                del self._in_flight_by_user[ticket.user_key]
+            self._dispatch()
+
+    def _abandon(self, ticket: _Ticket):
+        """The caller gave up waiting: leave the queue, or free the slot if it was just granted"""
+        with self._lock:
+            self.counters["cancelled"] += 1
+            if ticket.granted:
+                self._release(ticket)
+                return
+            queue = self._queues[ticket.priority]
+            tickets = queue.get(ticket.user_key)
+            if tickets is not None and ticket in tickets:
+                tickets.remove(ticket)
+                if not tickets:
+                    del queue[ticket.user_key]
+
+    async def acquire(self, user_id: Optional[str], priority: str) -> _Ticket:
+        """Wait for this user's turn; pair with release()"""
+        ticket = _Ticket(user_id or ANONYMOUS_USER, priority)
+        ticket.loop = asyncio.get_running_loop()
+        ticket.future = ticket.loop.create_future()
+        self._enqueue(ticket)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            self._abandon(ticket)
+            raise
+        return ticket
+
+    def acquire_sync(self, user_id: Optional[str], priority: str) -> _Ticket:
+        """Blocking acquire() for sync callers running in worker threads"""
+        ticket = _Ticket(user_id or ANONYMOUS_USER, priority)
+        ticket.event = threading.Event()
+        self._enqueue(ticket)
+        try:
+            ticket.event.wait()
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: _Ticket):
+        self._release(ticket)
+
+    def _call_finisher(self, ticket: _Ticket, method: str, user_id: Optional[str],
+                       kwargs: Dict[str, Any]) -> Callable[..., None]:
+        """Release the slot and record the call's latency and usage (streams: until they end)"""
+        recorder = usage_tracker.call_recorder(
+            f"images.{method}", model=kwargs.get("model"), image_size=kwargs.get("size"), user_id=user_id
+        )
+
+        def finish(result=None, failed: bool = False):
+            self.release(ticket)
+            recorder.finish(result, failed)
+        return finish
+
+    # --- rate limit feedback ---
+
+    def observe_headers(self, headers):
+        """Align the bucket with x-ratelimit-*-requests headers of a response"""
+        if headers is None:
+            return
+        limit = headers.get("x-ratelimit-limit-requests")
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        reset = parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+        with self._lock:
+            try:
+                if limit is not None and float(limit) > 0:
+                    self.rate = float(limit) / 60.0
+                if remaining is not None:
+                    remaining = float(remaining)
+                    self.tokens = min(self.tokens, remaining)
+                    if remaining < 1 and reset:
+                        self.blocked_until = max(self.blocked_until, time.monotonic() + reset)
+            except ValueError:
+                logger.warning(f"⚠️ Unparseable rate limit headers: limit={limit} remaining={remaining}")
+
+    def observe_error(self, error: BaseException):
+        """Back off the whole bucket after a 429, for as long as Retry-After asks"""
+        if getattr(error, "status_code", None) != 429:
+            if isinstance(error, Exception):
+                self.counters["errors"] += 1
+            return
+        response = getattr(error, "response", None)
+        headers = response.headers if response is not None else {}
+        backoff = (
+            retry_after_seconds(error)
+            or parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+            or 1.0
+        )
+        with self._lock:
+            self.counters["rate_limited"] += 1
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + backoff)
+        logger.warning(f"🚦 Image calls rate limited, pausing for {backoff:.1f}s")
+
+    # --- scheduled calls ---
+
+    async def call(self, method: str, user_id: Optional[str] = None,
+                   priority: str = PRIORITY_GENERATION, **kwargs):
+        """Run async_client.images.<method>(**kwargs) once the scheduler lets it start.
+        Failed calls are retried under the image retry policy, waiting in the queue again.
+        Streams hold their slot until they complete or are closed.
+        """
+        return await call_with_retry(
+            lambda: self._call_once(method, user_id, priority, kwargs),
+            f"images.{method}",
+            upstream="images",
+            policy=IMAGE_POLICY,
+            # Timed per attempt in _call_once, without the time spent queued
+            record_call=False
+        )
+
+    async def _call_once(self, method: str, user_id: Optional[str], priority: str, kwargs: Dict[str, Any]):
+        with span("image_queue", priority):
+            ticket = await self.acquire(user_id, priority)
+        finish = self._call_finisher(ticket, method, user_id, kwargs)
+        try:
+            _rewind_files(kwargs)
+            raw = await getattr(async_client.images.with_raw_response, method)(**kwargs)
+        except BaseException as e:
+            self.observe_error(e)
+            finish(failed=isinstance(e, Exception))
+            raise
+        self.observe_headers(raw.headers)
+        result = raw.parse()
+        if kwargs.get("stream"):
+            return _ScheduledStream(result, finish)
+        finish(result)
+        return result
+
+    def call_sync(self, method: str, user_id: Optional[str] = None,
+                  priority: str = PRIORITY_GENERATION, **kwargs):
+        """Sync counterpart of call() on the blocking client"""
+        return call_with_retry_sync(
+            lambda: self._call_once_sync(method, user_id, priority, kwargs),
+            f"images.{method}",
+            upstream="images",
+            policy=IMAGE_POLICY,
+            # Timed per attempt in _call_once, without the time spent queued
+            record_call=False
+        )
+
+    def _call_once_sync(self, method: str, user_id: Optional[str], priority: str, kwargs: Dict[str, Any]):
+        with span("image_queue", priority):
+            ticket = self.acquire_sync(user_id, priority)
+        finish = self._call_finisher(ticket, method, user_id, kwargs)
+        try:
+            _rewind_files(kwargs)
+            raw = getattr(client.images.with_raw_response, method)(**kwargs)
+        except BaseException as e:
+            self.observe_error(e)
+            finish(failed=isinstance(e, Exception))
+            raise
+        self.observe_headers(raw.headers)
+        result = raw.parse()
+        if kwargs.get("stream"):
+            return _ScheduledSyncStream(result, finish)
+        finish(result)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrent": self.max_concurrent,
+                "waiting": {p: sum(len(t) for t in self._queues[p].values()) for p in PRIORITIES},
+                "granted": dict(self.granted),
+                **self.counters,
+                "requests_per_minute": self.rate * 60.0,
+                "tokens": min(self.capacity, self.tokens + (now - self._refilled_at) * self.rate),
+                "blocked_for_seconds": max(0.0, self.blocked_until - now),
+                "users": {user: histogram.to_dict() for user, histogram in self.wait_histograms.items()},
+            }
+
+# Global instance
+image_scheduler = ImageCallScheduler(IMAGE_SCHEDULER_MAX_CONCURRENT, IMAGE_SCHEDULER_RPM, IMAGE_SCHEDULER_BURST)
@@ -0,0 +1,208 @@
+# backend/app/clients/llm_cache.py
+"""
+Disk-backed cache for deterministic LLM calls.
+
+Study problems are parsed over and over with identical prompts, so responses of
+low-temperature calls are stored in a small SQLite file keyed on model, a
+normalized hash of the messages and the sampling parameters. Entries expire after
+a TTL and the least recently used ones are evicted once the size limit is hit.
+Call sites opt in by name (see LLM_CACHE_CALL_SITES).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.clients.openai_client import async_client
+from app.clients.retry_policy import call_with_retry
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", str(BACKEND_DIR / "llm_cache.db"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+# Call sites that are allowed to use the cache (comma separated)
+LLM_CACHE_CALL_SITES = {
+    site.strip()
+    for site in os.getenv("LLM_CACHE_CALL_SITES", "intent,parse_mwp,visual_language").split(",")
+    if site.strip()
+}
+
+def _normalize_content(content: Any) -> Any:
+    """Collapse whitespace in message text so formatting noise doesn't split keys."""
+    if isinstance(content, str):
+        return " ".join(content.split())
+    if isinstance(content, list):
+        return [_normalize_content(part) for part in content]
+    if isinstance(content, dict):
+        return {key: _normalize_content(value) for key, value in content.items()}
+    return content
+
+def make_cache_key(model: str, messages: list, params: Dict[str, Any]) -> str:
+    """Build the cache key from model, normalized messages and sampling params."""
+    messages_hash = hashlib.sha256(
+        json.dumps(_normalize_content(messages), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    payload = json.dumps(
+        {"model": model, "messages": messages_hash, "params": params},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """SQLite-backed LLM response cache with TTL, LRU eviction and hit/miss counters"""
+
+    def __init__(self, path: str, ttl_seconds: int, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Counters per call site: {call_site: {"hits": n, "misses": n}}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    call_site TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _count(self, call_site: str, field: str):
+        site_stats = self.stats.setdefault(call_site, {"hits": 0, "misses": 0})
+        site_stats[field] += 1
+
+    def get(self, key: str, call_site: str) -> Optional[str]:
+        """Return cached response text, or None on a miss or an expired entry"""
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            row = conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                conn.commit()
+                self._count(call_site, "hits")
+                return row[0]
+            if row:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                conn.commit()
+            self._count(call_site, "misses")
+            return None
+
+    def set(self, key: str, call_site: str, model: str, response: str):
+        """Store a response and evict least recently used entries beyond the size limit"""
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, call_site, model, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, call_site, model, response, now, now)
+            )
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            conn.commit()
+
+    def clear(self):
+        """Remove all cached entries"""
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters per call site plus the number of stored entries"""
+        with self._lock:
+            entries = self._get_conn().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        hits = sum(s["hits"] for s in self.stats.values())
+        misses = sum(s["misses"] for s in self.stats.values())
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "call_sites": {site: dict(counts) for site, counts in self.stats.items()}
+        }
+
+# Global instance
+llm_cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES)
+
+def is_cache_enabled(call_site: str) -> bool:
+    return LLM_CACHE_ENABLED and call_site in LLM_CACHE_CALL_SITES
+
+async def cached_chat_completion(
+    call_site: str,
+    validate: Optional[Callable[[str], bool]] = None,
+    hedge_after: Optional[float] = None,
+    **params
+) -> str:
+    """
+    Create a (non-streaming) chat completion through the cache and return the message text.
+    Only responses that pass `validate` are stored, so malformed output is never replayed.
+    Misses go through the retry policy; hedge_after hedges short calls.
+    """
+    content, _ = await cached_chat_completion_with_status(call_site, validate, hedge_after, **params)
+    return content
+
+async def cached_chat_completion_with_status(
+    call_site: str,
+    validate: Optional[Callable[[str], bool]] = None,
+    hedge_after: Optional[float] = None,
+    **params
+) -> Tuple[str, bool]:
+    """Like cached_chat_completion, but also returns whether the text came from the cache"""
+    model = params.get("model", "")
+    messages = params.get("messages", [])
+
+    key = None
+    if is_cache_enabled(call_site):
+        sampling_params = {k: v for k, v in params.items() if k not in ("model", "messages")}
+        key = make_cache_key(model, messages, sampling_params)
+        try:
+            cached = await asyncio.to_thread(llm_cache.get, key, call_site)
+        except Exception as e:
+            logger.warning(f"⚠️ LLM cache lookup failed for {call_site}: {e}")
+            cached = None
+        if cached is not None:
+            logger.info(f"📦 LLM cache hit for {call_site}")
+            return cached, True
+
+    response = await call_with_retry(
+        lambda: async_client.chat.completions.create(**params),
+        call_site,
+        hedge_after=hedge_after
+    )
+    content = response.choices[0].message.content or ""
+
+    if key is not None and content and (validate is None or validate(content)):
+        try:
+            await asyncio.to_thread(llm_cache.set, key, call_site, model, content)
+        except Exception as e:
+            logger.warning(f"⚠️ LLM cache store failed for {call_site}: {e}")
+    return content, False
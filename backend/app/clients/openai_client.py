@@ -1,5 +1,11 @@
 # backend/app/clients/openai_client.py
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from app.tracing import observe_openai
+import asyncio
+import threading
+import time
+import weakref
+import httpx
 import os
 
 # Don't call load_dotenv() here - let main.py handle it
@@ -11,31 +17,126 @@ import os
 _client_instance = None
 _dotenv_loaded = False
 
+# Async clients are bound to the event loop their connection pool was created on,
+# so we keep one shared client (and pool) per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+# Shared connection pool limits for the async client
+ASYNC_POOL_MAX_CONNECTIONS = int(os.getenv("OPENAI_POOL_MAX_CONNECTIONS", "50"))
+ASYNC_POOL_MAX_KEEPALIVE = int(os.getenv("OPENAI_POOL_MAX_KEEPALIVE", "20"))
+
+def _load_env():
+    """Load backend/.env once, the first time a client is created."""
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+        # Only check backend/.env file, don't scan directories
+        backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        env_path = os.path.join(backend_dir, '.env')
+        if os.path.exists(env_path):
+            load_dotenv(dotenv_path=env_path, override=False)
+        _dotenv_loaded = True
+
+def _client_settings():
+    """API key and base URL; OPENAI_BASE_URL points the clients at a stand-in server
+    (see scripts/openai_standin.py), which doesn't need a real key."""
+    base_url = os.getenv("OPENAI_BASE_URL") or None
+    api_key = os.getenv("OPENAI_API_KEY") or ("standin" if base_url else None)
+    return api_key, base_url
+
+# Time to first byte: the response hook fires once headers arrive, before the body is read
+_SENT_AT = "visual4math_sent_at"
+
+def _mark_sent(request: httpx.Request):
+    request.extensions[_SENT_AT] = time.perf_counter()
+
+def _record_first_byte(response: httpx.Response):
+    sent_at = response.request.extensions.get(_SENT_AT)
+    if sent_at is not None:
+        observe_openai("first_byte", time.perf_counter() - sent_at)
+
+async def _mark_sent_async(request: httpx.Request):
+    _mark_sent(request)
+
+async def _record_first_byte_async(response: httpx.Response):
+    _record_first_byte(response)
+
 def get_client():
     """Get OpenAI client instance (lazy initialization)."""
-    global _client_instance, _dotenv_loaded
-    
+    global _client_instance
+
     if _client_instance is None:
         # Load .env file only when client is first accessed (lazy loading)
-        if not _dotenv_loaded:
-            from dotenv import load_dotenv
-            # Only check backend/.env file, don't scan directories
-            backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-            env_path = os.path.join(backend_dir, '.env')
-            if os.path.exists(env_path):
-                load_dotenv(dotenv_path=env_path, override=False)
-            _dotenv_loaded = True
-        
-        api_key = os.getenv("OPENAI_API_KEY")
-        _client_instance = OpenAI(api_key=api_key)
+        _load_env()
+        api_key, base_url = _client_settings()
+        # Retries are handled by app.clients.retry_policy
+        http_client = DefaultHttpxClient(
+            event_hooks={"request": [_mark_sent], "response": [_record_first_byte]}
+        )
+        _client_instance = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
     return _client_instance
 
+def get_async_client():
+    """Get the AsyncOpenAI client for the running event loop (lazy initialization)."""
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        _load_env()
+        api_key, base_url = _client_settings()
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=ASYNC_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=ASYNC_POOL_MAX_KEEPALIVE
+            ),
+            event_hooks={"request": [_mark_sent_async], "response": [_record_first_byte_async]}
+        )
+        async_client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+        _async_clients[loop] = async_client
+    return async_client
+
 # For backward compatibility, create a property-like accessor
 class ClientProxy:
     """Proxy object that lazily initializes the OpenAI client."""
     def __getattr__(self, name):
         return getattr(get_client(), name)
 
+class AsyncClientProxy:
+    """Proxy object that resolves the AsyncOpenAI client of the running event loop."""
+    def __getattr__(self, name):
+        return getattr(get_async_client(), name)
+
 # Create proxy instance that looks like the old 'client' variable
 client = ClientProxy()
+async_client = AsyncClientProxy()
+
+# Sync adapter: sync callers run coroutines on a dedicated background loop,
+# so they work both from plain threads and from inside a running event loop
+_bridge_loop = None
+_bridge_lock = threading.Lock()
+
+def _get_bridge_loop():
+    global _bridge_loop
+    with _bridge_lock:
+        if _bridge_loop is None:
+            _bridge_loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_bridge_loop.run_forever, name="openai-sync-bridge", daemon=True)
+            thread.start()
+    return _bridge_loop
+
+def run_sync(coro):
+    """Run a coroutine to completion from synchronous code and return its result."""
+    future = asyncio.run_coroutine_threadsafe(coro, _get_bridge_loop())
+    return future.result()
 
+def iterate_sync(async_gen):
+    """Expose an async generator as a regular (blocking) generator."""
+    loop = _get_bridge_loop()
+    try:
+        while True:
+            try:
+                item = asyncio.run_coroutine_threadsafe(async_gen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        asyncio.run_coroutine_threadsafe(async_gen.aclose(), loop).result()
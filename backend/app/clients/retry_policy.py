@@ -0,0 +1,398 @@
+# backend/app/clients/retry_policy.py
+"""
+Central retry, deadline and circuit breaker policy for OpenAI calls.
+
+Every OpenAI call site goes through call_with_retry (or call_with_retry_sync):
+- transient failures (429, 408/409, 5xx, connection errors) are retried with
+  exponential backoff and full jitter, waiting at least as long as Retry-After asks
+- a per-request deadline (set by RequestDeadlineMiddleware via deadline_scope) bounds
+  every attempt and every backoff sleep, so retries never outlive the HTTP request
+- a circuit breaker per upstream ("chat", "images") fails fast after repeated
+  upstream failures, and lets a single probe through once the cooldown has passed
+- short text calls can be hedged: if the first attempt is slow, a duplicate is
+  started and whichever answers first wins
+
+The OpenAI clients are created with max_retries=0 so retries only happen here.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import openai
+
+from app.clients.usage_tracker import usage_tracker
+from app.tracing import observe_openai, openai_call_scope
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+OPENAI_RETRY_MAX_ATTEMPTS = int(os.getenv("OPENAI_RETRY_MAX_ATTEMPTS", "4"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "20"))
+OPENAI_IMAGE_RETRY_MAX_ATTEMPTS = int(os.getenv("OPENAI_IMAGE_RETRY_MAX_ATTEMPTS", "2"))
+OPENAI_HEDGE_AFTER_SECONDS = float(os.getenv("OPENAI_HEDGE_AFTER_SECONDS", "2.0"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before the OpenAI call could finish"""
+
+class CircuitOpenError(Exception):
+    """The upstream is considered degraded; the call was rejected without trying"""
+
+class RetryPolicy:
+    """How often and how patiently a call site retries"""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff, never shorter than Retry-After"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+DEFAULT_POLICY = RetryPolicy(OPENAI_RETRY_MAX_ATTEMPTS, OPENAI_RETRY_BASE_DELAY, OPENAI_RETRY_MAX_DELAY)
+IMAGE_POLICY = RetryPolicy(OPENAI_IMAGE_RETRY_MAX_ATTEMPTS, OPENAI_RETRY_BASE_DELAY, OPENAI_RETRY_MAX_DELAY)
+
+# --- deadlines ---
+
+# Absolute time.monotonic() deadline of the current request, if any
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("openai_deadline", default=None)
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """Run the block with a deadline `seconds` from now (None removes the deadline).
+    A nested scope can only shorten the deadline of the enclosing one.
+    """
+    if seconds is None:
+        token = _deadline.set(None)
+    else:
+        deadline = time.monotonic() + seconds
+        current = _deadline.get()
+        token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining_time() -> Optional[float]:
+    """Seconds left until the current deadline, or None without one"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+# --- error classification ---
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and (status in RETRYABLE_STATUS_CODES or status >= 500)
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Failures that say the upstream is degraded (rate limits and 4xx don't count)"""
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and status >= 500
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Retry-After of an error response (retry-after-ms, seconds or an HTTP date)"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# --- circuit breaker ---
+
+class CircuitBreaker:
+    """Opens after consecutive upstream failures; one probe call is let through after the cooldown"""
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"OpenAI {self.name} calls are failing, not retrying for now")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"✅ Circuit for OpenAI {self.name} closed again")
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def abandon_probe(self):
+        """A call ended without an upstream answer; let the next call probe instead"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self, error: BaseException):
+        with self._lock:
+            self._probing = False
+            if not is_upstream_failure(error):
+                if self.state == "half_open":
+                    # The probe got an answer, so the upstream is reachable
+                    self.state = "closed"
+                    self.failures = 0
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"🔌 Circuit for OpenAI {self.name} opened after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(upstream: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(upstream)
+        if breaker is None:
+            breaker = CircuitBreaker(upstream, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+            _breakers[upstream] = breaker
+        return breaker
+
+# --- stats ---
+
+class RetryStats:
+    """Calls, retries, failures and hedges per call site"""
+
+    def __init__(self):
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def count(self, call_site: str, field: str):
+        with self._lock:
+            site_stats = self.stats.setdefault(call_site, {
+                "calls": 0, "retries": 0, "failures": 0, "deadline_exceeded": 0,
+                "circuit_rejected": 0, "hedges": 0, "hedge_wins": 0
+            })
+            site_stats[field] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            call_sites = {site: dict(counts) for site, counts in self.stats.items()}
+        with _breakers_lock:
+            circuits = {name: breaker.get_stats() for name, breaker in _breakers.items()}
+        return {"call_sites": call_sites, "circuits": circuits}
+
+retry_stats = RetryStats()
+
+# --- calls ---
+
+async def _attempt(func: Callable[[], Awaitable[T]]) -> T:
+    remaining = remaining_time()
+    if remaining is None:
+        return await func()
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline passed")
+    try:
+        return await asyncio.wait_for(func(), timeout=remaining)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"OpenAI call did not finish within the request deadline ({remaining:.1f}s)")
+
+async def _hedged_attempt(func: Callable[[], Awaitable[T]], call_site: str, hedge_after: float) -> T:
+    primary = asyncio.ensure_future(_attempt(func))
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if done:
+        return primary.result()
+    retry_stats.count(call_site, "hedges")
+    logger.info(f"🪞 Hedging slow {call_site} call after {hedge_after:.1f}s")
+    hedge = asyncio.ensure_future(_attempt(func))
+    pending = {primary, hedge}
+    first_error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        retry_stats.count(call_site, "hedge_wins")
+                    return task.result()
+                first_error = first_error or task.exception()
+        raise first_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+def _record_call(call_site: str, started: float, result: Any, failed: bool = False):
+    latency = time.perf_counter() - started
+    observe_openai("total", latency, call_site)
+    usage_tracker.record(call_site, latency, result, failed=failed)
+
+async def call_with_retry(
+    func: Callable[[], Awaitable[T]],
+    call_site: str,
+    upstream: str = "chat",
+    policy: RetryPolicy = DEFAULT_POLICY,
+    hedge_after: Optional[float] = None,
+    record_call: bool = True
+) -> T:
+    """
+    Await func() under the retry policy, the request deadline and the upstream's
+    circuit breaker. func must start a fresh call each time it is invoked.
+    hedge_after enables hedging for short, idempotent calls.
+    The call's total latency (retries included) and token usage are recorded per call
+    site unless record_call is False, for callers that record the call themselves (streams).
+    """
+    started = time.perf_counter()
+    with openai_call_scope(call_site):
+        try:
+            result = await _call_with_retry(func, call_site, upstream, policy, hedge_after)
+        except Exception:
+            if record_call:
+                _record_call(call_site, started, None, failed=True)
+            raise
+        if record_call:
+            _record_call(call_site, started, result)
+        return result
+
+async def _call_with_retry(func, call_site, upstream, policy, hedge_after):
+    breaker = get_breaker(upstream)
+    retry_stats.count(call_site, "calls")
+    for attempt in range(policy.max_attempts):
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            retry_stats.count(call_site, "circuit_rejected")
+            raise
+        try:
+            if hedge_after:
+                result = await _hedged_attempt(func, call_site, hedge_after)
+            else:
+                result = await _attempt(func)
+        except DeadlineExceeded:
+            breaker.abandon_probe()
+            retry_stats.count(call_site, "deadline_exceeded")
+            raise
+        except Exception as e:
+            breaker.record_failure(e)
+            if not is_retryable(e) or attempt == policy.max_attempts - 1:
+                retry_stats.count(call_site, "failures")
+                raise
+            delay = policy.backoff(attempt, retry_after_seconds(e))
+            remaining = remaining_time()
+            if remaining is not None and delay >= remaining:
+                retry_stats.count(call_site, "deadline_exceeded")
+                raise DeadlineExceeded(f"No time left to retry {call_site} after {type(e).__name__}") from e
+            retry_stats.count(call_site, "retries")
+            logger.warning(f"🔁 {call_site} failed ({type(e).__name__}: {e}), retry {attempt + 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # Cancelled: the outcome says nothing about the upstream
+            breaker.abandon_probe()
+            raise
+        breaker.record_success()
+        return result
+    raise AssertionError("unreachable")
+
+def call_with_retry_sync(
+    func: Callable[[], T],
+    call_site: str,
+    upstream: str = "chat",
+    policy: RetryPolicy = DEFAULT_POLICY,
+    record_call: bool = True
+) -> T:
+    """Blocking counterpart of call_with_retry (no hedging; deadlines bound the backoff only)"""
+    started = time.perf_counter()
+    with openai_call_scope(call_site):
+        try:
+            result = _call_with_retry_sync(func, call_site, upstream, policy)
+        except Exception:
+            if record_call:
+                _record_call(call_site, started, None, failed=True)
+            raise
+        if record_call:
+            _record_call(call_site, started, result)
+        return result
+
+def _call_with_retry_sync(func, call_site, upstream, policy):
+    breaker = get_breaker(upstream)
+    retry_stats.count(call_site, "calls")
+    for attempt in range(policy.max_attempts):
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            retry_stats.count(call_site, "deadline_exceeded")
+            raise DeadlineExceeded("Request deadline passed")
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            retry_stats.count(call_site, "circuit_rejected")
+            raise
+        try:
+            result = func()
+        except Exception as e:
+            breaker.record_failure(e)
+            if not is_retryable(e) or attempt == policy.max_attempts - 1:
+                retry_stats.count(call_site, "failures")
+                raise
+            delay = policy.backoff(attempt, retry_after_seconds(e))
+            remaining = remaining_time()
+            if remaining is not None and delay >= remaining:
+                retry_stats.count(call_site, "deadline_exceeded")
+                raise DeadlineExceeded(f"No time left to retry {call_site} after {type(e).__name__}") from e
+            retry_stats.count(call_site, "retries")
+            logger.warning(f"🔁 {call_site} failed ({type(e).__name__}: {e}), retry {attempt + 1} in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        except BaseException:
+            breaker.abandon_probe()
+            raise
+        breaker.record_success()
+        return result
+    raise AssertionError("unreachable")
@@ -0,0 +1,85 @@
+# backend/app/clients/single_flight.py
+"""
+Single-flight coalescing of identical in-flight requests.
+
+When several participants open the same task at once, identical parse/manipulative
+requests would each fire their own OpenAI call. Concurrent callers with the same key
+now await one shared task instead. The shared task is only cancelled once every
+caller waiting on it has gone away.
+"""
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+def make_flight_key(endpoint: str, text: str) -> str:
+    """Key on endpoint plus the normalized (case/whitespace-insensitive) text."""
+    normalized = " ".join((text or "").lower().split())
+    return f"{endpoint}:{hashlib.sha256(normalized.encode('utf-8')).hexdigest()}"
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one shared task"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        # Counters per endpoint: {endpoint: {"calls": n, "saved": n, "cancelled": n}}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, key: str, field: str):
+        endpoint = key.split(":", 1)[0]
+        endpoint_stats = self.stats.setdefault(endpoint, {"calls": 0, "saved": 0, "cancelled": 0})
+        endpoint_stats[field] += 1
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run func() once for all concurrent callers sharing `key` and return its result"""
+        loop = asyncio.get_running_loop()
+        flight = self._flights.get(key)
+        # Tasks are bound to their loop; sync adapters run on a separate loop
+        if flight is not None and (flight.task.done() or flight.task.get_loop() is not loop):
+            flight = None
+
+        if flight is None:
+            flight = _Flight(loop.create_task(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task, k=key, f=flight: self._forget(k, f))
+            self._count(key, "calls")
+        else:
+            self._count(key, "saved")
+            logger.info(f"🔗 Joined in-flight request: {key[:40]}... ({flight.waiters + 1} waiting)")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                # Last interested caller left - stop the upstream work
+                flight.task.cancel()
+                self._count(key, "cancelled")
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Retrieve the exception so abandoned tasks don't log "never retrieved"
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Upstream calls made, calls saved by coalescing and cancellations per endpoint"""
+        return {
+            "in_flight": len(self._flights),
+            "saved": sum(s["saved"] for s in self.stats.values()),
+            "endpoints": {endpoint: dict(counts) for endpoint, counts in self.stats.items()}
+        }
+
+# Global instance
+single_flight = SingleFlight()
@@ -0,0 +1,348 @@
+# backend/app/clients/usage_tracker.py
+"""
+Token, image and latency accounting for OpenAI calls.
+
+Every call made with the shared clients is recorded with its call site, model,
+prompt/completion tokens, image count and size, latency and the user/tool it was
+made for (see UsageContextMiddleware). Records are summed in memory per minute
+bucket and flushed to a small SQLite file in batches by a background thread, so
+the request path never waits on disk. /admin/usage queries the totals grouped by
+user, tool and time window, with an estimated cost from OPENAI_PRICES.
+"""
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.tracing import openai_call_timer
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+USAGE_TRACKING_ENABLED = os.getenv("USAGE_TRACKING_ENABLED", "1") == "1"
+USAGE_DB_PATH = os.getenv("USAGE_DB_PATH", str(BACKEND_DIR / "openai_usage.db"))
+USAGE_BUCKET_SECONDS = int(os.getenv("USAGE_BUCKET_SECONDS", "60"))
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "10"))
+USAGE_FLUSH_BATCH = int(os.getenv("USAGE_FLUSH_BATCH", "200"))
+
+# USD per 1M tokens as (prompt/input, completion/output); override with OPENAI_PRICES as JSON
+DEFAULT_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-image-1": (5.00, 40.00),
+    "gpt-image-1.5": (5.00, 32.00),
+}
+OPENAI_PRICES = {
+    model: tuple(prices)
+    for model, prices in {**DEFAULT_PRICES, **json.loads(os.getenv("OPENAI_PRICES", "{}"))}.items()
+}
+
+TOOLS = ("A", "B", "C")
+UNKNOWN = "unknown"
+
+GROUP_COLUMNS = ("user_id", "tool", "call_site", "model", "image_size")
+WINDOWS = {"minute": 60, "hour": 3600, "day": 86400}
+
+@dataclass
+class UsageContext:
+    """Who an OpenAI call is made for; set per HTTP request"""
+    user_id: Optional[str] = None
+    tool: Optional[str] = None
+
+_usage_context: ContextVar[Optional[UsageContext]] = ContextVar("usage_context", default=None)
+
+@contextmanager
+def usage_scope(user_id: Optional[str] = None, tool: Optional[str] = None) -> Iterator[UsageContext]:
+    context = UsageContext(user_id, tool)
+    token = _usage_context.set(context)
+    try:
+        yield context
+    finally:
+        _usage_context.reset(token)
+
+def current_usage_context() -> UsageContext:
+    return _usage_context.get() or UsageContext()
+
+def set_usage_user(user_id: Optional[str]):
+    """Attribute the current request's calls to user_id once the handler knows it"""
+    context = _usage_context.get()
+    if context is not None and user_id:
+        context.user_id = user_id
+
+def _token_counts(usage: Any) -> Tuple[int, int]:
+    """(prompt, completion) tokens from chat usage or (input, output) tokens from image usage"""
+    if usage is None:
+        return 0, 0
+    prompt = getattr(usage, "prompt_tokens", None)
+    if prompt is None:
+        prompt = getattr(usage, "input_tokens", 0)
+    completion = getattr(usage, "completion_tokens", None)
+    if completion is None:
+        completion = getattr(usage, "output_tokens", 0)
+    return prompt or 0, completion or 0
+
+def _image_count(result: Any) -> int:
+    data = getattr(result, "data", None)
+    if isinstance(data, list):
+        return len(data)
+    # Final event of a streamed generation or edit carries one image
+    if str(getattr(result, "type", "")).endswith(".completed"):
+        return 1
+    return 0
+
+def model_prices(model: str) -> Optional[Tuple[float, float]]:
+    prices = OPENAI_PRICES.get(model)
+    if prices is None:
+        # Dated snapshots (gpt-4o-mini-2024-07-18) are priced like their base model; the longest
+        # matching name wins, so gpt-4o-mini snapshots don't get gpt-4o prices
+        bases = [name for name in OPENAI_PRICES if model.startswith(name + "-")]
+        if bases:
+            prices = OPENAI_PRICES[max(bases, key=len)]
+    return prices
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost; 0.0 for models without a price (counted as unpriced_calls by the tracker)"""
+    prices = model_prices(model)
+    if prices is None:
+        return 0.0
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+class UsageTracker:
+    """In-memory per-minute usage totals, flushed to SQLite in batches"""
+
+    def __init__(self, path: str, bucket_seconds: int, flush_seconds: float, flush_batch: int):
+        self.path = path
+        self.bucket_seconds = max(1, bucket_seconds)
+        self.flush_seconds = flush_seconds
+        self.flush_batch = flush_batch
+        self._lock = threading.Lock()
+        # Serializes flushes and queries on the SQLite connection
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # (bucket_start, user_id, tool, call_site, model, image_size) ->
+        # [calls, errors, prompt_tokens, completion_tokens, images, cost_usd, latency_sum, latency_max]
+        self._pending: Dict[Tuple, List[float]] = {}
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"recorded": 0, "flushes": 0, "flushed_rows": 0, "flush_errors": 0, "unpriced_calls": 0}
+        self._unpriced_models: set = set()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS openai_usage (
+                    bucket_start INTEGER NOT NULL,
+                    user_id TEXT NOT NULL,
+                    tool TEXT NOT NULL,
+                    call_site TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    image_size TEXT NOT NULL,
+                    calls INTEGER NOT NULL,
+                    errors INTEGER NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    completion_tokens INTEGER NOT NULL,
+                    images INTEGER NOT NULL,
+                    cost_usd REAL NOT NULL,
+                    latency_sum REAL NOT NULL,
+                    latency_max REAL NOT NULL,
+                    PRIMARY KEY (bucket_start, user_id, tool, call_site, model, image_size)
+                )"""
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _ensure_flusher(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name="usage-flusher", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def record(self, call_site: str, latency: float, result: Any = None, model: Optional[str] = None,
+               image_size: Optional[str] = None, user_id: Optional[str] = None,
+               context: Optional[UsageContext] = None, failed: bool = False):
+        """Add one call. result is the SDK response (or final stream chunk/event) to read usage from;
+        context defaults to the current request's, user_id overrides its user"""
+        if not USAGE_TRACKING_ENABLED:
+            return
+        context = context or current_usage_context()
+        model = getattr(result, "model", None) or model or UNKNOWN
+        prompt_tokens, completion_tokens = _token_counts(getattr(result, "usage", None))
+        images = _image_count(result)
+        if images:
+            image_size = getattr(result, "size", None) or image_size
+        key = (
+            int(time.time() // self.bucket_seconds * self.bucket_seconds),
+            user_id or context.user_id or UNKNOWN,
+            context.tool or UNKNOWN,
+            call_site,
+            model,
+            image_size if images and image_size else ""
+        )
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+        unpriced = model_prices(model) is None
+        with self._lock:
+            if unpriced:
+                # Their cost shows up as $0 in /admin/usage, so make the gap visible
+                self.stats["unpriced_calls"] += 1
+                if model not in self._unpriced_models:
+                    self._unpriced_models.add(model)
+                    logger.warning(f"⚠️ No price for model {model!r}; its calls are recorded at $0 (see OPENAI_PRICES)")
+            self._ensure_flusher()
+            totals = self._pending.get(key)
+            if totals is None:
+                totals = self._pending[key] = [0, 0, 0, 0, 0, 0.0, 0.0, 0.0]
+            totals[0] += 1
+            totals[1] += 1 if failed else 0
+            totals[2] += prompt_tokens
+            totals[3] += completion_tokens
+            totals[4] += images
+            totals[5] += cost
+            totals[6] += latency
+            totals[7] = max(totals[7], latency)
+            self.stats["recorded"] += 1
+            if len(self._pending) >= self.flush_batch:
+                self._wakeup.set()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Write pending totals to SQLite; they are kept in memory for the next flush if that fails"""
+        with self._db_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            rows = [key + tuple(totals) for key, totals in pending.items()]
+            try:
+                conn = self._get_conn()
+                conn.executemany(
+                    "INSERT INTO openai_usage (bucket_start, user_id, tool, call_site, model, image_size, "
+                    "calls, errors, prompt_tokens, completion_tokens, images, cost_usd, latency_sum, latency_max) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (bucket_start, user_id, tool, call_site, model, image_size) DO UPDATE SET "
+                    "calls = calls + excluded.calls, errors = errors + excluded.errors, "
+                    "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                    "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                    "images = images + excluded.images, cost_usd = cost_usd + excluded.cost_usd, "
+                    "latency_sum = latency_sum + excluded.latency_sum, "
+                    "latency_max = MAX(latency_max, excluded.latency_max)",
+                    rows
+                )
+                conn.commit()
+            except Exception as e:
+                logger.error(f"❌ Failed to flush {len(rows)} usage rows: {e}")
+                self.stats["flush_errors"] += 1
+                with self._lock:
+                    for key, totals in pending.items():
+                        merged = self._pending.setdefault(key, [0, 0, 0, 0, 0, 0.0, 0.0, 0.0])
+                        for i in range(7):
+                            merged[i] += totals[i]
+                        merged[7] = max(merged[7], totals[7])
+                return
+            self.stats["flushes"] += 1
+            self.stats["flushed_rows"] += len(rows)
+
+    def query(self, group_by: Sequence[str], window: Optional[str] = None,
+              since: Optional[float] = None, until: Optional[float] = None,
+              user_id: Optional[str] = None, tool: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Totals grouped by the given columns and, unless window is None, by time window"""
+        columns = [column for column in group_by if column in GROUP_COLUMNS]
+        select = list(columns)
+        if window is not None:
+            # Windows are whole multiples of the bucket size, so buckets never straddle two windows
+            select.insert(0, f"(bucket_start / {WINDOWS[window]}) * {WINDOWS[window]} AS window_start")
+        conditions, params = [], []
+        for clause, value in (("bucket_start >= ?", since), ("bucket_start < ?", until),
+                              ("user_id = ?", user_id), ("tool = ?", tool)):
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+        group_keys = (["window_start"] if window is not None else []) + columns
+        sql = (
+            "SELECT " + ", ".join(select + [
+                "SUM(calls)", "SUM(errors)", "SUM(prompt_tokens)", "SUM(completion_tokens)",
+                "SUM(images)", "SUM(cost_usd)", "SUM(latency_sum)", "MAX(latency_max)"
+            ]) + " FROM openai_usage"
+            + (" WHERE " + " AND ".join(conditions) if conditions else "")
+            + (" GROUP BY " + ", ".join(group_keys) + " ORDER BY " + ", ".join(group_keys) if group_keys else "")
+        )
+        self.flush()
+        with self._db_lock:
+            rows = self._get_conn().execute(sql, params).fetchall()
+
+        results = []
+        for row in rows:
+            keys = dict(zip(group_keys, row[:len(group_keys)]))
+            calls, errors, prompt_tokens, completion_tokens, images, cost, latency_sum, latency_max = row[len(group_keys):]
+            if not calls:
+                continue
+            results.append({
+                **keys,
+                "calls": calls,
+                "errors": errors,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "images": images,
+                "estimated_cost_usd": round(cost, 6),
+                "avg_latency_seconds": round(latency_sum / calls, 3),
+                "max_latency_seconds": round(latency_max, 3)
+            })
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending)
+            unpriced_models = sorted(self._unpriced_models)
+        return {"enabled": USAGE_TRACKING_ENABLED, "pending_rows": pending, **self.stats,
+                "unpriced_models": unpriced_models}
+
+    def call_recorder(self, call_site: str, model: Optional[str] = None, image_size: Optional[str] = None,
+                      user_id: Optional[str] = None) -> "CallRecorder":
+        return CallRecorder(self, call_site, model, image_size, user_id)
+
+class CallRecorder:
+    """Records one call whose end the caller sees itself: streams and scheduled image calls.
+    Captures the request's context up front, since streams may end elsewhere."""
+
+    def __init__(self, tracker: UsageTracker, call_site: str, model: Optional[str],
+                 image_size: Optional[str], user_id: Optional[str]):
+        self.tracker = tracker
+        self.call_site = call_site
+        self.model = model
+        self.image_size = image_size
+        self.user_id = user_id
+        self.context = current_usage_context()
+        self.final = None
+        self._finish_timer = openai_call_timer(call_site)
+
+    def observe(self, item: Any):
+        """Keep the stream chunk or event that carries the usage totals"""
+        if getattr(item, "usage", None) is not None:
+            self.final = item
+
+    def finish(self, result: Any = None, failed: bool = False):
+        latency = self._finish_timer()
+        if latency is None:
+            return
+        self.tracker.record(self.call_site, latency, result if result is not None else self.final,
+                            self.model, self.image_size, self.user_id, self.context, failed)
+
+# Global instance
+usage_tracker = UsageTracker(USAGE_DB_PATH, USAGE_BUCKET_SECONDS, USAGE_FLUSH_SECONDS, USAGE_FLUSH_BATCH)
@@ -1,10 +1,13 @@
 # backend/app/database/db.py
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
 import os
+import time
 from pathlib import Path
 
+from app.tracing import record_span
+
 # Database file path - works locally and in containers
 DB_DIR = Path(__file__).parent.parent.parent
 DB_PATH = DB_DIR / "visual4math.db"
@@ -23,6 +26,18 @@ engine = create_engine(
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Time every commit (flush + COMMIT) as the db_commit stage of the current request
+@event.listens_for(SessionLocal, "before_commit")
+def _commit_started(session):
+    session.info["commit_started"] = time.perf_counter()
+
+@event.listens_for(SessionLocal, "after_commit")
+@event.listens_for(SessionLocal, "after_rollback")
+def _commit_finished(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        record_span("db_commit", time.perf_counter() - started)
+
 def get_db() -> Session:
     """Dependency for getting database session"""
     db = SessionLocal()
@@ -0,0 +1,233 @@
+# backend/app/logging_config.py
+"""
+Logging setup: structured output, a non-blocking queue, sampling and a payload sink.
+
+configure_logging() (called once from main.py) installs:
+- text or JSON lines output (LOG_FORMAT), tagged with the request ID of the trace
+- a queue handler so request handlers never block on stdout; a listener thread does
+  the formatting and I/O, and records are dropped (and counted) when the queue is full
+- per-logger sampling of INFO/DEBUG records (LOG_SAMPLING); warnings and errors are
+  always kept
+- a rotating debug sink for large payloads (prompts, parsed structures): log_payload()
+  logs a short preview with a hash and writes the full text to LOG_PAYLOAD_FILE once
+  per distinct hash
+"""
+import atexit
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.tracing import current_request_id
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Comma separated logger=rate pairs, e.g. "app.api.routes.parse=0.1"; child loggers inherit the rate
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+LOG_PAYLOAD_PREVIEW_CHARS = int(os.getenv("LOG_PAYLOAD_PREVIEW_CHARS", "160"))
+# Empty disables the payload sink
+LOG_PAYLOAD_FILE = os.getenv("LOG_PAYLOAD_FILE", str(BACKEND_DIR / "logs" / "payloads.jsonl"))
+LOG_PAYLOAD_MAX_BYTES = int(os.getenv("LOG_PAYLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+LOG_PAYLOAD_BACKUPS = int(os.getenv("LOG_PAYLOAD_BACKUPS", "5"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+PAYLOAD_LOGGER = "visual4math.payloads"
+
+# Attributes every LogRecord has; anything else was passed via extra= and goes into JSON output
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, request_id, extras, exc_info"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class RequestContextFilter(logging.Filter):
+    """Tags records with the current request ID; runs before the queue, where the trace is still visible"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "request_id", None) is None:
+            record.request_id = current_request_id()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a fraction of INFO/DEBUG records for the configured loggers"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Longest prefix first, so app.services.x=1 can override app.services=0.1
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self.sampled_out = 0
+
+    def _rate(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    rates = {}
+    for part in spec.split(","):
+        name, _, rate = part.partition("=")
+        if not name.strip():
+            continue
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            logging.getLogger(__name__).warning(f"⚠️ Ignoring invalid LOG_SAMPLING entry: {part!r}")
+    return rates
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking (or erroring) when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args and render the traceback here, but leave the final formatting to the listener
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listeners: List[logging.handlers.QueueListener] = []
+_queue_handlers: List[DroppingQueueHandler] = []
+_sampling_filter: Optional[SamplingFilter] = None
+
+def _attach(logger: logging.Logger, handler: logging.Handler, filters: List[logging.Filter]):
+    """Attach handler to logger, behind a queue and listener thread when LOG_ASYNC is on"""
+    if LOG_ASYNC:
+        queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        for log_filter in filters:
+            queue_handler.addFilter(log_filter)
+        listener = logging.handlers.QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+        _queue_handlers.append(queue_handler)
+        logger.addHandler(queue_handler)
+    else:
+        for log_filter in filters:
+            handler.addFilter(log_filter)
+        logger.addHandler(handler)
+
+def _stop_listeners():
+    for listener in _listeners:
+        listener.stop()
+    _listeners.clear()
+
+def configure_logging():
+    """Install the configured handlers on the root and payload loggers (idempotent)"""
+    global _sampling_filter
+    _stop_listeners()
+    _queue_handlers.clear()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    console = logging.StreamHandler()
+    console.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    _sampling_filter = SamplingFilter(parse_sampling(LOG_SAMPLING))
+    _attach(root, console, [RequestContextFilter(), _sampling_filter])
+
+    payload_logger = logging.getLogger(PAYLOAD_LOGGER)
+    for handler in list(payload_logger.handlers):
+        payload_logger.removeHandler(handler)
+    payload_logger.propagate = False
+    if LOG_PAYLOAD_FILE:
+        Path(LOG_PAYLOAD_FILE).parent.mkdir(parents=True, exist_ok=True)
+        sink = logging.handlers.RotatingFileHandler(
+            LOG_PAYLOAD_FILE, maxBytes=LOG_PAYLOAD_MAX_BYTES, backupCount=LOG_PAYLOAD_BACKUPS, encoding="utf-8"
+        )
+        sink.setFormatter(JsonFormatter())
+        payload_logger.setLevel(logging.DEBUG)
+        payload_logger.disabled = False
+        _attach(payload_logger, sink, [RequestContextFilter()])
+    else:
+        payload_logger.disabled = True
+
+atexit.register(_stop_listeners)
+
+# Hashes of payloads already written to the sink; repeats only log their hash
+_PAYLOAD_SEEN_MAX = 2048
+_payload_seen: "OrderedDict[str, None]" = OrderedDict()
+_payload_lock = threading.Lock()
+
+def _first_sighting(digest: str) -> bool:
+    with _payload_lock:
+        if digest in _payload_seen:
+            _payload_seen.move_to_end(digest)
+            return False
+        _payload_seen[digest] = None
+        if len(_payload_seen) > _PAYLOAD_SEEN_MAX:
+            _payload_seen.popitem(last=False)
+        return True
+
+def log_payload(logger: logging.Logger, label: str, payload: Any, level: int = logging.INFO):
+    """Log a one-line preview and hash of a large payload; the full payload goes to the debug sink"""
+    payload_logger = logging.getLogger(PAYLOAD_LOGGER)
+    to_sink = not payload_logger.disabled and payload_logger.isEnabledFor(logging.DEBUG)
+    if not to_sink and not logger.isEnabledFor(level):
+        return
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False, default=str)
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    if logger.isEnabledFor(level):
+        preview = text if len(text) <= LOG_PAYLOAD_PREVIEW_CHARS else text[:LOG_PAYLOAD_PREVIEW_CHARS] + "…"
+        preview = " ".join(preview.split())
+        logger.log(level, f"{label} ({len(text)} chars, sha256 {digest}): {preview}", stacklevel=2)
+    if to_sink and _first_sighting(digest):
+        payload_logger.debug(text, extra={"source": logger.name, "label": label, "sha256": digest})
+
+def get_logging_stats() -> Dict[str, Any]:
+    return {
+        "async": LOG_ASYNC,
+        "format": LOG_FORMAT,
+        "dropped": sum(handler.dropped for handler in _queue_handlers),
+        "queued": sum(handler.queue.qsize() for handler in _queue_handlers),
+        "sampled_out": _sampling_filter.sampled_out if _sampling_filter else 0,
+    }
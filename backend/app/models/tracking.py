@@ -124,7 +124,8 @@ class SessionEndRequest(BaseModel):
 class ToolAImageSubmission(BaseModel):
     user_id: str
     session_id: int
-    image_url: str
+    image_url: Optional[str] = None
+    image_id: Optional[str] = None  # ID from /images/upload, alternative to image_url
     user_input: Optional[str] = None
     operation: Optional[str] = None
     is_final: bool = False
@@ -132,13 +133,15 @@ class ToolAImageSubmission(BaseModel):
 class ToolBLayoutSubmission(BaseModel):
     user_id: str
     session_id: int
-    screenshot_url: str
+    screenshot_url: Optional[str] = None
+    screenshot_id: Optional[str] = None  # ID from /images/upload, alternative to screenshot_url
     operation: Optional[str] = None
 
 class ToolBImageSubmission(BaseModel):
     user_id: str
     session_id: int
-    image_url: str
+    image_url: Optional[str] = None
+    image_id: Optional[str] = None  # ID from /images/upload, alternative to image_url
     layout_screenshot_id: Optional[int] = None
     operation: Optional[str] = None
     is_final: bool = False
@@ -152,7 +155,8 @@ class ToolCCanvasSubmission(BaseModel):
 class ToolCImageSubmission(BaseModel):
     user_id: str
     session_id: int
-    image_url: str
+    image_url: Optional[str] = None
+    image_id: Optional[str] = None  # ID from /images/upload, alternative to image_url
     operation: Optional[str] = None
     is_final: bool = False
 
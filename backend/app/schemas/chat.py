@@ -5,25 +5,29 @@ from datetime import datetime
 
 class ImageRegion(BaseModel):
     """Region selection for image editing"""
-    image_url: str  # Which image to edit (reference to image in conversation history)
+    image_url: str  # Which image to edit (reference to image in conversation history, or an uploaded image ID)
     mask_data: Optional[str] = None  # Base64 encoded mask for the region to edit
+    mask_id: Optional[str] = None  # Alternative to mask_data: ID of a mask uploaded via /images/upload
     coordinates: Optional[dict] = None  # Optional bounding box coordinates
 
 class ChatMessage(BaseModel):
     """Message in conversation history"""
     role: str  # "user" | "assistant"
     content: str  # text content
-    image_url: Optional[str] = None  # image URL (users can have images, assistants store generated image URLs)
+    image_url: Optional[str] = None  # image URL or uploaded image ID (users can have images, assistants store generated image URLs)
     message_id: Optional[str] = None  # Unique ID for referencing this message/image
     timestamp: Optional[datetime] = None
 
 class ChatRequest(BaseModel):
     """User's input to the system"""
     user_input: str  # user's text message
-    user_image: Optional[Union[str, bytes]] = None  # optional image URL (str) or image bytes (bytes) for layout image
+    user_image: Optional[Union[str, bytes]] = None  # optional image URL or uploaded image ID (str) or image bytes (bytes) for layout image
     conversation_history: List[ChatMessage] = []
     image_region: Optional[ImageRegion] = None  # For image editing with brush selection
     referenced_image_id: Optional[str] = None  # ID of the image user clicked on
+    conversation_id: Optional[str] = None  # Server-side conversation; history then only holds new messages
+    last_message_id: Optional[str] = None  # Last message ID the server acknowledged for this conversation
+    user_id: Optional[str] = None  # Participant ID, used for fair scheduling of image calls
     
     class Config:
         arbitrary_types_allowed = True  # Allow bytes type
@@ -33,3 +37,7 @@ class ChatResponse(BaseModel):
     type: str  # "text_solo" | "image_solo" | "both" - what the response contains
     content: str  # text response
     image_url: Optional[str] = None  # generated image URL if applicable
+    conversation_id: Optional[str] = None  # echoed back when the request used a server-side conversation
+    message_id: Optional[str] = None  # ID of this reply in the server-side conversation
+    history_length: Optional[int] = None  # Messages of the sent history the server now holds
+    history_message_id: Optional[str] = None  # ID of the last of them, to send as last_message_id next turn
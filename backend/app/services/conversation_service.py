@@ -1,76 +1,19 @@
 # backend/app/services/conversation_service.py
 from app.schemas.chat import ChatRequest, ChatResponse
-from app.services.intent_service import analyze_intent
-from app.services.chat_service import get_text_response
-from app.services.image_service import get_image_response
+from app.services.intent_service import analyze_intent_async
+from app.services.chat_service import get_text_response_async, get_text_response_stream_async
+from app.services.image_service import get_image_response_async, get_image_response_stream_async
 from app.services.image_modification_service import edit_image_region
+from app.services.intent_classifier import is_specific_image_request
+from app.clients.openai_client import run_sync
+import asyncio
 import logging
 import time
+from typing import AsyncIterator, Dict
 
 logger = logging.getLogger(__name__)
 
-GENERIC_VAGUE_PHRASES = [
-    "help me to create some images",
-    "help me create images",
-    "create some images",
-    "make images",
-    "how to create images",
-    "how can i make images",
-]
-
-def _is_specific_image_request(text: str) -> bool:
-    """Heuristic: check if request is specific enough to generate an image.
-    Examples that pass: 
-    - 'draw a graph of y=x^2' 
-    - 'make a number line from -5 to 5'
-    - 'i want an image for this problem: There are 10 basketballs...'
-    - Any word problem with numbers and specific details
-    """
-    t = (text or "").lower()
-    
-    # Check for generic vague phrases first
-    if any(p in t for p in GENERIC_VAGUE_PHRASES):
-        return False
-    
-    # Check for image request phrases
-    image_request_phrases = [
-        "want an image", "want a image", "need an image", "need a image",
-        "create an image", "create a image", "make an image", "make a image",
-        "draw", "generate", "illustrate", "visualize", "diagram", "show me",
-        "give me", "i want", "can you", "please create", "please draw",
-        "for this problem", "for the problem", "for this", "of this"
-    ]
-    has_image_request = any(phrase in t for phrase in image_request_phrases)
-    
-    # Check for math specificity: numbers, math words, or word problem structure
-    math_markers = [
-        "graph", "fraction", "number line", "triangle", "rectangle", "area", 
-        "equation", "x=", "y=", "plot", "bar chart", "pie chart", "basketball",
-        "bag", "total", "has", "how many", "problem", "solve", "word problem"
-    ]
-    has_numbers = any(ch.isdigit() for ch in t)
-    has_math_markers = any(m in t for m in math_markers)
-    
-    # Word problem indicators (questions with numbers)
-    is_word_problem = (
-        "?" in text and has_numbers and (
-            "how many" in t or "what" in t or "if" in t or
-            "total" in t or "has" in t or "are" in t
-        )
-    )
-    
-    # If it's a word problem with numbers, it's specific enough
-    if is_word_problem and has_numbers:
-        logger.info(f"✅ Detected word problem with numbers: {text[:50]}...")
-        return True
-    
-    # Otherwise, need either image request phrase + numbers/markers, or explicit verb + markers
-    explicit_verbs = ["draw", "generate", "create", "make", "illustrate", "visualize", "diagram", "show"]
-    has_explicit_verb = any(v in t for v in explicit_verbs)
-    
-    return (has_image_request and (has_numbers or has_math_markers)) or (has_explicit_verb and (has_numbers or has_math_markers))
-
-def process_conversation(request: ChatRequest, intent: str = None) -> ChatResponse:
+async def process_conversation_async(request: ChatRequest, intent: str = None) -> ChatResponse:
     """Main function: Process user input and return appropriate response"""
     logger.info("🚀 Starting conversation processing...")
     
@@ -90,7 +33,7 @@ def process_conversation(request: ChatRequest, intent: str = None) -> ChatRespon
         try:
             logger.info("🔗 Calling OpenAI images.edit API...")
             start_time = time.perf_counter()
-            edited_image_url = edit_image_region(request)
+            edited_image_url = await asyncio.to_thread(edit_image_region, request)
             duration = time.perf_counter() - start_time
             logger.info(f"⏱️ Image edit completed in {duration:.1f}s")
             result = ChatResponse(
@@ -111,7 +54,7 @@ def process_conversation(request: ChatRequest, intent: str = None) -> ChatRespon
     # Only analyze intent if not provided
     if intent is None:
         logger.info("🧠 No intent provided, analyzing user intent...")
-        intent = analyze_intent(request)
+        intent = await analyze_intent_async(request)
     else:
         logger.info(f"🧠 Using provided intent: {intent}")
 
@@ -119,7 +62,7 @@ def process_conversation(request: ChatRequest, intent: str = None) -> ChatRespon
         if intent == "text_solo":
             # Just text response
             logger.info("📝 DEBUG: Processing text-only response...")
-            text_content = get_text_response(request)
+            text_content = await get_text_response_async(request)
             result = ChatResponse(
                 type="text_solo",
                 content=text_content,
@@ -142,7 +85,7 @@ def process_conversation(request: ChatRequest, intent: str = None) -> ChatRespon
                         break
             
             # Check if request is specific enough
-            is_specific = _is_specific_image_request(request.user_input)
+            is_specific = is_specific_image_request(request.user_input)
             
             # Only ask clarifying questions if request is vague AND no image in history
             # If intent is image_solo, it means GPT-4o detected the user wants an image, so trust it
@@ -174,7 +117,7 @@ def process_conversation(request: ChatRequest, intent: str = None) -> ChatRespon
             if has_image_in_history:
                 logger.info(f"🔄 Generating modified image based on conversation context...")
             start_time = time.perf_counter()
-            image_url = get_image_response(request)
+            image_url = await get_image_response_async(request)
             duration = time.perf_counter() - start_time
             logger.info(f"⏱️ Image generation completed in {duration:.1f}s")
             result = ChatResponse(
@@ -186,7 +129,7 @@ def process_conversation(request: ChatRequest, intent: str = None) -> ChatRespon
             return result
         
         elif intent == "both":
-            if not _is_specific_image_request(request.user_input):
+            if not is_specific_image_request(request.user_input):
                 logger.info("🛑 Vague 'both' request; returning clarifying questions.")
                 questions = (
                     "To help with both explanation and a visual, please specify:\n"
@@ -197,10 +140,10 @@ def process_conversation(request: ChatRequest, intent: str = None) -> ChatRespon
                 return ChatResponse(type="text_solo", content=questions, image_url=None)
             logger.info("🔄 DEBUG: Processing both text and image response...")
             # Get text response first
-            text_content = get_text_response(request)
+            text_content = await get_text_response_async(request)
             # Then get image response (may reuse conversation context)
             start_time = time.perf_counter()
-            image_url = get_image_response(request)
+            image_url = await get_image_response_async(request)
             duration = time.perf_counter() - start_time
             logger.info(f"⏱️ Image generation (both) completed in {duration:.1f}s")
             result = ChatResponse(
@@ -213,7 +156,7 @@ def process_conversation(request: ChatRequest, intent: str = None) -> ChatRespon
         else:
             # Fallback for unexpected intent
             logger.warning(f"⚠️ Unexpected intent: {intent}, defaulting to text_solo")
-            text_content = get_text_response(request)
+            text_content = await get_text_response_async(request)
             result = ChatResponse(
                 type="text_solo",
                 content=text_content,
@@ -230,3 +173,70 @@ def process_conversation(request: ChatRequest, intent: str = None) -> ChatRespon
             image_url=None
         )
 
+async def process_both_stream_async(request: ChatRequest) -> AsyncIterator[Dict]:
+    """
+    Stream a "both" response: the text and image generations run concurrently and
+    their events are interleaved on one stream as they arrive.
+    Yields {'type': 'text'}, {'type': 'partial_image'}, {'type': 'completed'} and
+    {'type': 'error'} events.
+    """
+    if not is_specific_image_request(request.user_input):
+        logger.info("🛑 Vague 'both' request; returning clarifying questions.")
+        yield {
+            'type': 'text',
+            'content': (
+                "To help with both explanation and a visual, please specify:\n"
+                "1) The exact math problem or concept\n"
+                "2) Key values/labels to include\n"
+                "3) Desired visual type"
+            )
+        }
+        return
+
+    logger.info("🔄 Streaming both text and image concurrently...")
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def pump_text():
+        try:
+            async for chunk in get_text_response_stream_async(request):
+                queue.put_nowait({'type': 'text', 'content': chunk})
+        except Exception as e:
+            logger.error(f"❌ Text stream (both) failed: {type(e).__name__}: {e}")
+            queue.put_nowait({'type': 'text', 'content': "\n\nI encountered an error writing the explanation."})
+        finally:
+            queue.put_nowait(done)
+
+    async def pump_image():
+        try:
+            async for event in get_image_response_stream_async(request):
+                queue.put_nowait(event)
+                if event['type'] in ('completed', 'error'):
+                    break
+        except Exception as e:
+            logger.error(f"❌ Image stream (both) failed: {type(e).__name__}: {e}")
+            queue.put_nowait({'type': 'error', 'message': str(e)})
+        finally:
+            queue.put_nowait(done)
+
+    start_time = time.perf_counter()
+    tasks = [asyncio.create_task(pump_text()), asyncio.create_task(pump_image())]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await queue.get()
+            if event is done:
+                remaining -= 1
+                continue
+            if event['type'] == 'completed':
+                logger.info(f"⏱️ Image generation (both) completed in {time.perf_counter() - start_time:.1f}s")
+            yield event
+        logger.info("✅ Both text and image streams complete")
+    finally:
+        # Stop whatever is still running if the client went away
+        for task in tasks:
+            task.cancel()
+
+def process_conversation(request: ChatRequest, intent: str = None) -> ChatResponse:
+    """Synchronous adapter around process_conversation_async."""
+    return run_sync(process_conversation_async(request, intent))
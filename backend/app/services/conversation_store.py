@@ -0,0 +1,171 @@
+# backend/app/services/conversation_store.py
+"""
+Server-side conversation store for the chat delta protocol.
+
+Clients that send a conversation_id only need to send the messages the server
+hasn't seen yet, plus the ID of the last message it acknowledged (last_message_id).
+The server rebuilds the full history from its copy, so request size and the
+per-turn cost of re-storing inline images stay constant as conversations grow.
+Clients without a conversation_id keep sending the full history as before.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.schemas.chat import ChatMessage, ChatRequest
+from app.services.image_storage_service import is_inline_image, store_image
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_STORE_TTL_SECONDS = int(os.getenv("CONVERSATION_STORE_TTL_SECONDS", str(6 * 3600)))
+CONVERSATION_STORE_MAX_CONVERSATIONS = int(os.getenv("CONVERSATION_STORE_MAX_CONVERSATIONS", "1000"))
+
+class ConversationNotFoundError(Exception):
+    """The client references server state that doesn't exist (expired or restarted)"""
+
+def new_message_id() -> str:
+    return uuid.uuid4().hex
+
+class _Conversation:
+    def __init__(self):
+        self.messages: List[ChatMessage] = []
+        self.last_access = time.time()
+
+class ConversationStore:
+    """In-memory conversations keyed by conversation ID, with TTL and LRU eviction"""
+
+    def __init__(self, ttl_seconds: int, max_conversations: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_conversations = max_conversations
+        self._conversations: "OrderedDict[str, _Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, conversation_id: str) -> Optional[_Conversation]:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            return None
+        if time.time() - conversation.last_access > self.ttl_seconds:
+            del self._conversations[conversation_id]
+            return None
+        conversation.last_access = time.time()
+        self._conversations.move_to_end(conversation_id)
+        return conversation
+
+    def _get_or_create(self, conversation_id: str) -> _Conversation:
+        conversation = self._get(conversation_id)
+        if conversation is None:
+            conversation = _Conversation()
+            self._conversations[conversation_id] = conversation
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        return conversation
+
+    def resolve_history(
+        self,
+        conversation_id: str,
+        last_message_id: Optional[str],
+        delta: List[ChatMessage]
+    ) -> List[ChatMessage]:
+        """
+        Apply the client's delta after last_message_id and return the full history.
+        Without last_message_id the delta is taken as the complete history.
+        Raises ConversationNotFoundError if the referenced state is unknown.
+        """
+        with self._lock:
+            conversation = self._get(conversation_id)
+            if last_message_id:
+                if conversation is None:
+                    raise ConversationNotFoundError(f"Unknown conversation: {conversation_id}")
+                index = next(
+                    (i for i, msg in enumerate(conversation.messages) if msg.message_id == last_message_id),
+                    None
+                )
+                if index is None:
+                    raise ConversationNotFoundError(f"Unknown message {last_message_id} in conversation {conversation_id}")
+                # Anything after last_message_id was never acknowledged by the client
+                base = conversation.messages[:index + 1]
+            else:
+                conversation = conversation or self._get_or_create(conversation_id)
+                base = []
+            conversation.messages = base + list(delta)
+            return list(conversation.messages)
+
+    def record_turn(self, conversation_id: str, user_input: str, assistant_message: ChatMessage):
+        """Append the user's message (unless the history already ends with it) and the reply"""
+        with self._lock:
+            conversation = self._get_or_create(conversation_id)
+            last = conversation.messages[-1] if conversation.messages else None
+            if not (last and last.role == "user" and last.content == user_input):
+                conversation.messages.append(ChatMessage(role="user", content=user_input, message_id=new_message_id()))
+            conversation.messages.append(assistant_message)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "conversations": len(self._conversations),
+                "messages": sum(len(c.messages) for c in self._conversations.values())
+            }
+
+# Global instance
+conversation_store = ConversationStore(CONVERSATION_STORE_TTL_SECONDS, CONVERSATION_STORE_MAX_CONVERSATIONS)
+
+def _store_inline_images(messages: List[ChatMessage]):
+    """Replace inline base64 images with stored URLs (only done once, when a message arrives)"""
+    for msg in messages:
+        if msg.image_url and is_inline_image(msg.image_url):
+            try:
+                msg.image_url = store_image(msg.image_url)
+            except Exception as e:
+                logger.warning(f"Failed to store inline image of message {msg.message_id}: {e}")
+
+async def prepare_conversation(request: ChatRequest):
+    """
+    Expand a delta request into the full conversation history in place.
+    Requests without conversation_id are left untouched.
+    """
+    if not request.conversation_id:
+        return
+    delta = request.conversation_history
+    for msg in delta:
+        if not msg.message_id:
+            msg.message_id = new_message_id()
+    if any(msg.image_url and is_inline_image(msg.image_url) for msg in delta):
+        await asyncio.to_thread(_store_inline_images, delta)
+    request.conversation_history = conversation_store.resolve_history(
+        request.conversation_id, request.last_message_id, delta
+    )
+    logger.debug(f"Conversation {request.conversation_id}: {len(delta)} new, {len(request.conversation_history)} total messages")
+
+def record_turn(request: ChatRequest, content: str, image_url: Optional[str] = None) -> Optional[str]:
+    """
+    Record the user's message and the assistant's reply in the conversation.
+    Returns the assistant message ID the client should send as last_message_id next
+    time, or None if the request doesn't use a server-side conversation.
+    """
+    if not request.conversation_id:
+        return None
+    assistant_message = ChatMessage(
+        role="assistant", content=content, image_url=image_url, message_id=new_message_id()
+    )
+    conversation_store.record_turn(request.conversation_id, request.user_input, assistant_message)
+    return assistant_message.message_id
+
+def sync_point(request: ChatRequest) -> Dict[str, Any]:
+    """
+    Where the client's next delta starts: the number of its history messages the
+    server holds and the ID of the last one (None for an empty history). The client
+    sends that ID as last_message_id together with every message after it, so the
+    turn's user message and reply are replaced by the client's own copies. The
+    client may not have sent the user message in its history, or may show the reply
+    as several messages, so its history is the one kept.
+    """
+    history = request.conversation_history
+    return {
+        "history_length": len(history),
+        "history_message_id": history[-1].message_id if history else None,
+    }
@@ -7,13 +7,22 @@ import os
 import json
 import base64
 import hashlib
+import shutil
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 import logging
 
+from app.services.image_cache import image_cache
+from app.services.image_storage_service import derivative_width, get_image_variant_path, get_normalized_image_path
+from app.tracing import traced
+
 logger = logging.getLogger(__name__)
 
+# Thumbnails written to each session's thumbnails/ folder next to the copied images (0 disables);
+# they are the same cached derivatives /images/{id}?w= serves
+DATASET_THUMBNAIL_WIDTH = int(os.getenv("DATASET_THUMBNAIL_WIDTH", "256"))
+
 # Determine base data directory (works locally and on server)
 def get_dataset_base_dir() -> Path:
     """Get the base directory for dataset storage"""
@@ -30,18 +39,9 @@ def get_dataset_base_dir() -> Path:
     return base_dir
 
 def get_cached_image_path(image_id: str) -> Optional[Path]:
-    """Get path to image in cached_images directory"""
-    cache_dir_env = os.getenv("CACHE_DIR")
-    if cache_dir_env:
-        cache_dir = Path(cache_dir_env)
-    else:
-        project_root = Path(__file__).resolve().parents[3]
-        cache_dir = project_root / "backend" / "cached_images"
-    
-    image_path = cache_dir / f"{image_id}.png"
-    if image_path.exists():
-        return image_path
-    return None
+    """Get path to the image in the image store, as the RGB PNG the dataset expects"""
+    image_path = get_normalized_image_path(image_id)
+    return Path(image_path) if image_path else None
 
 def format_session_folder_name(timestamp: datetime, user_id: str) -> str:
     """Format session folder name as timestamp_userid"""
@@ -123,6 +123,7 @@ class DatasetStorage:
         logger.info(f"✅ Created session folder: {folder_name}")
         return session
     
+    @traced("dataset_write")
     def save_session_data(self, user_id: str):
         """Save session data to session.json in the session folder"""
         if user_id not in self.sessions:
@@ -147,6 +148,7 @@ class DatasetStorage:
         except Exception as e:
             logger.error(f"Failed to save session data: {e}")
     
+    @traced("dataset_write")
     def save_image_to_session(self, user_id: str, image_data: bytes, image_id: Optional[str] = None) -> Optional[str]:
         """Save image to the session's folder"""
         session_folder = self.session_folders.get(user_id)
@@ -178,13 +180,33 @@ class DatasetStorage:
         cached_path = get_cached_image_path(image_id)
         if cached_path and cached_path.exists():
             try:
-                with open(cached_path, "rb") as f:
-                    image_data = f.read()
-                return self.save_image_to_session(user_id, image_data, image_id)
+                image_data = image_cache.read(str(cached_path))
+                saved_id = self.save_image_to_session(user_id, image_data, image_id)
+                if saved_id and DATASET_THUMBNAIL_WIDTH:
+                    self.save_thumbnail_to_session(user_id, image_id)
+                return saved_id
             except Exception as e:
                 logger.error(f"Failed to copy image from cache: {e}")
         return None
     
+    def save_thumbnail_to_session(self, user_id: str, image_id: str) -> Optional[str]:
+        """Copy the image's cached thumbnail derivative into the session's thumbnails folder"""
+        session_folder = self.session_folders.get(user_id)
+        if not session_folder:
+            return None
+        try:
+            variant_path = get_image_variant_path(image_id, derivative_width(DATASET_THUMBNAIL_WIDTH))
+            if not variant_path:
+                return None
+            thumbnails_folder = session_folder / "thumbnails"
+            thumbnails_folder.mkdir(parents=True, exist_ok=True)
+            thumbnail_path = thumbnails_folder / f"{image_id}{os.path.splitext(variant_path)[1]}"
+            shutil.copyfile(variant_path, thumbnail_path)
+            return thumbnail_path.name
+        except Exception as e:
+            logger.warning(f"Failed to save thumbnail for {image_id}: {e}")
+            return None
+    
     def download_image_from_url(self, user_id: str, url: str) -> Optional[str]:
         """Download image from HTTP/HTTPS URL and save to session folder"""
         try:
@@ -0,0 +1,239 @@
+# backend/app/services/history_builder.py
+"""
+Token-budgeted conversation history for OpenAI chat calls.
+
+Instead of keeping a fixed number of messages, the newest messages are packed
+into CHAT_HISTORY_TOKEN_BUDGET tokens (counted with tiktoken when it is installed,
+estimated from the text length otherwise). The OpenAI-format encoding and the token
+count of each message are memoized by message ID, and which file (downscaled variant
+or original) stands for each context image is memoized by URL. The image bytes come
+from the shared image cache, so unchanged history costs next to nothing on later turns.
+"""
+import base64
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.schemas.chat import ChatMessage
+from app.services.image_cache import image_cache
+from app.services.image_storage_service import get_image_record, get_image_variant_path, get_variant_mime_type
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a length-based estimate
+    tiktoken = None
+
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "3000"))
+CHAT_HISTORY_MAX_IMAGES = int(os.getenv("CHAT_HISTORY_MAX_IMAGES", "1"))
+MESSAGE_CACHE_MAX_ENTRIES = int(os.getenv("MESSAGE_CACHE_MAX_ENTRIES", "2000"))
+# Context images are sent as downscaled variants with a detail hint (0 sends the original)
+GPT_CONTEXT_IMAGE_SIZE = int(os.getenv("GPT_CONTEXT_IMAGE_SIZE", "512"))
+GPT_CONTEXT_IMAGE_DETAIL = os.getenv("GPT_CONTEXT_IMAGE_DETAIL", "low")
+
+# Fixed overhead per chat message and the cost of one image (flat for "low" detail,
+# 1024x1024 at "high"/"auto")
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_IMAGE = 85 if GPT_CONTEXT_IMAGE_DETAIL == "low" else 765
+
+ASSISTANT_IMAGE_REFERENCE_TEXT = "[Previous visual reference from assistant]"
+
+_encoding = None
+
+def count_tokens(text: str) -> int:
+    """Token count of a text with the gpt-4o tokenizer, or an estimate without tiktoken"""
+    global _encoding
+    if not text:
+        return 0
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text, disallowed_special=()))
+    # Roughly 4 characters per token for English text
+    return len(text) // 4 + 1
+
+class _LRUCache:
+    """Thread-safe LRU with an optional size function for byte budgets"""
+
+    def __init__(self, max_size: int, sizeof=lambda value: 1):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self._data:
+                self.size -= self.sizeof(self._data.pop(key))
+            self._data[key] = value
+            self.size += self.sizeof(value)
+            while self.size > self.max_size and len(self._data) > 1:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= self.sizeof(evicted)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"entries": len(self._data), "size": self.size, "hits": self.hits, "misses": self.misses}
+
+# image_url -> (path, MIME type) of the file sent for it; the bytes live in image_cache
+_image_sources = _LRUCache(MESSAGE_CACHE_MAX_ENTRIES)
+
+def _image_source(image_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """Path and MIME type of the context image: the small variant, or the original"""
+    try:
+        image_path = get_image_variant_path(image_id, GPT_CONTEXT_IMAGE_SIZE) if GPT_CONTEXT_IMAGE_SIZE else None
+    except Exception as e:
+        logger.warning(f"⚠️ Could not create context variant for {image_id}: {e}")
+        image_path = None
+    if image_path:
+        return image_path, get_variant_mime_type()
+    # Originals are stored in the format they arrived in
+    record = get_image_record(image_id)
+    return (record.path, record.mime) if record else (None, None)
+
+def convert_image_url_for_gpt(image_url: str) -> str:
+    """
+    Convert backend image URL to base64 data URL for GPT.
+    GPT can't access our internal URLs, so we need to convert backend URLs to base64.
+    External URLs (http/https) are passed through as-is.
+    """
+    # If it's already an external URL or base64, return as-is
+    if image_url.startswith('http://') or image_url.startswith('https://'):
+        return image_url
+    if image_url.startswith('data:image'):
+        return image_url
+
+    # If it's a backend URL like /images/{id}, convert to base64
+    if image_url.startswith('/images/'):
+        image_id = image_url.replace('/images/', '')
+        source = _image_sources.get(image_url)
+        if source is None:
+            source = _image_source(image_id)
+        image_path, mime_type = source
+        if image_path:
+            try:
+                try:
+                    image_bytes = image_cache.read(image_path)
+                except FileNotFoundError:
+                    # The memoized file was garbage collected; look it up again
+                    image_path, mime_type = source = _image_source(image_id)
+                    if not image_path:
+                        raise
+                    image_bytes = image_cache.read(image_path)
+                _image_sources.set(image_url, source)
+                base64_data = base64.b64encode(image_bytes).decode('utf-8')
+                logger.debug(f"🔄 Converted backend URL to base64 for GPT: {image_id}")
+                return f"data:{mime_type};base64,{base64_data}"
+            except Exception as e:
+                logger.error(f"❌ Failed to convert image URL to base64: {e}")
+                # Fallback: return original URL (GPT might fail, but better than crashing)
+                return image_url
+
+    # Unknown format, return as-is
+    logger.warning(f"⚠️ Unknown image URL format: {image_url[:50]}...")
+    return image_url
+
+def image_content_part(image_url: str) -> Dict[str, Any]:
+    """OpenAI image content part for a backend or external image, with the detail hint"""
+    return {
+        "type": "image_url",
+        "image_url": {"url": convert_image_url_for_gpt(image_url), "detail": GPT_CONTEXT_IMAGE_DETAIL}
+    }
+
+class EncodedMessage:
+    """OpenAI-format encodings of one history message, with and without its image"""
+
+    def __init__(self, role: str, text_only: List[dict], text_tokens: int, has_image: bool):
+        self.role = role
+        self.text_only = text_only
+        self.text_tokens = text_tokens
+        self.has_image = has_image
+
+    @property
+    def image_tokens(self) -> int:
+        if self.role == "user":
+            return self.text_tokens + TOKENS_PER_IMAGE
+        # The assistant variant adds a separate user message for the image
+        return self.text_tokens + TOKENS_PER_IMAGE + TOKENS_PER_MESSAGE + count_tokens(ASSISTANT_IMAGE_REFERENCE_TEXT)
+
+    def with_image(self, msg: ChatMessage) -> List[dict]:
+        # Built per call so the (large) data URL only lives in the image cache
+        image_part = image_content_part(msg.image_url)
+        if self.role == "user":
+            return [{"role": "user", "content": [{"type": "text", "text": msg.content}, image_part]}]
+        # Assistant messages are always text (OpenAI limitation), so the
+        # generated image is passed back as a user message
+        return self.text_only + [{
+            "role": "user",
+            "content": [{"type": "text", "text": ASSISTANT_IMAGE_REFERENCE_TEXT}, image_part]
+        }]
+
+_encoded_messages = _LRUCache(MESSAGE_CACHE_MAX_ENTRIES)
+
+def _message_key(msg: ChatMessage) -> Tuple:
+    # Client-side placeholders keep their ID while the content changes, so include the content
+    return (msg.message_id, msg.role, hash(msg.content), msg.image_url)
+
+def encode_message(msg: ChatMessage) -> EncodedMessage:
+    """Memoized OpenAI encoding and token count of a history message"""
+    key = _message_key(msg) if msg.message_id else None
+    if key is not None:
+        cached = _encoded_messages.get(key)
+        if cached is not None:
+            return cached
+    role = "user" if msg.role == "user" else "assistant"
+    encoded = EncodedMessage(
+        role,
+        [{"role": role, "content": msg.content}],
+        count_tokens(msg.content) + TOKENS_PER_MESSAGE,
+        bool(msg.image_url)
+    )
+    if key is not None:
+        _encoded_messages.set(key, encoded)
+    return encoded
+
+def build_history_messages(history: List[ChatMessage], budget: int = CHAT_HISTORY_TOKEN_BUDGET) -> List[dict]:
+    """
+    Pack the newest history messages into `budget` tokens, oldest first in the result.
+    Images are attached for the most recent image-bearing messages (up to
+    CHAT_HISTORY_MAX_IMAGES) while they fit the budget.
+    """
+    selected: List[List[dict]] = []
+    used_tokens = 0
+    images_added = 0
+    for msg in reversed(history or []):
+        encoded = encode_message(msg)
+        if encoded.has_image and images_added < CHAT_HISTORY_MAX_IMAGES and used_tokens + encoded.image_tokens <= budget:
+            selected.append(encoded.with_image(msg))
+            used_tokens += encoded.image_tokens
+            images_added += 1
+        elif used_tokens + encoded.text_tokens <= budget:
+            selected.append(encoded.text_only)
+            used_tokens += encoded.text_tokens
+        else:
+            break
+
+    messages = [m for group in reversed(selected) for m in group]
+    logger.info(f"📜 Packed {len(selected)}/{len(history or [])} history messages into {used_tokens}/{budget} tokens ({images_added} image(s))")
+    return messages
+
+def get_history_cache_stats() -> Dict[str, Any]:
+    return {
+        "messages": _encoded_messages.get_stats(),
+        "image_sources": _image_sources.get_stats(),
+        "tokenizer": "tiktoken" if tiktoken is not None else "estimate"
+    }
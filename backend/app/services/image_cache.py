@@ -0,0 +1,156 @@
+# backend/app/services/image_cache.py
+"""
+Process-wide in-memory cache of stored image bytes.
+
+Chat context images, edit sources and masks, derivative generation and dataset
+copies read the same few images over and over; image_cache.read(path) serves them
+from memory within IMAGE_CACHE_MAX_BYTES. Eviction is LRU. With the default
+"tinylfu" admission policy, a count-min sketch estimates how often each path was
+read recently, and a new image only displaces the least recently used entries if
+it was read more often than they were, so one-off reads (a dataset export, a run
+of background normalizations) don't flush the images in active use.
+
+Stored files are content-addressed and never rewritten, but the image store calls
+invalidate() for every file it deletes or moves, so bytes of a removed file are
+never served.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.services.image_store import image_store
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Larger files are read from disk every time instead of taking a big share of the budget
+IMAGE_CACHE_MAX_ITEM_BYTES = int(os.getenv("IMAGE_CACHE_MAX_ITEM_BYTES", str(8 * 1024 * 1024)))
+# "tinylfu" (frequency-based admission) or "lru" (admit everything)
+IMAGE_CACHE_POLICY = os.getenv("IMAGE_CACHE_POLICY", "tinylfu").lower()
+
+class FrequencySketch:
+    """
+    Count-min sketch of recent read counts (4-bit counters). All counters are halved
+    every sample_size increments, so old popularity fades.
+    """
+
+    DEPTH = 4
+    MAX_COUNT = 15
+
+    def __init__(self, width: int = 4096):
+        self.width = width
+        self.sample_size = 10 * width
+        self.additions = 0
+        self._rows: List[List[int]] = [[0] * width for _ in range(self.DEPTH)]
+
+    def _slots(self, key: str):
+        return [hash((seed, key)) % self.width for seed in range(self.DEPTH)]
+
+    def increment(self, key: str):
+        for row, slot in zip(self._rows, self._slots(key)):
+            if row[slot] < self.MAX_COUNT:
+                row[slot] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            for row in self._rows:
+                row[:] = [count >> 1 for count in row]
+            self.additions //= 2
+
+    def estimate(self, key: str) -> int:
+        return min(row[slot] for row, slot in zip(self._rows, self._slots(key)))
+
+class ImageByteCache:
+    """Thread-safe byte-budgeted LRU of file contents keyed by path, with optional TinyLFU admission"""
+
+    def __init__(self, max_bytes: int, max_item_bytes: int, policy: str = "tinylfu"):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = min(max_item_bytes, max_bytes)
+        self.policy = policy
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+        self.invalidations = 0
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._sketch = FrequencySketch()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[bytes]:
+        with self._lock:
+            self._sketch.increment(path)
+            data = self._data.get(path)
+            if data is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(path)
+            self.hits += 1
+            return data
+
+    def read(self, path: str) -> bytes:
+        """Contents of a stored file, from memory when possible"""
+        data = self.get(path)
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+            self.put(path, data)
+        return data
+
+    def put(self, path: str, data: bytes) -> bool:
+        """Cache data for path if it fits and the admission policy accepts it"""
+        if self.max_bytes <= 0 or len(data) > self.max_item_bytes:
+            return False
+        with self._lock:
+            if path in self._data:
+                self._data.move_to_end(path)
+                return True
+            victims, freed = [], 0
+            for victim in self._data:
+                if self.size - freed + len(data) <= self.max_bytes:
+                    break
+                victims.append(victim)
+                freed += len(self._data[victim])
+            if victims and self.policy == "tinylfu":
+                candidate = self._sketch.estimate(path)
+                if any(self._sketch.estimate(victim) >= candidate for victim in victims):
+                    self.rejected += 1
+                    return False
+            for victim in victims:
+                self.size -= len(self._data.pop(victim))
+            self.evictions += len(victims)
+            self._data[path] = data
+            self.size += len(data)
+            return True
+
+    def invalidate(self, path: str):
+        with self._lock:
+            data = self._data.pop(path, None)
+            if data is not None:
+                self.size -= len(data)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "policy": self.policy,
+            "entries": len(self._data),
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+            "invalidations": self.invalidations,
+        }
+
+# Global instance
+image_cache = ImageByteCache(IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_MAX_ITEM_BYTES, IMAGE_CACHE_POLICY)
+image_store.on_remove(image_cache.invalidate)
@@ -0,0 +1,356 @@
+# backend/app/services/image_job_service.py
+"""
+Asynchronous image generation jobs.
+
+POST /image/jobs queues a job and returns its ID right away; a bounded pool of
+workers runs the OpenAI call outside the HTTP request. Job state, partial images
+and the final image URL are persisted under CACHE_DIR/jobs/{job_id} so clients can
+poll GET /image/jobs/{job_id} or subscribe to its events, even after reconnecting.
+Partial images are deleted once the job finishes (the final image is in the image
+store), and a job's whole directory once it expires (IMAGE_JOB_MEMORY_SECONDS).
+Concurrency is limited globally (IMAGE_JOB_WORKERS) and per user
+(IMAGE_JOB_PER_USER_LIMIT); queue depth and wait times are tracked for monitoring.
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set
+
+from app.clients.image_scheduler import PRIORITY_BACKGROUND
+from app.clients.retry_policy import deadline_scope
+from app.schemas.chat import ChatRequest
+from app.services.image_service import get_image_response_stream_async
+from app.services.image_storage_service import store_metadata
+from app.services.image_store import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+IMAGE_JOB_WORKERS = int(os.getenv("IMAGE_JOB_WORKERS", "4"))
+IMAGE_JOB_PER_USER_LIMIT = int(os.getenv("IMAGE_JOB_PER_USER_LIMIT", "1"))
+IMAGE_JOB_MAX_QUEUE = int(os.getenv("IMAGE_JOB_MAX_QUEUE", "100"))
+# Finished jobs are forgotten after this long: dropped from memory and their directory deleted
+IMAGE_JOB_MEMORY_SECONDS = int(os.getenv("IMAGE_JOB_MEMORY_SECONDS", "3600"))
+JOBS_DIR = os.path.join(CACHE_DIR, "jobs")
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+class QueueFullError(Exception):
+    """Too many jobs are waiting already"""
+
+class ImageJob:
+    """One queued image generation and everything a client needs to follow it"""
+
+    def __init__(self, job_id: str, prompt: str, user_id: Optional[str] = None,
+                 layout_image: Optional[bytes] = None, layout_info: Optional[Dict] = None,
+                 metadata: Optional[Dict] = None):
+        self.job_id = job_id
+        self.prompt = prompt
+        self.user_id = user_id
+        self.layout_image = layout_image
+        self.layout_info = layout_info or {}
+        self.metadata = metadata or {}
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.image_url: Optional[str] = None
+        self.error: Optional[str] = None
+        self.partials: List[str] = []  # base64 partial images, in memory while the job runs
+        self.partial_count = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def limit_key(self) -> str:
+        # Jobs without a user only count against the global limit
+        return self.user_id or self.job_id
+
+    def notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_for_change(self, timeout: float) -> bool:
+        changed = self._changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "user_id": self.user_id,
+            "status": self.status,
+            "prompt": self.prompt,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "image_url": self.image_url,
+            "error": self.error,
+            "partial_count": self.partial_count,
+        }
+
+def _job_dir(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, job_id)
+
+def _persist_job(state: Dict[str, Any]):
+    job_dir = _job_dir(state["job_id"])
+    os.makedirs(job_dir, exist_ok=True)
+    tmp_path = os.path.join(job_dir, "job.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(job_dir, "job.json"))
+
+def _persist_partial(job_id: str, index: int, image_b64: str):
+    job_dir = _job_dir(job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    with open(os.path.join(job_dir, f"partial_{index}.png"), "wb") as f:
+        f.write(base64.b64decode(image_b64))
+
+def _remove_partials(job_id: str):
+    job_dir = _job_dir(job_id)
+    if not os.path.isdir(job_dir):
+        return
+    for name in os.listdir(job_dir):
+        if name.startswith("partial_"):
+            os.remove(os.path.join(job_dir, name))
+
+def _remove_expired_job_dirs(pruned: List[str], active: Set[str], cutoff: float):
+    """Delete directories of pruned jobs, and of jobs from earlier server runs last updated before cutoff"""
+    for job_id in pruned:
+        shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+    if not os.path.isdir(JOBS_DIR):
+        return
+    for entry in os.scandir(JOBS_DIR):
+        if entry.is_dir() and entry.name not in active and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def _load_persisted_job(job_id: str) -> Optional[Dict[str, Any]]:
+    if not job_id.isalnum():
+        return None
+    path = os.path.join(_job_dir(job_id), "job.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _image_id_from_url(image_url: str) -> str:
+    image_id = image_url.rsplit("/", 1)[-1]
+    return image_id.split("?")[0].split("#")[0]
+
+class ImageJobQueue:
+    """Bounded worker pool with global and per-user concurrency limits"""
+
+    def __init__(self, workers: int, per_user_limit: int, max_queue: int):
+        self.workers = workers
+        self.per_user_limit = per_user_limit
+        self.max_queue = max_queue
+        self.jobs: Dict[str, ImageJob] = {}
+        self.pending: Deque[ImageJob] = deque()
+        self.running: Dict[str, int] = {}  # limit key -> running jobs
+        self._condition: Optional[asyncio.Condition] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self.wait_times: Deque[float] = deque(maxlen=500)
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+
+    def _ensure_workers(self):
+        # Workers live on the server's event loop, so they are started on first use
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        if not self._worker_tasks:
+            self._worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+            logger.info(f"👷 Started {self.workers} image job workers")
+
+    async def _prune(self):
+        cutoff = time.time() - IMAGE_JOB_MEMORY_SECONDS
+        pruned = []
+        for job_id, job in list(self.jobs.items()):
+            if job.status in FINISHED_STATUSES and job.finished_at < cutoff:
+                del self.jobs[job_id]
+                pruned.append(job_id)
+        await asyncio.to_thread(_remove_expired_job_dirs, pruned, set(self.jobs), cutoff)
+
+    async def submit(self, job: ImageJob) -> ImageJob:
+        self._ensure_workers()
+        await self._prune()
+        if len(self.pending) >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise QueueFullError(f"Image job queue is full ({self.max_queue} waiting)")
+        self.jobs[job.job_id] = job
+        self.counters["submitted"] += 1
+        await asyncio.to_thread(_persist_job, job.to_dict())
+        async with self._condition:
+            self.pending.append(job)
+            self._condition.notify_all()
+        logger.info(f"📥 Queued image job {job.job_id} (user {job.user_id}, {len(self.pending)} waiting)")
+        return job
+
+    def _next_runnable(self) -> Optional[ImageJob]:
+        for job in self.pending:
+            if self.running.get(job.limit_key, 0) < self.per_user_limit:
+                self.pending.remove(job)
+                return job
+        return None
+
+    async def _worker(self, worker_id: int):
+        while True:
+            async with self._condition:
+                job = self._next_runnable()
+                while job is None:
+                    await self._condition.wait()
+                    job = self._next_runnable()
+                self.running[job.limit_key] = self.running.get(job.limit_key, 0) + 1
+            try:
+                # The job runs in its own task so cancelling it leaves the worker alive.
+                # It is not bound to the deadline of the request that started the workers.
+                with deadline_scope(None):
+                    job.task = asyncio.create_task(self._run(job))
+                await asyncio.wait([job.task])
+                if job.task.cancelled() and job.status not in FINISHED_STATUSES:
+                    await self._finish(job, "cancelled", error="Cancelled")
+                elif not job.task.cancelled() and job.task.exception() is not None:
+                    error = job.task.exception()
+                    logger.error(f"❌ Image job {job.job_id} crashed: {type(error).__name__}: {error}")
+                    await self._finish(job, "failed", error=str(error))
+            finally:
+                job.task = None
+                async with self._condition:
+                    self.running[job.limit_key] -= 1
+                    if not self.running[job.limit_key]:
+                        del self.running[job.limit_key]
+                    self._condition.notify_all()
+
+    async def _run(self, job: ImageJob):
+        job.status = "running"
+        job.started_at = time.time()
+        self.wait_times.append(job.started_at - job.created_at)
+        job.notify()
+        await asyncio.to_thread(_persist_job, job.to_dict())
+        logger.info(f"🎨 Running image job {job.job_id} (waited {job.started_at - job.created_at:.1f}s)")
+
+        request = ChatRequest(user_input=job.prompt, user_image=job.layout_image, conversation_history=[],
+                              user_id=job.user_id)
+        async for event in get_image_response_stream_async(request, PRIORITY_BACKGROUND):
+            if event['type'] == 'partial_image':
+                job.partials.append(event['image_b64'])
+                job.partial_count += 1
+                job.notify()
+                await asyncio.to_thread(_persist_partial, job.job_id, event['index'], event['image_b64'])
+            elif event['type'] == 'completed':
+                job.image_url = event['image_url']
+                image_id = _image_id_from_url(job.image_url)
+                await asyncio.to_thread(store_metadata, image_id, {
+                    "timestamp": datetime.now().isoformat(),
+                    "prompt": job.prompt,
+                    "layout_info": job.layout_info,
+                    "image_id": image_id,
+                    "image_url": job.image_url,
+                    "job_id": job.job_id,
+                    **job.metadata
+                })
+                await self._finish(job, "completed")
+                return
+            elif event['type'] == 'error':
+                await self._finish(job, "failed", error=event['message'])
+                return
+        await self._finish(job, "failed", error="Image generation ended without a result")
+
+    async def _finish(self, job: ImageJob, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        job.partials = []
+        job.layout_image = None
+        self.counters[status] += 1
+        job.notify()
+        await asyncio.to_thread(_persist_job, job.to_dict())
+        # Partials only matter while the job runs; a completed job's image is in the image store
+        await asyncio.to_thread(_remove_partials, job.job_id)
+        logger.info(f"🏁 Image job {job.job_id} {status} after {job.finished_at - job.created_at:.1f}s")
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; False if it already finished"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED_STATUSES:
+            return False
+        if job.status == "queued":
+            async with self._condition:
+                if job in self.pending:
+                    self.pending.remove(job)
+            await self._finish(job, "cancelled", error="Cancelled")
+        elif job.task is not None:
+            job.task.cancel()
+        return True
+
+    def get_job(self, job_id: str) -> Optional[ImageJob]:
+        return self.jobs.get(job_id)
+
+    def get_state(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job state from memory, or from disk for jobs of an earlier server run"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            state = job.to_dict()
+            if job.status == "queued":
+                state["queue_position"] = list(self.pending).index(job) + 1 if job in self.pending else 0
+            return state
+        state = _load_persisted_job(job_id)
+        if state and state["status"] not in FINISHED_STATUSES:
+            # The server restarted while the job was waiting or running
+            state["status"] = "failed"
+            state["error"] = "Interrupted by server restart"
+        return state
+
+    def get_stats(self) -> Dict[str, Any]:
+        waits = sorted(self.wait_times)
+        return {
+            **self.counters,
+            "queue_depth": len(self.pending),
+            "running": sum(self.running.values()),
+            "workers": self.workers,
+            "per_user_limit": self.per_user_limit,
+            "wait_seconds_avg": sum(waits) / len(waits) if waits else 0.0,
+            "wait_seconds_p95": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+            "wait_seconds_max": waits[-1] if waits else 0.0,
+        }
+
+# Global instance
+image_job_queue = ImageJobQueue(IMAGE_JOB_WORKERS, IMAGE_JOB_PER_USER_LIMIT, IMAGE_JOB_MAX_QUEUE)
+
+def create_image_job(prompt: str, user_id: Optional[str] = None, layout_image: Optional[bytes] = None,
+                     layout_info: Optional[Dict] = None, metadata: Optional[Dict] = None) -> ImageJob:
+    return ImageJob(uuid.uuid4().hex, prompt, user_id, layout_image, layout_info, metadata)
+
+async def follow_job(job_id: str, poll_seconds: float = 15.0) -> AsyncIterator[Dict[str, Any]]:
+    """Yield status, partial image and final events of a job until it finishes"""
+    sent_status = None
+    sent_partials = 0
+    while True:
+        job = image_job_queue.get_job(job_id)
+        state = image_job_queue.get_state(job_id)
+        if state is None:
+            yield {'type': 'error', 'message': 'Job not found'}
+            return
+        if state["status"] != sent_status:
+            sent_status = state["status"]
+            yield {'type': 'status', 'status': sent_status, 'queue_position': state.get("queue_position")}
+        if job is not None:
+            for index, image_b64 in enumerate(job.partials[sent_partials:], start=sent_partials):
+                yield {'type': 'partial_image', 'index': index, 'image_b64': image_b64}
+            sent_partials = max(sent_partials, len(job.partials))
+        if state["status"] == "completed":
+            yield {'type': 'completed', 'job_id': job_id, 'image_url': state["image_url"]}
+            yield {'type': 'done'}
+            return
+        if state["status"] in FINISHED_STATUSES:
+            yield {'type': 'error', 'job_id': job_id, 'message': state.get("error") or state["status"]}
+            yield {'type': 'done'}
+            return
+        await job.wait_for_change(poll_seconds)
@@ -1,7 +1,10 @@
 # backend/app/services/image_modification_service.py
-from app.clients.openai_client import client
+from app.clients.openai_client import iterate_sync
+from app.clients.image_scheduler import image_scheduler, PRIORITY_INTERACTIVE_EDIT
 from app.schemas.chat import ChatRequest, ImageRegion
 from app.services.image_storage_service import store_image
+from app.tracing import traced
+import asyncio
 import logging
 import base64
 import requests
@@ -12,6 +15,7 @@ import os
 
 logger = logging.getLogger(__name__)
 
+@traced("image_decode")
 def download_image_as_bytes(image_url: str) -> bytes:
     """Download image from URL and return as PNG bytes"""
     import time
@@ -27,15 +31,15 @@ def download_image_as_bytes(image_url: str) -> bytes:
             download_time = time.perf_counter() - download_start
             logger.info(f"   ⏱️ Base64 decode: {download_time:.3f}s")
         elif image_url.startswith('/images/'):
-            # Backend URL - read directly from file system (much faster than HTTP)
+            # Backend URL - read from the shared image cache / file system (much faster than HTTP)
+            from app.services.image_cache import image_cache
             from app.services.image_storage_service import get_image_path
             image_id = image_url.replace('/images/', '')
             logger.info(f"📂 [download_image] Reading from local storage: {image_id[:20]}...")
             image_path = get_image_path(image_id)
             if not image_path:
                 raise ValueError(f"Image not found in local storage: {image_id}")
-            with open(image_path, 'rb') as f:
-                image_bytes = f.read()
+            image_bytes = image_cache.read(image_path)
             download_time = time.perf_counter() - download_start
             logger.info(f"   ⏱️ File read: {download_time:.3f}s ({len(image_bytes)/1024:.1f} KB)")
         else:
@@ -92,7 +96,7 @@ def download_image_as_bytes(image_url: str) -> bytes:
 
 def process_mask_data(mask_data: str, target_size: tuple = (1024, 1024)) -> bytes:
     """
-    Process mask data from frontend (base64) and return as PNG bytes.
+    Process mask data from frontend (base64, or a /images/ URL of an uploaded mask) and return as PNG bytes.
     
     Frontend sends: White = brushed (to edit), Black = unbrushed (to preserve)
     OpenAI needs: Transparent (alpha=0) = area to edit, Opaque (alpha=255) = area to preserve
@@ -110,6 +114,14 @@ def process_mask_data(mask_data: str, target_size: tuple = (1024, 1024)) -> byte
             logger.info("   🔓 Decoding data URL format...")
             _, encoded = mask_data.split(',', 1)
             mask_bytes = base64.b64decode(encoded)
+        elif mask_data.startswith('/images/'):
+            logger.info("   📂 Reading uploaded mask from local storage...")
+            from app.services.image_cache import image_cache
+            from app.services.image_storage_service import get_image_path
+            mask_path = get_image_path(mask_data.replace('/images/', '', 1))
+            if not mask_path:
+                raise ValueError(f"Mask not found in local storage: {mask_data}")
+            mask_bytes = image_cache.read(mask_path)
         else:
             logger.info("   🔓 Decoding raw base64...")
             mask_bytes = base64.b64decode(mask_data)
@@ -176,10 +188,42 @@ def process_mask_data(mask_data: str, target_size: tuple = (1024, 1024)) -> byte
         logger.error(f"❌ [process_mask_data] Failed after {total_time:.3f}s: {type(e).__name__}: {e}")
         raise e
 
-def edit_image_region_stream(request: ChatRequest):
+@traced("image_decode")
+def _prepare_edit_image(image_bytes: bytes, target_size: tuple) -> bytes:
+    """Resize to the edit size and flatten to RGB PNG"""
+    img = Image.open(BytesIO(image_bytes))
+    
+    if img.size != target_size:
+        img = img.resize(target_size, Image.Resampling.LANCZOS)
+    if img.mode != 'RGB':
+        if img.mode in ('RGBA', 'LA', 'P'):
+            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+            img = rgb_img
+        else:
+            img = img.convert('RGB')
+    
+    image_output = BytesIO()
+    img.save(image_output, format='PNG')
+    return image_output.getvalue()
+
+@traced("image_decode")
+def _prepare_edit_mask(mask_data: str, target_size: tuple) -> bytes:
+    """Process the brush mask, or use a fully transparent mask (edit everything)"""
+    if mask_data:
+        return process_mask_data(mask_data, target_size)
+    mask = Image.new('RGBA', target_size, (0, 0, 0, 0))
+    output = BytesIO()
+    mask.save(output, format='PNG')
+    return output.getvalue()
+
+async def edit_image_region_stream_async(request: ChatRequest):
     """
     Stream image editing with status updates and partial images (if supported).
-    Yields status messages and partial/final images.
+    Yields status messages and partial/final images. Cancelling the consumer
+    closes the upstream OpenAI stream.
     """
     import time
     total_start = time.perf_counter()
@@ -195,139 +239,97 @@ def edit_image_region_stream(request: ChatRequest):
         # STEP 1: Download image
         yield {'type': 'status', 'message': 'Getting started...'}
         yield {'type': 'status', 'message': 'Preparing image...'}
-        
-        image_start = time.perf_counter()
-        image_bytes = download_image_as_bytes(image_region.image_url)
-        image_download_time = time.perf_counter() - image_start
+        image_bytes = await asyncio.to_thread(download_image_as_bytes, image_region.image_url)
         
         # STEP 2: Process image
         yield {'type': 'status', 'message': 'Processing image...'}
-        process_start = time.perf_counter()
         target_size = (1024, 1024)
-        img = Image.open(BytesIO(image_bytes))
-        
-        if img.size != target_size:
-            img = img.resize(target_size, Image.Resampling.LANCZOS)
-        if img.mode != 'RGB':
-            if img.mode in ('RGBA', 'LA', 'P'):
-                rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = rgb_img
-            else:
-                img = img.convert('RGB')
-        
-        image_output = BytesIO()
-        img.save(image_output, format='PNG')
-        image_bytes = image_output.getvalue()
-        process_time = time.perf_counter() - process_start
+        image_bytes = await asyncio.to_thread(_prepare_edit_image, image_bytes, target_size)
         
         # STEP 3: Process mask
         yield {'type': 'status', 'message': 'Processing mask...'}
-        mask_start = time.perf_counter()
-        if image_region.mask_data:
-            mask_bytes = process_mask_data(image_region.mask_data, target_size)
-        else:
-            mask = Image.new('RGBA', target_size, (0, 0, 0, 0))
-            output = BytesIO()
-            mask.save(output, format='PNG')
-            mask_bytes = output.getvalue()
-        mask_time = time.perf_counter() - mask_start
+        mask_bytes = await asyncio.to_thread(_prepare_edit_mask, image_region.mask_data, target_size)
         
         # STEP 4: Build prompt
         prompt = f"""Modify the selected region of the image according to the user's request: {request.user_input}
 
 Ensure the modification is mathematically accurate and pedagogically clear for primary-level math education."""
         
-        # STEP 5: Create temp files
+        # STEP 5: Call OpenAI API (try streaming, fallback to regular)
         yield {'type': 'status', 'message': 'Generating image, may take a moment...'}
-        image_temp_path = None
-        mask_temp_path = None
-        
+        image_file = BytesIO(image_bytes)
+        image_file.name = "image.png"
+        mask_file = BytesIO(mask_bytes)
+        mask_file.name = "mask.png"
         try:
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as image_temp:
-                image_temp.write(image_bytes)
-                image_temp_path = image_temp.name
+            # Try streaming first
+            response_stream = await image_scheduler.call(
+                "edit", user_id=request.user_id, priority=PRIORITY_INTERACTIVE_EDIT,
+                model="gpt-image-1",
+                image=image_file,
+                mask=mask_file,
+                prompt=prompt,
+                n=1,
+                size="1024x1024",
+                stream=True,
+                partial_images=2
+            )
             
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as mask_temp:
-                mask_temp.write(mask_bytes)
-                mask_temp_path = mask_temp.name
+            # Process streaming events
+            async for event in response_stream:
+                event_type = getattr(event, 'type', None)
+                if event_type == "image_generation.partial_image" or event_type == "image_edit.partial_image":
+                    partial_b64 = getattr(event, 'b64_json', None)
+                    partial_idx = getattr(event, 'partial_image_index', None)
+                    if partial_b64:
+                        yield {
+                            'type': 'partial_image',
+                            'index': partial_idx or 0,
+                            'image_b64': partial_b64
+                        }
+                elif event_type == "image_generation.completed" or event_type == "image_edit.completed":
+                    final_b64 = getattr(event, 'b64_json', None)
+                    if final_b64:
+                        data_url = f"data:image/png;base64,{final_b64}"
+                        backend_url = await asyncio.to_thread(store_image, data_url)
+                        logger.info(f"✅ [edit_image_region_stream] Completed in {time.perf_counter() - total_start:.1f}s")
+                        yield {'type': 'completed', 'image_url': backend_url}
+                        break
+        except (TypeError, AttributeError) as e:
+            # Streaming not supported, use regular API
+            logger.info("   ⚠️ Streaming not supported, using regular images.edit API")
+            image_file.seek(0)
+            mask_file.seek(0)
+            response = await image_scheduler.call(
+                "edit", user_id=request.user_id, priority=PRIORITY_INTERACTIVE_EDIT,
+                model="gpt-image-1",
+                image=image_file,
+                mask=mask_file,
+                prompt=prompt,
+                n=1,
+                size="1024x1024"
+            )
             
-            # STEP 6: Call OpenAI API (try streaming, fallback to regular)
-            with open(image_temp_path, 'rb') as image_file, open(mask_temp_path, 'rb') as mask_file:
-                api_start = time.perf_counter()
-                try:
-                    # Try streaming first
-                    response_stream = client.images.edit(
-                        model="gpt-image-1",
-                        image=image_file,
-                        mask=mask_file,
-                        prompt=prompt,
-                        n=1,
-                        size="1024x1024",
-                        stream=True,
-                        partial_images=2
-                    )
-                    
-                    # Process streaming events
-                    for event in response_stream:
-                        event_type = getattr(event, 'type', None)
-                        if event_type == "image_generation.partial_image" or event_type == "image_edit.partial_image":
-                            partial_b64 = getattr(event, 'b64_json', None)
-                            partial_idx = getattr(event, 'partial_image_index', None)
-                            if partial_b64:
-                                yield {
-                                    'type': 'partial_image',
-                                    'index': partial_idx or 0,
-                                    'image_b64': partial_b64
-                                }
-                        elif event_type == "image_generation.completed" or event_type == "image_edit.completed":
-                            final_b64 = getattr(event, 'b64_json', None)
-                            if final_b64:
-                                data_url = f"data:image/png;base64,{final_b64}"
-                                backend_url = store_image(data_url)
-                                yield {'type': 'completed', 'image_url': backend_url}
-                                break
-                except (TypeError, AttributeError) as e:
-                    # Streaming not supported, use regular API
-                    logger.info("   ⚠️ Streaming not supported, using regular images.edit API")
-                    image_file.seek(0)
-                    mask_file.seek(0)
-                    response = client.images.edit(
-                        model="gpt-image-1",
-                        image=image_file,
-                        mask=mask_file,
-                        prompt=prompt,
-                        n=1,
-                        size="1024x1024"
-                    )
-                    
-                    # Process regular response
-                    if response.data and len(response.data) > 0:
-                        image_data = response.data[0]
-                        
-                        if hasattr(image_data, 'url') and image_data.url:
-                            backend_url = store_image(image_data.url)
-                            yield {'type': 'completed', 'image_url': backend_url}
-                        elif hasattr(image_data, 'b64_json') and image_data.b64_json:
-                            data_url = f"data:image/png;base64,{image_data.b64_json}"
-                            backend_url = store_image(data_url)
-                            yield {'type': 'completed', 'image_url': backend_url}
-        finally:
-            # Cleanup
-            try:
-                if image_temp_path and os.path.exists(image_temp_path):
-                    os.unlink(image_temp_path)
-                if mask_temp_path and os.path.exists(mask_temp_path):
-                    os.unlink(mask_temp_path)
-            except Exception:
-                pass
+            # Process regular response
+            if response.data and len(response.data) > 0:
+                image_data = response.data[0]
+                
+                if hasattr(image_data, 'url') and image_data.url:
+                    backend_url = await asyncio.to_thread(store_image, image_data.url)
+                    yield {'type': 'completed', 'image_url': backend_url}
+                elif hasattr(image_data, 'b64_json') and image_data.b64_json:
+                    data_url = f"data:image/png;base64,{image_data.b64_json}"
+                    backend_url = await asyncio.to_thread(store_image, data_url)
+                    yield {'type': 'completed', 'image_url': backend_url}
                 
     except Exception as e:
         logger.error(f"❌ Streaming image editing failed: {type(e).__name__}: {e}")
         yield {'type': 'error', 'message': str(e)}
 
+def edit_image_region_stream(request: ChatRequest):
+    """Synchronous adapter around edit_image_region_stream_async."""
+    return iterate_sync(edit_image_region_stream_async(request))
+
 def edit_image_region(request: ChatRequest) -> str:
     """
     Edit image region using OpenAI images.edit API.
@@ -484,7 +486,8 @@ Ensure the modification is mathematically accurate and pedagogically clear for p
                     # Try streaming for image editing (if supported)
                     # Note: images.edit might not support streaming, but we'll try
                     try:
-                        response = client.images.edit(
+                        response = image_scheduler.call_sync(
+                            "edit", user_id=request.user_id, priority=PRIORITY_INTERACTIVE_EDIT,
                             model="gpt-image-1",
                             image=image_file,
                             mask=mask_file,
@@ -506,7 +509,8 @@ Ensure the modification is mathematically accurate and pedagogically clear for p
                     except TypeError:
                         # Streaming not supported, use regular API
                         logger.info("   ⚠️ Streaming not supported for images.edit, using regular API")
-                        response = client.images.edit(
+                        response = image_scheduler.call_sync(
+                            "edit", user_id=request.user_id, priority=PRIORITY_INTERACTIVE_EDIT,
                             model="gpt-image-1",
                             image=image_file,
                             mask=mask_file,
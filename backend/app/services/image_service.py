@@ -1,14 +1,17 @@
 # backend/app/services/image_service.py
-from app.clients.openai_client import client
+from app.clients.openai_client import run_sync, iterate_sync
+from app.clients.image_scheduler import image_scheduler, PRIORITY_GENERATION
 from app.schemas.chat import ChatRequest
 from app.services.image_storage_service import store_image
+from app.logging_config import log_payload
+import asyncio
 import logging
 import base64
 import io
 
 logger = logging.getLogger(__name__)
 
-def get_image_response(request: ChatRequest) -> str:
+async def get_image_response_async(request: ChatRequest, priority: str = PRIORITY_GENERATION) -> str:
     """Generate image using GPT-4o-image"""
     logger.info("🎨 Starting image generation...")
     logger.info(f"🔍 DEBUG: Full user input for image generation: '{request.user_input}'")
@@ -57,18 +60,14 @@ Create a detailed, mathematically precise visual illustration. The image should:
 
 Generate the visualization now:"""
         
-        # LOG THE COMPLETE PROMPT FOR DEBUGGING
-        logger.info("=" * 80)
-        logger.info("📋 COMPLETE PROMPT BEING SENT TO GPT:")
-        logger.info("=" * 80)
-        logger.info(prompt)
-        logger.info("=" * 80)
-        logger.info(f"📏 Prompt length: {len(prompt)} characters")
+        # Preview and hash only; the full prompt goes to the payload debug sink
+        log_payload(logger, "📋 Image prompt", prompt)
         logger.info(f"🤖 DEBUG: Using model 'gpt-image-1.5' for image generation...")
         logger.info("🚀 CALLING OPENAI IMAGES.GENERATE API NOW (with streaming)")
         
         # Use streaming API with partial images for better UX
-        response = client.images.generate(
+        response = await image_scheduler.call(
+            "generate", user_id=request.user_id, priority=priority,
             model="gpt-image-1.5",
             prompt=prompt,
             n=1,
@@ -84,7 +83,7 @@ Generate the visualization now:"""
         logger.info("🌊 Processing streaming image generation...")
         partial_count = 0
         event_count = 0
-        for event in response:
+        async for event in response:
             event_count += 1
             event_type = getattr(event, 'type', None)
             logger.info(f"📦 Event #{event_count} type: {event_type}")
@@ -134,7 +133,7 @@ Generate the visualization now:"""
             data_url = f"data:image/png;base64,{final_image_base64}"
             logger.info(f"✅ Image generated successfully (base64 format): {len(final_image_base64)} chars")
             # Store the base64 image locally and return our backend URL
-            backend_url = store_image(data_url)
+            backend_url = await asyncio.to_thread(store_image, data_url)
             logger.info(f"🔗 Stored base64 image, returning backend URL: {backend_url}")
             return backend_url
         else:
@@ -160,7 +159,7 @@ Generate the visualization now:"""
         # Re-raise the exception so the route handler can catch it properly
         raise
 
-def get_image_response_stream(request: ChatRequest):
+async def get_image_response_stream_async(request: ChatRequest, priority: str = PRIORITY_GENERATION):
     """
     Stream image generation with partial images for better UX.
     Yields partial images and final image as they arrive.
@@ -225,13 +224,8 @@ Follow the layout specification and generation guidelines above to create the ed
     else:
         enhanced_prompt = prompt
     
-    # LOG THE COMPLETE PROMPT ONCE (only for debugging)
-    logger.info("=" * 80)
-    logger.info("📋 COMPLETE PROMPT BEING SENT TO GPT:")
-    logger.info("=" * 80)
-    logger.info(enhanced_prompt)
-    logger.info("=" * 80)
-    logger.info(f"📏 Prompt length: {len(enhanced_prompt)} characters")
+    # Preview and hash only; the full prompt goes to the payload debug sink
+    log_payload(logger, "📋 Image prompt", enhanced_prompt)
     logger.info(f"🖼️ Has layout image: {has_layout_image} ({len(request.user_image) if has_layout_image else 0} bytes)")
     logger.info(f"🌊 Streaming: True")
     
@@ -245,7 +239,8 @@ Follow the layout specification and generation guidelines above to create the ed
             logger.info(f"🖼️ Calling images.edit() API...")
             
             try:
-                response = client.images.edit(
+                response = await image_scheduler.call(
+                    "edit", user_id=request.user_id, priority=priority,
                     model="gpt-image-1.5",
                     image=image_file,
                     prompt=enhanced_prompt,
@@ -261,7 +256,8 @@ Follow the layout specification and generation guidelines above to create the ed
                 # Reset file pointer
                 image_file.seek(0)
                 # Try non-streaming API
-                response = client.images.edit(
+                response = await image_scheduler.call(
+                    "edit", user_id=request.user_id, priority=priority,
                     model="gpt-image-1.5",
                     image=image_file,
                     prompt=enhanced_prompt,
@@ -276,7 +272,7 @@ Follow the layout specification and generation guidelines above to create the ed
                         logger.info("📸 Got image from non-streaming response (b64_json)")
                         final_b64 = image_data.b64_json
                         data_url = f"data:image/png;base64,{final_b64}"
-                        backend_url = store_image(data_url)
+                        backend_url = await asyncio.to_thread(store_image, data_url)
                         yield {
                             'type': 'completed',
                             'image_url': backend_url
@@ -298,13 +294,9 @@ Follow the layout specification and generation guidelines above to create the ed
         else:
             # Use images.generate() for text-to-image generation
             logger.info(f"📝 Calling images.generate() API...")
-            logger.info("=" * 80)
-            logger.info("📋 FINAL PROMPT SENT TO images.generate() API:")
-            logger.info("=" * 80)
-            logger.info(enhanced_prompt)
-            logger.info("=" * 80)
             
-            response = client.images.generate(
+            response = await image_scheduler.call(
+                "generate", user_id=request.user_id, priority=priority,
                 model="gpt-image-1.5",
                 prompt=enhanced_prompt,
                 n=1,
@@ -318,7 +310,7 @@ Follow the layout specification and generation guidelines above to create the ed
         partial_count = 0
         event_count = 0
         
-        for event in response:
+        async for event in response:
             event_count += 1
             event_type = getattr(event, 'type', None)
             
@@ -340,7 +332,7 @@ Follow the layout specification and generation guidelines above to create the ed
                     logger.info(f"✅ Final image received (after {partial_count} partial images)")
                     # Store final image
                     data_url = f"data:image/png;base64,{final_b64}"
-                    backend_url = store_image(data_url)
+                    backend_url = await asyncio.to_thread(store_image, data_url)
                     logger.info(f"💾 Image saved: {backend_url}")
                     yield {
                         'type': 'completed',
@@ -373,3 +365,10 @@ Follow the layout specification and generation guidelines above to create the ed
             'message': str(e)
         }
 
+def get_image_response(request: ChatRequest, priority: str = PRIORITY_GENERATION) -> str:
+    """Synchronous adapter around get_image_response_async."""
+    return run_sync(get_image_response_async(request, priority))
+
+def get_image_response_stream(request: ChatRequest, priority: str = PRIORITY_GENERATION):
+    """Synchronous adapter around get_image_response_stream_async."""
+    return iterate_sync(get_image_response_stream_async(request, priority))
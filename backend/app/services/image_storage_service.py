@@ -2,53 +2,116 @@
 """
 Service to store images locally and return URLs instead of base64.
 This prevents conversation history from growing too large.
+Files and their index live in the content-addressed store (app.services.image_store).
+
+Incoming images are stored as the bytes they arrived in, after checking the magic
+bytes and reading the dimensions from the header; nothing is decoded on the
+request path. The old normalization (alpha flattened onto white, PNG re-encode,
+now also optimized) runs in a background thread, which records the result as the
+image's normalized derivative for consumers that need a plain RGB PNG.
 """
 import os
 import base64
 import hashlib
-import uuid
 import httpx
 import logging
-import json
-from pathlib import Path
-from typing import Optional, Dict, Any
+import queue
+import re
+import struct
+import threading
+from typing import Optional, Dict, Any, Tuple
 from datetime import datetime
 from io import BytesIO
-from PIL import Image
+from PIL import Image, features
+
+from app.services.image_cache import image_cache
+from app.services.image_store import ImageRecord, image_store, is_safe_image_id, sniff_image_type
+from app.tracing import span, traced
 
 logger = logging.getLogger(__name__)
 
-# Determine cache directory (same as image_proxy)
-cache_dir_env = os.getenv("CACHE_DIR")
-if cache_dir_env:
-    cache_dir_path = Path(cache_dir_env)
-else:
-    project_root = Path(__file__).resolve().parents[3]
-    cache_dir_path = project_root / "backend" / "cached_images"
-
-cache_dir_path.mkdir(parents=True, exist_ok=True)
-CACHE_DIR = cache_dir_path.as_posix()
-
-def _generate_image_id(image_data: bytes) -> str:
-    """Generate a unique ID for an image based on its content"""
-    return hashlib.sha256(image_data).hexdigest()[:16]
-
-def _save_image(image_data: bytes, image_id: Optional[str] = None) -> str:
-    """Save image to disk and return the image ID"""
-    if image_id is None:
-        image_id = _generate_image_id(image_data)
-    
-    # Save as PNG
-    image_path = os.path.join(CACHE_DIR, f"{image_id}.png")
-    
-    # Ensure directory exists
-    os.makedirs(os.path.dirname(image_path), exist_ok=True)
-    
-    # Save image
-    with open(image_path, "wb") as f:
-        f.write(image_data)
+# Resized / re-encoded derivatives (GPT vision context, /images/{id}?w=&fmt=, dataset
+# thumbnails), stored next to the original as {id}_{size}.{fmt}
+IMAGE_VARIANT_FORMAT = os.getenv("IMAGE_VARIANT_FORMAT", "webp").lower()
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+if features.check("avif"):
+    VARIANT_FORMATS["avif"] = ("AVIF", "image/avif")
+# Requested widths are rounded up to one of these, which bounds the number of cached derivatives
+IMAGE_DERIVATIVE_WIDTHS = sorted(
+    int(width) for width in os.getenv("IMAGE_DERIVATIVE_WIDTHS", "64,128,256,512,1024").split(",") if width.strip()
+)
+
+# Store incoming images as-is (header check only) and normalize them in the background
+IMAGE_STORE_FAST_PATH = os.getenv("IMAGE_STORE_FAST_PATH", "1") == "1"
+IMAGE_NORMALIZE_ENABLED = os.getenv("IMAGE_NORMALIZE_ENABLED", "1") == "1"
+IMAGE_NORMALIZE_QUEUE_SIZE = int(os.getenv("IMAGE_NORMALIZE_QUEUE_SIZE", "1000"))
+
+# Largest upload accepted by /images/upload
+IMAGE_UPLOAD_MAX_BYTES = int(os.getenv("IMAGE_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+
+# Content-addressed IDs are the first 16 hex chars of the sha256 of the stored bytes
+_IMAGE_ID_PATTERN = re.compile(r"^[0-9a-f]{16}$")
+
+class ImageUploadError(ValueError):
+    """The uploaded data isn't a usable image"""
+
+class ImageTooLargeError(ImageUploadError):
+    """The upload exceeds IMAGE_UPLOAD_MAX_BYTES"""
+
+@traced("image_store")
+def _save_image(image_data: bytes, image_id: Optional[str] = None, mime: Optional[str] = None,
+                size: Optional[Tuple[int, int]] = None) -> str:
+    """Save image to the store (deduplicated by content) and return the image ID"""
+    record = image_store.put_bytes(image_data, image_id, mime, size)
+    if record.deduplicated:
+        logger.info(f"📦 Image already cached: {record.id}")
+    else:
+        logger.info(f"💾 Saved image: {record.id} ({record.mime}, {len(image_data)} bytes, {record.width}x{record.height})")
+    return record.id
+
+def probe_image(image_bytes: bytes) -> Optional[Tuple[str, int, int]]:
+    """Format, width and height from the magic bytes and header, without decoding any pixels"""
+    kind = sniff_image_type(image_bytes[:16])
+    if kind is None:
+        return None
+    if kind == "png" and image_bytes[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", image_bytes[16:24])
+        return kind, width, height
+    try:
+        # Image.open only parses the header; pixels are decoded on first access
+        with Image.open(BytesIO(image_bytes)) as img:
+            return kind, img.width, img.height
+    except Exception:
+        return None
+
+def normalize_image_bytes(image_bytes: bytes, optimize: bool = False) -> bytes:
+    """Decode and re-encode as an RGB PNG, flattening any transparency onto white"""
+    img = Image.open(BytesIO(image_bytes))
+    # Convert to RGB if needed
+    if img.mode in ('RGBA', 'LA', 'P'):
+        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = rgb_img
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
     
-    logger.info(f"💾 Saved image: {image_id}.png ({len(image_data)} bytes)")
+    # Save as PNG bytes
+    output = BytesIO()
+    img.save(output, format='PNG', optimize=optimize)
+    return output.getvalue()
+
+def _save_original(image_bytes: bytes, probe: Tuple[str, int, int]) -> str:
+    """Fast path: store the bytes as they arrived and queue the normalization"""
+    kind, width, height = probe
+    image_id = _save_image(image_bytes, mime=f"image/{kind}", size=(width, height))
+    image_normalizer.submit(image_id)
     return image_id
 
 def store_image_from_url(url: str) -> str:
@@ -65,21 +128,14 @@ def store_image_from_url(url: str) -> str:
             return url
         
         # Download image
-        with httpx.Client() as client:
+        with span("image_download"), httpx.Client() as client:
             response = client.get(url, timeout=30.0)
             response.raise_for_status()
             image_data = response.content
         
-        # Generate ID from content
-        image_id = _generate_image_id(image_data)
-        image_path = os.path.join(CACHE_DIR, f"{image_id}.png")
-        
-        # Check if already cached
-        if os.path.exists(image_path):
-            logger.info(f"📦 Image already cached: {image_id}")
-        else:
-            # Save image
-            _save_image(image_data, image_id)
+        # Save image (the store deduplicates by content)
+        probe = probe_image(image_data)
+        image_id = _save_original(image_data, probe) if probe else _save_image(image_data)
         
         # Return backend URL (no /api prefix - router is mounted at root)
         backend_url = f"/images/{image_id}"
@@ -99,38 +155,27 @@ def store_image_from_base64(base64_data: str) -> str:
     try:
         logger.info(f"📥 Processing base64 image ({len(base64_data)} chars)...")
         
-        # Handle data URL format
-        if base64_data.startswith('data:image'):
-            # Remove data URL prefix
-            header, encoded = base64_data.split(',', 1)
-            image_bytes = base64.b64decode(encoded)
-        else:
-            # Raw base64
-            image_bytes = base64.b64decode(base64_data)
-        
-        # Ensure it's valid image data
-        try:
-            img = Image.open(BytesIO(image_bytes))
-            # Convert to RGB if needed
-            if img.mode in ('RGBA', 'LA', 'P'):
-                rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = rgb_img
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
+        with span("image_decode"):
+            # Handle data URL format
+            if base64_data.startswith('data:image'):
+                # Remove data URL prefix
+                header, encoded = base64_data.split(',', 1)
+                image_bytes = base64.b64decode(encoded)
+            else:
+                # Raw base64
+                image_bytes = base64.b64decode(base64_data)
             
-            # Save as PNG bytes
-            output = BytesIO()
-            img.save(output, format='PNG')
-            image_bytes = output.getvalue()
-        except Exception as e:
-            logger.warning(f"⚠️ Could not process image, using raw bytes: {e}")
-            # Use raw bytes if PIL processing fails
+            probe = probe_image(image_bytes) if IMAGE_STORE_FAST_PATH else None
+            if probe is None:
+                # Unrecognized header (or fast path off): normalize on the request path as before
+                try:
+                    image_bytes = normalize_image_bytes(image_bytes)
+                except Exception as e:
+                    logger.warning(f"⚠️ Could not process image, using raw bytes: {e}")
+                    # Use raw bytes if PIL processing fails
         
         # Save and return URL (no /api prefix - router is mounted at root)
-        image_id = _save_image(image_bytes)
+        image_id = _save_original(image_bytes, probe) if probe else _save_image(image_bytes)
         backend_url = f"/images/{image_id}"
         logger.info(f"✅ Stored base64 image as: {backend_url}")
         return backend_url
@@ -139,6 +184,14 @@ def store_image_from_base64(base64_data: str) -> str:
         logger.error(f"❌ Failed to store base64 image: {e}")
         raise
 
+def is_inline_image(image_url: str) -> bool:
+    """Check if an image reference is inline base64 (data URL or raw base64) rather than a URL"""
+    return bool(image_url) and (image_url.startswith('data:image') or (
+        not image_url.startswith('http') and 
+        not image_url.startswith('/') and
+        len(image_url) > 100  # Base64 strings are typically long
+    ))
+
 def store_image(image_url_or_base64: str) -> str:
     """
     Universal function to store an image from either URL or base64.
@@ -149,31 +202,248 @@ def store_image(image_url_or_base64: str) -> str:
         raise ValueError("Empty image URL/base64 provided")
     
     # Check if it's base64 (data URL or raw base64)
-    if image_url_or_base64.startswith('data:image') or (
-        not image_url_or_base64.startswith('http') and 
-        not image_url_or_base64.startswith('/') and
-        len(image_url_or_base64) > 100  # Base64 strings are typically long
-    ):
+    if is_inline_image(image_url_or_base64):
         return store_image_from_base64(image_url_or_base64)
     else:
         return store_image_from_url(image_url_or_base64)
 
+def is_image_id(value: str) -> bool:
+    """Check if a string is a bare store ID (as returned by /images/upload)"""
+    return bool(value) and bool(_IMAGE_ID_PATTERN.match(value))
+
+def resolve_image_ref(image_ref: Optional[str]) -> Optional[str]:
+    """Turn a bare image ID into its backend URL; URLs and base64 pass through unchanged"""
+    if image_ref and is_image_id(image_ref):
+        return f"/images/{image_ref}"
+    return image_ref
+
+class ImageWriter:
+    """
+    Streams an upload into the store: chunks go to a store temp file while the
+    sha256 is computed incrementally, so the image is never held in memory.
+    commit() renames the file to its content-addressed location and returns the ID.
+    """
+
+    HEAD_BYTES = 16
+
+    def __init__(self, max_bytes: int = IMAGE_UPLOAD_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._head = b""
+        self._tmp_path = image_store.temp_path()
+        self._file = open(self._tmp_path, "wb")
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.abort()
+            raise ImageTooLargeError(f"Image exceeds the {self.max_bytes} byte upload limit")
+        if len(self._head) < self.HEAD_BYTES:
+            self._head += data[:self.HEAD_BYTES - len(self._head)]
+        self._hash.update(data)
+        self._file.write(data)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    @traced("image_store")
+    def commit(self) -> str:
+        self._file.close()
+        try:
+            kind = sniff_image_type(self._head)
+            if kind is None:
+                raise ImageUploadError("Upload is not a PNG, JPEG, GIF or WebP image")
+            try:
+                # Header only; the upload is stored as-is and normalized in the background
+                with Image.open(self._tmp_path) as img:
+                    width, height = img.size
+            except Exception as e:
+                raise ImageUploadError(f"Could not read {kind} upload: {e}")
+            record = image_store.adopt_file(self._tmp_path, self._hash.hexdigest()[:16], f"image/{kind}")
+            logger.info(f"💾 Stored uploaded image: {record.id} ({kind}, {self.size} bytes, {width}x{height}"
+                        f"{', already cached' if record.deduplicated else ''})")
+            image_normalizer.submit(record.id)
+            return record.id
+        finally:
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+
+class ImageNormalizer:
+    """
+    Background thread that turns stored originals into their normalized derivative:
+    an optimized RGB PNG with transparency flattened onto white (what every stored
+    image used to be). The derivative is stored like any other image and linked
+    from the original's index row. Images dropped from a full queue (or queued
+    before a restart) are normalized on demand by normalize().
+    """
+
+    def __init__(self, queue_size: int):
+        self._queue: "queue.Queue[str]" = queue.Queue(queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # One normalization at a time, so the worker and on-demand callers never duplicate work
+        self._normalize_lock = threading.Lock()
+        self.normalized = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def submit(self, image_id: str):
+        if not IMAGE_NORMALIZE_ENABLED:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="image-normalizer", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(image_id)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            image_id = self._queue.get()
+            try:
+                self.normalize(image_id)
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"⚠️ Could not normalize image {image_id}: {e}")
+
+    def normalize(self, image_id: str) -> Optional[ImageRecord]:
+        """Normalized derivative of a stored image, creating it if needed; None if the image is missing"""
+        record = image_store.lookup(image_id)
+        if record is None:
+            return None
+        if record.normalized_id:
+            return image_store.lookup(record.normalized_id)
+        with self._normalize_lock:
+            record = image_store.lookup(image_id)
+            if record is None:
+                return None
+            if record.normalized_id:
+                return image_store.lookup(record.normalized_id)
+            return self._normalize(record)
+
+    def _normalize(self, record: ImageRecord) -> ImageRecord:
+        with span("image_normalize"):
+            original = image_cache.read(record.path)
+            with Image.open(BytesIO(original)) as img:
+                already_rgb = img.mode == "RGB"
+            png_bytes = normalize_image_bytes(original, optimize=True)
+        if record.mime == "image/png" and already_rgb and len(png_bytes) >= record.size:
+            # Nothing to flatten and optimizing didn't help: the original is its own normalized form
+            normalized = record
+            self.unchanged += 1
+        else:
+            normalized = image_store.put_bytes(png_bytes, mime="image/png", size=(record.width, record.height))
+            self.normalized += 1
+            logger.info(f"🧼 Normalized {record.id} ({record.mime}, {record.size} bytes) -> "
+                        f"{normalized.id} ({normalized.size} bytes)")
+        image_store.set_normalized(record.id, normalized.id)
+        return normalized
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": IMAGE_NORMALIZE_ENABLED,
+            "queued": self._queue.qsize(),
+            "normalized": self.normalized,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+# Global instance
+image_normalizer = ImageNormalizer(IMAGE_NORMALIZE_QUEUE_SIZE)
+
+def get_normalized_image_path(image_id: str) -> Optional[str]:
+    """Path of the image as an RGB PNG (normalizing it now if the worker hasn't yet)"""
+    record = image_normalizer.normalize(image_id)
+    return record.path if record else None
+
 def get_image_path(image_id: str) -> Optional[str]:
-    """Get the file path for an image ID, or None if not found"""
-    image_path = os.path.join(CACHE_DIR, f"{image_id}.png")
-    if os.path.exists(image_path):
-        return image_path
-    return None
+    """Get the file path for an image ID (an index lookup), or None if not found"""
+    return image_store.get_path(image_id)
+
+def get_image_record(image_id: str) -> Optional[ImageRecord]:
+    """Index entry (path, MIME type, size, dimensions) of a stored image, or None"""
+    return image_store.lookup(image_id)
+
+# Per-derivative locks, so concurrent requests for a missing derivative generate it once
+_variant_locks: Dict[str, threading.Lock] = {}
+_variant_locks_guard = threading.Lock()
+
+def derivative_width(requested: int) -> int:
+    """Round a requested width up to the nearest allowed derivative width"""
+    for width in IMAGE_DERIVATIVE_WIDTHS:
+        if width >= requested:
+            return width
+    return IMAGE_DERIVATIVE_WIDTHS[-1]
+
+def negotiate_format(accept: str, original_mime: str) -> str:
+    """Best derivative format the client accepts, else the original's own format"""
+    accept = (accept or "").lower()
+    for fmt in ("avif", "webp"):
+        if fmt in VARIANT_FORMATS and VARIANT_FORMATS[fmt][1] in accept:
+            return fmt
+    return "jpeg" if original_mime == "image/jpeg" else "png"
+
+def get_image_variant_path(image_id: str, size: int, fmt: Optional[str] = None) -> Optional[str]:
+    """
+    Get the path of a downscaled variant (longest side at most `size` px), creating
+    and persisting it on first use. Returns the original when it already fits and is
+    in the requested format, and None if the original image is missing.
+    """
+    fmt = (fmt or IMAGE_VARIANT_FORMAT).lower()
+    if fmt not in VARIANT_FORMATS or not is_safe_image_id(image_id):
+        return None
+    record = image_store.lookup(image_id)
+    if record is None:
+        return None
+    pil_format, mime_type = VARIANT_FORMATS[fmt]
+    fits = record.width is not None and max(record.width, record.height) <= size
+    if fits and record.mime == mime_type:
+        return record.path
+    variant_path = os.path.join(os.path.dirname(record.path), f"{image_id}_{size}.{fmt}")
+    if os.path.exists(variant_path):
+        return variant_path
+
+    with _variant_locks_guard:
+        lock = _variant_locks.setdefault(variant_path, threading.Lock())
+    try:
+        with lock:
+            # Another request may have created it while we waited
+            if os.path.exists(variant_path):
+                return variant_path
+            with span("image_variant", fmt), Image.open(BytesIO(image_cache.read(record.path))) as img:
+                has_alpha = img.mode in ("RGBA", "LA", "P") and fmt != "jpeg"
+                img = img.convert("RGBA" if has_alpha else "RGB")
+                img.thumbnail((size, size), Image.LANCZOS)
+                # Write to a temp file first so concurrent readers never see a partial variant
+                tmp_path = image_store.temp_path()
+                try:
+                    img.save(tmp_path, format=pil_format, quality=IMAGE_VARIANT_QUALITY)
+                    os.replace(tmp_path, variant_path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+    finally:
+        with _variant_locks_guard:
+            _variant_locks.pop(variant_path, None)
+    logger.info(f"🖼️ Created {fmt} variant {image_id} at {size}px ({os.path.getsize(variant_path)} bytes)")
+    return variant_path
+
+def get_variant_mime_type(fmt: Optional[str] = None) -> str:
+    return VARIANT_FORMATS[(fmt or IMAGE_VARIANT_FORMAT).lower()][1]
 
 def store_metadata(image_id: str, metadata: Dict[str, Any]) -> None:
     """
-    Store metadata JSON file for an image.
+    Store metadata for an image in the image index.
     Metadata should include: timestamp, prompt, layout_info, etc.
     """
     try:
-        # Create metadata file path
-        metadata_path = os.path.join(CACHE_DIR, f"{image_id}_metadata.json")
-        
         # Ensure timestamp is present
         if "timestamp" not in metadata:
             metadata["timestamp"] = datetime.now().isoformat()
@@ -183,11 +453,10 @@ def store_metadata(image_id: str, metadata: Dict[str, Any]) -> None:
         if "image_url" not in metadata:
             metadata["image_url"] = f"/images/{image_id}"
         
-        # Save metadata as JSON
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False, default=str)
-        
-        logger.info(f"💾 Saved metadata: {image_id}_metadata.json")
+        if image_store.set_metadata(image_id, metadata):
+            logger.info(f"💾 Saved metadata for {image_id}")
+        else:
+            logger.warning(f"⚠️ Not storing metadata for unknown image {image_id}")
     except Exception as e:
         logger.error(f"❌ Failed to store metadata for {image_id}: {e}")
         # Don't raise - metadata storage failure shouldn't break image generation
@@ -0,0 +1,416 @@
+# backend/app/services/image_store.py
+"""
+Content-addressed image store with a SQLite index.
+
+Images are stored once per content hash (sha256[:16]) under fan-out directories,
+objects/ab/cd/abcd....png, so no directory grows beyond a few hundred entries.
+Every image has an index row (size, MIME type, dimensions, created time,
+optional metadata and the ID of its normalized PNG), which makes lookups and listings
+index queries instead of filesystem scans. Writes go to a temp file under tmp/
+and are renamed into place, so readers never see a partial image. Derived files
+(resized / re-encoded variants) live next to their original as {id}_*. Callbacks
+registered with on_remove() hear about every file the store deletes or moves away.
+
+The store is retention-only: chat turns, tracking logs and dataset entries all point
+at stored images and none of them is ever deleted, so images are never collected.
+gc() only cleans up after crashes (stale temp files, index rows whose file is gone).
+
+Images written flat into CACHE_DIR by older versions are adopted on first
+lookup; scripts/migrate_image_store.py moves the whole directory at once.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Determine cache directory:
+# 1. honor CACHE_DIR if provided (Docker deployment)
+# 2. otherwise use the project's local cached_images folder (works locally)
+cache_dir_env = os.getenv("CACHE_DIR")
+if cache_dir_env:
+    cache_dir_path = Path(cache_dir_env)
+else:
+    project_root = Path(__file__).resolve().parents[3]
+    cache_dir_path = project_root / "backend" / "cached_images"
+
+cache_dir_path.mkdir(parents=True, exist_ok=True)
+CACHE_DIR = cache_dir_path.as_posix()
+
+IMAGE_INDEX_PATH = os.getenv("IMAGE_INDEX_PATH", os.path.join(CACHE_DIR, "image_index.db"))
+# Temp files older than this are leftovers of crashed writes and removed by gc()
+STALE_TEMP_SECONDS = 3600
+
+MIME_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+
+def generate_image_id(data: bytes) -> str:
+    """Content address of an image: the first 16 hex chars of its sha256"""
+    return hashlib.sha256(data).hexdigest()[:16]
+
+def is_safe_image_id(image_id: str) -> bool:
+    """IDs become file names, so only allow characters that can't escape the store"""
+    return bool(image_id) and all(c.isalnum() or c in ('-', '_') for c in image_id)
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Detect the image format from its magic bytes"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+def sniff_mime_type(head: bytes, default: str = "application/octet-stream") -> str:
+    kind = sniff_image_type(head)
+    return f"image/{kind}" if kind else default
+
+def _dimensions(source) -> Tuple[Optional[int], Optional[int]]:
+    """Width and height from the image header (PIL doesn't decode the pixels for this)"""
+    try:
+        with Image.open(source) as img:
+            return img.size
+    except Exception:
+        return None, None
+
+@dataclass
+class ImageRecord:
+    """Index row of a stored image"""
+    id: str
+    path: str
+    size: int
+    mime: str
+    width: Optional[int]
+    height: Optional[int]
+    created: float
+    # Normalized (flattened, optimized PNG) derivative, once the background normalizer made one
+    normalized_id: Optional[str] = None
+    # Set when put_bytes() / adopt_file() found the image already stored (not persisted)
+    deduplicated: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "url": f"/images/{self.id}",
+            "size": self.size,
+            "mime": self.mime,
+            "width": self.width,
+            "height": self.height,
+            "created": self.created,
+            "normalized_id": self.normalized_id,
+        }
+
+_RECORD_COLUMNS = "id, size, mime, width, height, created, normalized_id"
+
+class ImageStore:
+    """Sharded content-addressed image files plus their SQLite index"""
+
+    def __init__(self, root: str, index_path: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        # Serializes "is it stored?" checks with the writes and deletes that depend on them,
+        # so gc(verify=True) can't drop the row of an image a put is healing (and vice versa)
+        self._write_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._remove_hooks: List[Callable[[str], None]] = []
+        self.adopted = 0
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.index_path).parent.mkdir(parents=True, exist_ok=True)
+            os.makedirs(self.tmp_dir, exist_ok=True)
+            conn = sqlite3.connect(self.index_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS images (
+                    id TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mime TEXT NOT NULL,
+                    width INTEGER,
+                    height INTEGER,
+                    created REAL NOT NULL,
+                    metadata TEXT,
+                    normalized_id TEXT
+                )"""
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(images)")}
+            if "normalized_id" not in columns:
+                conn.execute("ALTER TABLE images ADD COLUMN normalized_id TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_images_created ON images(created)")
+            # Left over from the reference-counting GC; older indexes keep their (unused) refcount column
+            conn.execute("DROP INDEX IF EXISTS idx_images_unreferenced")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS proxied_urls (
+                    url_hash TEXT PRIMARY KEY,
+                    image_id TEXT NOT NULL,
+                    fetched REAL NOT NULL
+                )"""
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def on_remove(self, hook: Callable[[str], None]):
+        """Call hook(path) whenever a file is deleted from (or moved within) the store, e.g. to drop cached bytes"""
+        self._remove_hooks.append(hook)
+
+    def _removed(self, path: str):
+        for hook in self._remove_hooks:
+            try:
+                hook(path)
+            except Exception as e:
+                logger.warning(f"⚠️ Image store remove hook failed for {path}: {e}")
+
+    def object_path(self, image_id: str, mime: str) -> str:
+        """Fan-out location of an image: objects/ab/cd/{id}{ext}"""
+        ext = MIME_EXTENSIONS.get(mime, ".bin")
+        return os.path.join(self.objects_dir, image_id[:2], image_id[2:4], f"{image_id}{ext}")
+
+    def temp_path(self) -> str:
+        """A fresh temp file name on the store's filesystem, so the final rename is atomic"""
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        return os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.tmp")
+
+    def _record(self, row) -> ImageRecord:
+        image_id, size, mime, width, height, created, normalized_id = row
+        return ImageRecord(image_id, self.object_path(image_id, mime), size, mime, width, height,
+                           created, normalized_id)
+
+    def _indexed(self, image_id: str) -> Optional[ImageRecord]:
+        with self._lock:
+            row = self._get_conn().execute(
+                f"SELECT {_RECORD_COLUMNS} FROM images WHERE id = ?", (image_id,)
+            ).fetchone()
+        return self._record(row) if row else None
+
+    def lookup(self, image_id: str) -> Optional[ImageRecord]:
+        """Index lookup by ID; adopts a legacy flat {id}.png on a miss"""
+        if not is_safe_image_id(image_id):
+            return None
+        record = self._indexed(image_id)
+        if record is not None:
+            return record
+        legacy_path = os.path.join(self.root, f"{image_id}.png")
+        if os.path.exists(legacy_path):
+            try:
+                record = self.adopt_file(legacy_path, image_id)
+            except FileNotFoundError:
+                # Another request adopted it first
+                return self._indexed(image_id)
+            self.adopted += 1
+            return record
+        return None
+
+    def get_path(self, image_id: str) -> Optional[str]:
+        record = self.lookup(image_id)
+        return record.path if record else None
+
+    def _upsert(self, image_id: str, size: int, mime: str, width: Optional[int], height: Optional[int],
+                created: Optional[float] = None) -> ImageRecord:
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute(
+                "INSERT INTO images (id, size, mime, width, height, created) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO NOTHING",
+                (image_id, size, mime, width, height, created or time.time())
+            )
+            conn.commit()
+            row = conn.execute(f"SELECT {_RECORD_COLUMNS} FROM images WHERE id = ?", (image_id,)).fetchone()
+        return self._record(row)
+
+    def _stored(self, image_id: str) -> Optional[ImageRecord]:
+        """Index row of image_id if its file is in place too (call with _write_lock held)"""
+        record = self._indexed(image_id)
+        if record is None or not os.path.exists(record.path):
+            return None
+        record.deduplicated = True
+        return record
+
+    def put_bytes(self, data: bytes, image_id: Optional[str] = None, mime: Optional[str] = None,
+                  size: Optional[Tuple[int, int]] = None) -> ImageRecord:
+        """Store image bytes (deduplicated by content); pass size when the caller already read the dimensions"""
+        image_id = image_id or generate_image_id(data)
+        with self._write_lock:
+            existing = self._stored(image_id)
+        if existing is not None:
+            return existing
+        mime = mime or sniff_mime_type(data[:16])
+        width, height = size or _dimensions(BytesIO(data))
+        tmp_path = self.temp_path()
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            with self._write_lock:
+                existing = self._stored(image_id)
+                if existing is not None:
+                    return existing
+                # An index row without its file gets the file back under the row's MIME type
+                indexed = self._indexed(image_id)
+                path = self.object_path(image_id, indexed.mime if indexed else mime)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                return self._upsert(image_id, len(data), mime, width, height)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def adopt_file(self, src_path: str, image_id: str, mime: Optional[str] = None,
+                   created: Optional[float] = None) -> ImageRecord:
+        """
+        Move a finished file (a temp file from tmp_path(), or a legacy flat file) into
+        the store under image_id. If the image is already stored the file is discarded.
+        """
+        with self._write_lock:
+            existing = self._stored(image_id)
+        if existing is None:
+            if mime is None:
+                with open(src_path, "rb") as f:
+                    mime = sniff_mime_type(f.read(16))
+            size = os.path.getsize(src_path)
+            width, height = _dimensions(src_path)
+            with self._write_lock:
+                existing = self._stored(image_id)
+                if existing is None:
+                    indexed = self._indexed(image_id)
+                    path = self.object_path(image_id, indexed.mime if indexed else mime)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(src_path, path)
+                    self._removed(src_path)
+                    return self._upsert(image_id, size, mime, width, height, created)
+        os.remove(src_path)
+        self._removed(src_path)
+        return existing
+
+    def set_normalized(self, image_id: str, normalized_id: str) -> bool:
+        with self._lock:
+            conn = self._get_conn()
+            updated = conn.execute(
+                "UPDATE images SET normalized_id = ? WHERE id = ?", (normalized_id, image_id)
+            ).rowcount
+            conn.commit()
+        return bool(updated)
+
+    def set_metadata(self, image_id: str, metadata: Dict[str, Any]) -> bool:
+        text = json.dumps(metadata, ensure_ascii=False, default=str)
+        with self._lock:
+            conn = self._get_conn()
+            updated = conn.execute("UPDATE images SET metadata = ? WHERE id = ?", (text, image_id)).rowcount
+            conn.commit()
+        return bool(updated)
+
+    def get_metadata(self, image_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._get_conn().execute("SELECT metadata FROM images WHERE id = ?", (image_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def list_images(self, limit: int = 100, before: Optional[float] = None,
+                    mime: Optional[str] = None) -> List[ImageRecord]:
+        """Newest first; pass the last record's created time as `before` for the next page"""
+        query = f"SELECT {_RECORD_COLUMNS} FROM images WHERE created < ?"
+        params: List[Any] = [before if before is not None else float("inf")]
+        if mime:
+            query += " AND mime = ?"
+            params.append(mime)
+        query += " ORDER BY created DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._get_conn().execute(query, params).fetchall()
+        return [self._record(row) for row in rows]
+
+    def get_proxied(self, url_hash: str) -> Optional[ImageRecord]:
+        with self._lock:
+            row = self._get_conn().execute(
+                "SELECT i.id, i.size, i.mime, i.width, i.height, i.created, i.normalized_id "
+                "FROM proxied_urls p JOIN images i ON i.id = p.image_id WHERE p.url_hash = ?",
+                (url_hash,)
+            ).fetchone()
+        return self._record(row) if row else None
+
+    def put_proxied(self, url_hash: str, data: bytes, mime: Optional[str] = None) -> ImageRecord:
+        """Store an image fetched for the proxy and remember which URL it came from"""
+        # Trust the bytes over the remote Content-Type
+        mime = sniff_mime_type(data[:16], default=mime or "application/octet-stream")
+        return self.map_proxied_url(url_hash, self.put_bytes(data, mime=mime))
+
+    def map_proxied_url(self, url_hash: str, record: ImageRecord) -> ImageRecord:
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO proxied_urls (url_hash, image_id, fetched) VALUES (?, ?, ?)",
+                (url_hash, record.id, time.time())
+            )
+            conn.commit()
+        return record
+
+    def gc(self, verify: bool = False, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Remove stale temp files of crashed writes. With verify, also drop index rows
+        (and derived files) of images whose file is gone; that check stats every file,
+        so it is opt-in. Stored images themselves are never removed.
+        """
+        missing_records: List[ImageRecord] = []
+        if verify:
+            with self._lock:
+                rows = self._get_conn().execute(f"SELECT {_RECORD_COLUMNS} FROM images").fetchall()
+            candidates = [record for record in map(self._record, rows) if not os.path.exists(record.path)]
+            with self._write_lock:
+                # Re-check under the write lock: a put may have restored the file since the scan
+                missing_records = [record for record in candidates if not os.path.exists(record.path)]
+                if not dry_run and missing_records:
+                    doomed = [(record.id,) for record in missing_records]
+                    with self._lock:
+                        conn = self._get_conn()
+                        conn.executemany("DELETE FROM images WHERE id = ?", doomed)
+                        conn.executemany("DELETE FROM proxied_urls WHERE image_id = ?", doomed)
+                        conn.commit()
+            if not dry_run:
+                for record in missing_records:
+                    derived = glob.glob(os.path.join(os.path.dirname(record.path), f"{record.id}_*"))
+                    for path in [record.path] + derived:
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+                        self._removed(path)
+
+        stale_temp = 0
+        if os.path.isdir(self.tmp_dir):
+            for entry in os.scandir(self.tmp_dir):
+                if entry.is_file() and time.time() - entry.stat().st_mtime > STALE_TEMP_SECONDS:
+                    stale_temp += 1
+                    if not dry_run:
+                        os.remove(entry.path)
+        result = {"missing": len(missing_records), "stale_temp": stale_temp}
+        logger.info(f"🧹 Image store GC{' (dry run)' if dry_run else ''}: {result}")
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._get_conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM images").fetchone()
+        return {"images": count, "bytes": total, "adopted_legacy": self.adopted}
+
+# Global instance
+image_store = ImageStore(CACHE_DIR, IMAGE_INDEX_PATH)
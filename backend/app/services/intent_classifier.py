@@ -0,0 +1,331 @@
+# backend/app/services/intent_classifier.py
+"""
+Local fast-path intent classifier.
+
+Decides between text_solo / image_solo / both in a few milliseconds so that
+/chat/stream only pays for a GPT-4o intent call when the local answer is unsure.
+It combines hand-written heuristics with a small multinomial Naive Bayes model over
+word n-grams, trained from prompts logged together with the GPT-4o label
+(see scripts/train_intent_classifier.py).
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+INTENT_FAST_PATH_ENABLED = os.getenv("INTENT_FAST_PATH_ENABLED", "1") == "1"
+INTENT_FAST_PATH_THRESHOLD = float(os.getenv("INTENT_FAST_PATH_THRESHOLD", "0.85"))
+# Without a trained model the rules alone never skip GPT-4o: a wrong image_solo starts a paid generation
+HEURISTIC_ONLY_MAX_CONFIDENCE = min(0.8, INTENT_FAST_PATH_THRESHOLD - 0.01)
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", str(BACKEND_DIR / "intent_model.json"))
+INTENT_LOG_PATH = os.getenv("INTENT_LOG_PATH", str(BACKEND_DIR / "intent_log.jsonl"))
+# Share of confident fast-path decisions that are still labelled by GPT-4o (in the background),
+# so the log covers the cases the fast path decides and not only the ones it was unsure about
+INTENT_AUDIT_SAMPLE_RATE = float(os.getenv("INTENT_AUDIT_SAMPLE_RATE", "0.05"))
+
+INTENTS = ["text_solo", "image_solo", "both"]
+
+GENERIC_VAGUE_PHRASES = [
+    "help me to create some images",
+    "help me create images",
+    "create some images",
+    "make images",
+    "how to create images",
+    "how can i make images",
+]
+
+IMAGE_QUESTION_PHRASES = [
+    "is this correct", "is this right", "is it correct", "is it right",
+    "do you think", "what do you think", "does this look", "does it look",
+    "can you explain", "explain this", "analyze this", "what's shown", "what is shown",
+]
+
+IMAGE_MODIFICATION_PHRASES = [
+    "make it", "make this", "change", "fix", "adjust", "bigger", "smaller",
+    "remove", "replace", "too many", "too few", "instead", "move the", "recolor",
+]
+
+EXPLANATION_CUES = [
+    "what is", "what are", "what does", "explain", "why", "how does", "how do",
+    "define", "definition", "meaning of", "difference between",
+]
+
+VISUAL_WORDS = [
+    "image", "picture", "draw", "visual", "diagram", "illustrat", "show me",
+    "graph", "plot", "sketch",
+]
+
+def is_specific_image_request(text: str) -> bool:
+    """Heuristic: check if request is specific enough to generate an image.
+    Examples that pass:
+    - 'draw a graph of y=x^2'
+    - 'make a number line from -5 to 5'
+    - 'i want an image for this problem: There are 10 basketballs...'
+    - Any word problem with numbers and specific details
+    """
+    t = (text or "").lower()
+
+    # Check for generic vague phrases first
+    if any(p in t for p in GENERIC_VAGUE_PHRASES):
+        return False
+
+    # Check for image request phrases
+    image_request_phrases = [
+        "want an image", "want a image", "need an image", "need a image",
+        "create an image", "create a image", "make an image", "make a image",
+        "draw", "generate", "illustrate", "visualize", "diagram", "show me",
+        "give me", "i want", "can you", "please create", "please draw",
+        "for this problem", "for the problem", "for this", "of this"
+    ]
+    has_image_request = any(phrase in t for phrase in image_request_phrases)
+
+    # Check for math specificity: numbers, math words, or word problem structure
+    math_markers = [
+        "graph", "fraction", "number line", "triangle", "rectangle", "area",
+        "equation", "x=", "y=", "plot", "bar chart", "pie chart", "basketball",
+        "bag", "total", "has", "how many", "problem", "solve", "word problem"
+    ]
+    has_numbers = any(ch.isdigit() for ch in t)
+    has_math_markers = any(m in t for m in math_markers)
+
+    # Word problem indicators (questions with numbers)
+    is_word_problem = (
+        "?" in (text or "") and has_numbers and (
+            "how many" in t or "what" in t or "if" in t or
+            "total" in t or "has" in t or "are" in t
+        )
+    )
+
+    # If it's a word problem with numbers, it's specific enough
+    if is_word_problem and has_numbers:
+        logger.info(f"✅ Detected word problem with numbers: {(text or '')[:50]}...")
+        return True
+
+    # Otherwise, need either image request phrase + numbers/markers, or explicit verb + markers
+    explicit_verbs = ["draw", "generate", "create", "make", "illustrate", "visualize", "diagram", "show"]
+    has_explicit_verb = any(v in t for v in explicit_verbs)
+
+    return (has_image_request and (has_numbers or has_math_markers)) or (has_explicit_verb and (has_numbers or has_math_markers))
+
+def heuristic_intent(user_input: str, has_image_in_history: bool) -> Tuple[Optional[str], float]:
+    """
+    Rule-based intent with a confidence score; (None, 0.0) when no rule applies.
+    The scores stay below the default fast-path threshold: the rules only decide
+    together with a trained model that agrees with them.
+    """
+    t = (user_input or "").lower()
+    has_numbers = any(ch.isdigit() for ch in t)
+    has_visual_words = any(w in t for w in VISUAL_WORDS)
+    has_explanation_cue = any(c in t for c in EXPLANATION_CUES)
+
+    if any(p in t for p in GENERIC_VAGUE_PHRASES):
+        return "text_solo", 0.8
+    if has_image_in_history and any(p in t for p in IMAGE_QUESTION_PHRASES):
+        return "text_solo", 0.8
+    if has_image_in_history and any(p in t for p in IMAGE_MODIFICATION_PHRASES) and "?" not in t:
+        return "image_solo", 0.75
+    if has_explanation_cue and has_visual_words and is_specific_image_request(user_input):
+        # Explanation plus visual is usually "both", but leave the close calls to GPT-4o
+        return "both", 0.6
+    if has_explanation_cue and not has_visual_words and not has_numbers:
+        return "text_solo", 0.75
+    if is_specific_image_request(user_input):
+        # Loose rule ("can you", "i want", any digit...); GPT-4o applies it after its own checks
+        return "image_solo", 0.5
+    return None, 0.0
+
+def extract_features(user_input: str, has_image_in_history: bool) -> List[str]:
+    """Word unigram/bigram features plus heuristic flags for the Naive Bayes model."""
+    t = (user_input or "").lower()
+    words = re.findall(r"[a-z]+|\d+|\?", t)
+    words = ["<num>" if w.isdigit() else w for w in words]
+    features = list(words)
+    features += [f"{a}_{b}" for a, b in zip(words, words[1:])]
+    if has_image_in_history:
+        features.append("__image_in_history__")
+    if is_specific_image_request(user_input):
+        features.append("__specific_image_request__")
+    if any(w in t for w in VISUAL_WORDS):
+        features.append("__visual_words__")
+    if any(c in t for c in EXPLANATION_CUES):
+        features.append("__explanation_cue__")
+    return features
+
+class NaiveBayesIntentModel:
+    """Multinomial Naive Bayes over n-gram features with Laplace smoothing"""
+
+    def __init__(self, class_counts: Dict[str, int] = None, feature_counts: Dict[str, Dict[str, int]] = None):
+        self.class_counts = class_counts or {}
+        self.feature_counts = feature_counts or {}
+        self._prepare()
+
+    def _prepare(self):
+        self.vocabulary = set()
+        for counts in self.feature_counts.values():
+            self.vocabulary.update(counts)
+        self.total_features = {label: sum(counts.values()) for label, counts in self.feature_counts.items()}
+
+    @classmethod
+    def train(cls, samples: Iterable[Tuple[List[str], str]]) -> "NaiveBayesIntentModel":
+        class_counts: Counter = Counter()
+        feature_counts: Dict[str, Counter] = {}
+        for features, label in samples:
+            class_counts[label] += 1
+            feature_counts.setdefault(label, Counter()).update(features)
+        return cls(dict(class_counts), {label: dict(counts) for label, counts in feature_counts.items()})
+
+    def predict(self, features: List[str]) -> Tuple[Optional[str], float]:
+        """Return the most likely label and its posterior probability"""
+        total_docs = sum(self.class_counts.values())
+        if not total_docs:
+            return None, 0.0
+        vocab_size = len(self.vocabulary) + 1
+        log_scores = {}
+        for label, doc_count in self.class_counts.items():
+            counts = self.feature_counts.get(label, {})
+            denominator = self.total_features.get(label, 0) + vocab_size
+            score = math.log(doc_count / total_docs)
+            for feature in features:
+                if feature in self.vocabulary:
+                    score += math.log((counts.get(feature, 0) + 1) / denominator)
+            log_scores[label] = score
+        best_label = max(log_scores, key=log_scores.get)
+        max_score = log_scores[best_label]
+        normalizer = sum(math.exp(s - max_score) for s in log_scores.values())
+        return best_label, 1.0 / normalizer
+
+    def to_dict(self) -> Dict:
+        return {"class_counts": self.class_counts, "feature_counts": self.feature_counts}
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "NaiveBayesIntentModel":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("class_counts"), data.get("feature_counts"))
+
+_model: Optional[NaiveBayesIntentModel] = None
+_model_loaded = False
+_model_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+def get_intent_model() -> Optional[NaiveBayesIntentModel]:
+    """Load the trained model once (None if it hasn't been trained yet)"""
+    global _model, _model_loaded
+    with _model_lock:
+        if not _model_loaded:
+            _model_loaded = True
+            if os.path.exists(INTENT_MODEL_PATH):
+                try:
+                    _model = NaiveBayesIntentModel.load(INTENT_MODEL_PATH)
+                    logger.info(f"✅ Loaded intent model from {INTENT_MODEL_PATH}")
+                except Exception as e:
+                    logger.warning(f"⚠️ Could not load intent model: {e}")
+    return _model
+
+def classify_intent(user_input: str, has_image_in_history: bool) -> Tuple[Optional[str], float]:
+    """
+    Combine heuristics and the trained model into one (intent, confidence) answer.
+    When both agree the higher confidence wins; when they disagree the confidence
+    drops so the caller falls back to GPT-4o. Without a trained model the rules'
+    confidence is capped below the fast-path threshold.
+    """
+    rule_intent, rule_confidence = heuristic_intent(user_input, has_image_in_history)
+    model = get_intent_model()
+    if model is None:
+        return rule_intent, min(rule_confidence, HEURISTIC_ONLY_MAX_CONFIDENCE)
+
+    model_intent, model_confidence = model.predict(extract_features(user_input, has_image_in_history))
+    if rule_intent is None:
+        return model_intent, model_confidence
+    if model_intent == rule_intent:
+        return rule_intent, max(rule_confidence, model_confidence)
+    if model_confidence > rule_confidence:
+        return model_intent, model_confidence - rule_confidence
+    return rule_intent, rule_confidence - model_confidence
+
+def fast_path_intent(user_input: str, has_image_in_history: bool) -> Optional[str]:
+    """Return the local intent if it is confident enough to skip the GPT-4o call"""
+    if not INTENT_FAST_PATH_ENABLED:
+        return None
+    start_time = time.perf_counter()
+    intent, confidence = classify_intent(user_input, has_image_in_history)
+    duration_ms = (time.perf_counter() - start_time) * 1000
+    if intent and confidence >= INTENT_FAST_PATH_THRESHOLD:
+        logger.info(f"⚡ Fast-path intent: {intent} (confidence {confidence:.2f}, {duration_ms:.1f}ms)")
+        return intent
+    logger.info(f"🤔 Fast-path unsure ({intent}, confidence {confidence:.2f}) - asking GPT-4o")
+    return None
+
+def log_intent_sample(user_input: str, has_image_in_history: bool, intent: str, latency_ms: float,
+                      audit: bool = False):
+    """
+    Append a GPT-4o labelled prompt to the training log, with the local prediction
+    for it. audit marks prompts the fast path had already decided on its own.
+    """
+    local_intent, local_confidence = classify_intent(user_input, has_image_in_history)
+    entry = {
+        "timestamp": time.time(),
+        "user_input": user_input,
+        "has_image_in_history": has_image_in_history,
+        "intent": intent,
+        "llm_latency_ms": round(latency_ms, 1),
+        "local_intent": local_intent,
+        "local_confidence": round(local_confidence, 3),
+        "audit": audit,
+    }
+    try:
+        with _log_lock:
+            with open(INTENT_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to log intent sample: {e}")
+
+# Labelled examples taken from the GPT-4o intent prompt; used to seed training
+SEED_SAMPLES = [
+    ("What is a derivative?", False, "text_solo"),
+    ("Draw a graph of y=x^2", False, "image_solo"),
+    ("I want an image for this problem: There are 10 basketballs in 2 bags", False, "image_solo"),
+    ("Create a visualization of the Pythagorean theorem", False, "image_solo"),
+    ("draw the image for the problem now", False, "image_solo"),
+    ("you are not giving me the image.... draw the image for the problem now", False, "image_solo"),
+    ("Explain derivatives and show me a visual example", False, "both"),
+    ("Make this image bigger", True, "image_solo"),
+    ("I think there are too many basketballs, can you fix it?", True, "image_solo"),
+    ("What does this formula mean?", False, "text_solo"),
+    ("Do you think this picture is right?", True, "text_solo"),
+    ("Is this correct?", True, "text_solo"),
+    ("What do you think about this image?", True, "text_solo"),
+    ("Can you explain what's shown in this picture?", True, "text_solo"),
+    ("Does this look good?", True, "text_solo"),
+    ("help me to create some images for math word problem", False, "text_solo"),
+    ("how can I make images for word problems?", False, "text_solo"),
+]
+
+def load_intent_samples(path: str = INTENT_LOG_PATH) -> List[Dict]:
+    """Read logged samples, skipping malformed lines"""
+    samples = []
+    if not os.path.exists(path):
+        return samples
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry.get("intent") in INTENTS and entry.get("user_input"):
+                samples.append(entry)
+    return samples
@@ -1,26 +1,40 @@
 # backend/app/services/intent_service.py
-from app.clients.openai_client import client
+from app.clients.openai_client import run_sync
+from app.clients.llm_cache import cached_chat_completion_with_status
+from app.clients.single_flight import single_flight, make_flight_key
+from app.clients.retry_policy import OPENAI_HEDGE_AFTER_SECONDS
 from app.schemas.chat import ChatRequest
+from app.services.intent_classifier import INTENT_AUDIT_SAMPLE_RATE, fast_path_intent, log_intent_sample
+from app.tracing import traced
+from typing import Optional, Set, Tuple
+import asyncio
 import logging
+import random
+import time
 
 logger = logging.getLogger(__name__)
 
-def analyze_intent(request: ChatRequest) -> str:
-    """Use GPT-4o to determine if user wants text, image, or both.
-    Be strict: only classify as image_solo/both when the user explicitly asks
-    for an image/diagram/drawing OR when an existing image is being edited.
-    """
-    logger.info("🧠 Analyzing user intent with GPT-4o...")
-    
-    # Check if there's an image in conversation history (for modification requests)
-    has_image_in_history = False
+# Background GPT-4o labelling of confident fast-path decisions (kept referenced until done)
+_audit_tasks: Set[asyncio.Task] = set()
+
+def _is_valid_intent_result(result: str) -> bool:
+    """Only cache responses that name one of the known intents."""
+    result_lower = result.lower()
+    return any(intent in result_lower for intent in ("text_solo", "image_solo", "both"))
+
+def _has_image_in_history(request: ChatRequest) -> bool:
+    """Check if there's an image in conversation history (for modification requests)"""
     if request.conversation_history:
         for msg in request.conversation_history:
             if hasattr(msg, 'image_url') and msg.image_url:
-                has_image_in_history = True
                 logger.info(f"🖼️ Found image in conversation history - may be modification request")
-                break
-    
+                return True
+    return False
+
+def resolve_intent_locally(request: ChatRequest) -> Optional[str]:
+    """Return the intent when it can be decided without GPT-4o, otherwise None.
+    Covers explicit image edits and confident answers from the local classifier.
+    """
     # Check if there's an image region or referenced image (explicit edit)
     has_explicit_image_edit = bool(
         (request.image_region and request.image_region.image_url) or 
@@ -31,6 +45,58 @@ def analyze_intent(request: ChatRequest) -> str:
         logger.info("🎨 Explicit image edit detected (mask/reference) - returning image_solo")
         return "image_solo"
 
+    # Local classifier answers confident cases in milliseconds
+    local_intent = fast_path_intent(request.user_input, _has_image_in_history(request))
+    if local_intent and random.random() < INTENT_AUDIT_SAMPLE_RATE:
+        _schedule_audit(request)
+    return local_intent
+
+def _schedule_audit(request: ChatRequest):
+    """Have GPT-4o label a fast-path decision in the background, for training and benchmarking"""
+    try:
+        task = asyncio.get_running_loop().create_task(_audit_intent(request))
+    except RuntimeError:
+        return  # no event loop (sync caller): skip the audit
+    _audit_tasks.add(task)
+    task.add_done_callback(_audit_tasks.discard)
+
+async def _audit_intent(request: ChatRequest):
+    try:
+        await _label_intent(request, _has_image_in_history(request), audit=True)
+    except Exception as e:
+        logger.warning(f"⚠️ Intent audit failed: {e}")
+
+@traced("intent")
+async def analyze_intent_async(request: ChatRequest, skip_local: bool = False) -> str:
+    """Use GPT-4o to determine if user wants text, image, or both.
+    Be strict: only classify as image_solo/both when the user explicitly asks
+    for an image/diagram/drawing OR when an existing image is being edited.
+    Pass skip_local=True when resolve_intent_locally() was already consulted.
+    """
+    logger.info("🧠 Analyzing user intent with GPT-4o...")
+    
+    if not skip_local:
+        local_intent = resolve_intent_locally(request)
+        if local_intent:
+            return local_intent
+    return await _label_intent(request, _has_image_in_history(request))
+
+async def _label_intent(request: ChatRequest, has_image_in_history: bool, audit: bool = False) -> str:
+    """Ask GPT-4o for the intent; fresh labels (not cache hits or fallbacks) are logged as training data"""
+    analysis_prompt = _build_analysis_prompt(request)
+
+    async def classify_and_log() -> str:
+        start_time = time.perf_counter()
+        intent, source = await _classify_intent(analysis_prompt)
+        if source == "gpt":
+            latency_ms = (time.perf_counter() - start_time) * 1000
+            await asyncio.to_thread(log_intent_sample, request.user_input, has_image_in_history, intent, latency_ms, audit)
+        return intent
+
+    # Identical prompts that are already being classified share one GPT call (and one log entry)
+    return await single_flight.do(make_flight_key("intent", analysis_prompt), classify_and_log)
+
+def _build_analysis_prompt(request: ChatRequest) -> str:
     # Build context about recent conversation
     recent_context = ""
     if request.conversation_history:
@@ -98,19 +164,26 @@ IMPORTANT: If there's an image in the conversation context and the user asks a q
 Respond with exactly one word: text_solo, image_solo, or both
 
 Output modality:"""
+    return analysis_prompt
 
+async def _classify_intent(analysis_prompt: str) -> Tuple[str, str]:
+    """Ask GPT-4o for the output modality, asking again on unclear answers.
+    Transient API errors are retried by the retry policy; any other error falls back.
+    Returns the intent and where it came from: "gpt", "cache" or "fallback".
+    """
     max_retries = 2
     for attempt in range(max_retries + 1):
         try:
             logger.info(f"🔗 DEBUG: Connecting to OpenAI for intent analysis (attempt {attempt + 1})...")
-            response = client.chat.completions.create(
+            raw_result, cached = await cached_chat_completion_with_status(
+                "intent",
+                validate=_is_valid_intent_result,
+                hedge_after=OPENAI_HEDGE_AFTER_SECONDS,
                 model="gpt-4o",
                 messages=[{"role": "user", "content": analysis_prompt}],
                 max_tokens=15,
                 temperature=0
             )
-            
-            raw_result = response.choices[0].message.content
             result = raw_result.strip().lower() if raw_result else ""
             
             # Parse result - look for valid intents
@@ -140,16 +213,16 @@ Output modality:"""
                     continue
                 else:
                     logger.warning(f"⚠️ Could not parse intent, defaulting to 'text_solo'. Raw result: '{result}'")
-                    final_intent = "text_solo"
+                    return "text_solo", "fallback"
             
             logger.info(f"🧠 DEBUG: GPT-4o intent analysis result: '{result}', final intent: '{final_intent}'")
-            return final_intent
+            return final_intent, "cache" if cached else "gpt"
             
         except Exception as e:
             logger.error(f"❌ Intent analysis failed (attempt {attempt + 1}): {type(e).__name__}: {e}")
-            if attempt < max_retries:
-                continue
-            else:
-                logger.info("🔄 Falling back to 'text_solo' intent")
-                return "text_solo"
+            logger.info("🔄 Falling back to 'text_solo' intent")
+            return "text_solo", "fallback"
 
+def analyze_intent(request: ChatRequest) -> str:
+    """Synchronous adapter around analyze_intent_async."""
+    return run_sync(analyze_intent_async(request))
@@ -3,8 +3,12 @@
 Math2Visual Service: Generates visual language from math word problems
 and converts it to manipulative elements for Tool3.
 """
-from app.clients.openai_client import client
+from app.clients.openai_client import run_sync
+from app.clients.llm_cache import cached_chat_completion
+from app.clients.single_flight import single_flight, make_flight_key
+from app.logging_config import log_payload
 from typing import List, Dict, Optional
+import asyncio
 import re
 import logging
 import os
@@ -79,7 +83,7 @@ def get_my_icons_path():
     return None
 
 
-def generate_visual_language(mwp_text: str) -> str:
+async def generate_visual_language_async(mwp_text: str) -> str:
     """
     Generate visual language from math word problem using GPT.
     Returns the visual language string in math2visual format.
@@ -132,7 +136,8 @@ def generate_visual_language(mwp_text: str) -> str:
     
     try:
         logger.info(f"🤖 Generating visual language for: {mwp_text[:100]}...")
-        response = client.chat.completions.create(
+        response_text = await cached_chat_completion(
+            "visual_language",
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are an expert at converting math word problems into structured visual language expressions. Return only the visual language expression."},
@@ -141,7 +146,7 @@ def generate_visual_language(mwp_text: str) -> str:
             temperature=0.3
         )
         
-        visual_lang = response.choices[0].message.content.strip()
+        visual_lang = response_text.strip()
         # Remove "visual_language:" prefix if present
         if visual_lang.startswith("visual_language:"):
             visual_lang = visual_lang.replace("visual_language:", "").strip()
@@ -153,6 +158,11 @@ def generate_visual_language(mwp_text: str) -> str:
         raise
 
 
+def generate_visual_language(mwp_text: str) -> str:
+    """Synchronous adapter around generate_visual_language_async."""
+    return run_sync(generate_visual_language_async(mwp_text))
+
+
 def parse_visual_language(visual_lang: str) -> Dict:
     """
     Parse visual language string into structured dictionary.
@@ -216,24 +226,9 @@ def parse_visual_language(visual_lang: str) -> Dict:
             "result_container": result_container
         }
         
-        # Debug: Log parsed visual language structure
-        logger.info("=" * 80)
-        logger.info("📋 PARSED VISUAL LANGUAGE STRUCTURE:")
-        logger.info(f"   Operation: {operation}")
-        logger.info(f"   Containers ({len(containers)}):")
-        for idx, container in enumerate(containers):
-            logger.info(f"      Container {idx + 1}:")
-            logger.info(f"         entity_name: {container.get('entity_name', '')}")
-            logger.info(f"         entity_type: {container.get('entity_type', '')}")
-            logger.info(f"         entity_quantity: {container.get('entity_quantity', '')}")
-            logger.info(f"         container_name: {container.get('container_name', '')}")
-            logger.info(f"         container_type: {container.get('container_type', '')}")
-        if result_container:
-            logger.info(f"   Result Container:")
-            logger.info(f"      entity_name: {result_container.get('entity_name', '')}")
-            logger.info(f"      entity_type: {result_container.get('entity_type', '')}")
-            logger.info(f"      entity_quantity: {result_container.get('entity_quantity', '')}")
-        logger.info("=" * 80)
+        logger.info(f"📋 Parsed visual language: operation={operation}, {len(containers)} containers"
+                    + (", with result container" if result_container else ""))
+        log_payload(logger, "📋 Parsed visual language structure", parsed_result, level=logging.DEBUG)
         
         return parsed_result
     except Exception as e:
@@ -537,63 +532,66 @@ def convert_to_manipulatives(parsed_lang: Dict, canvas_width: int = 800, canvas_
     return elements
 
 
-def generate_manipulatives_from_mwp(mwp_text: str) -> Dict:
+async def generate_manipulatives_from_mwp_async(mwp_text: str) -> Dict:
     """
     Main function: Generate manipulative elements from math word problem.
     Uses math2visual's formal visual generation algorithm.
+    Concurrent requests for the same problem share a single generation.
     Returns: {
         "elements": [...],
         "visual_language": "...",
         "parsed": {...}
     }
     """
+    return await single_flight.do(
+        make_flight_key("manipulatives", mwp_text),
+        lambda: _generate_manipulatives(mwp_text)
+    )
+
+
+async def _generate_manipulatives(mwp_text: str) -> Dict:
     try:
-        logger.info("=" * 80)
-        logger.info("🚀 GENERATING MANIPULATIVES FROM MATH WORD PROBLEM")
-        logger.info(f"   Problem text: {mwp_text[:100]}...")
-        logger.info("=" * 80)
+        logger.info(f"🚀 Generating manipulatives for: {mwp_text[:100]}...")
         
         # Step 1: Generate visual language
-        visual_lang = generate_visual_language(mwp_text)
-        logger.info("=" * 80)
-        logger.info("📝 GENERATED VISUAL LANGUAGE (DSL):")
-        logger.info(f"   {visual_lang}")
-        logger.info("=" * 80)
+        visual_lang = await generate_visual_language_async(mwp_text)
+        # Steps 2-3 read SVG files from disk, keep them off the event loop
+        return await asyncio.to_thread(_build_manipulatives, visual_lang)
+    except Exception as e:
+        logger.error(f"❌ Error generating manipulatives: {str(e)}")
+        raise
+
+
+def generate_manipulatives_from_mwp(mwp_text: str) -> Dict:
+    """Synchronous adapter around generate_manipulatives_from_mwp_async."""
+    return run_sync(generate_manipulatives_from_mwp_async(mwp_text))
+
+
+def _build_manipulatives(visual_lang: str) -> Dict:
+    """Parse visual language and lay out the formal visual elements for Tool3."""
+    try:
+        log_payload(logger, "📝 Generated visual language (DSL)", visual_lang)
         
         # Step 2: Parse visual language (for metadata)
         parsed = parse_visual_language(visual_lang)
         
         # Step 3: Convert to formal visual elements using math2visual algorithm
-        logger.info("=" * 80)
-        logger.info("🔍 SEARCHING FOR ICONS IN my_icons DATASET:")
-        logger.info("=" * 80)
+        logger.info("🔍 Searching for icons in my_icons dataset...")
         elements = convert_to_manipulatives_formal(visual_lang)
         
-        # Debug: Log icon names used in final elements
-        logger.info("=" * 80)
-        logger.info("🎨 FINAL ELEMENTS WITH ICON NAMES:")
+        # One summary line; element positions (without SVG markup) go to the payload debug sink
         icon_count = {}
         for idx, elem in enumerate(elements):
-            elem_type = elem.get('type', 'unknown')
-            elem_label = elem.get('label', '')
-            if elem_type == 'icon' and elem.get('svg_content'):
-                # Extract icon name from SVG content or use label
-                icon_name = elem_label if elem_label else f"icon_{idx}"
+            if elem.get('type') == 'icon' and elem.get('svg_content'):
+                icon_name = elem.get('label') or f"icon_{idx}"
                 icon_count[icon_name] = icon_count.get(icon_name, 0) + 1
-                logger.info(f"   Element {idx + 1}: type={elem_type}, label={elem_label}, "
-                          f"x={elem.get('x', 0)}, y={elem.get('y', 0)}, "
-                          f"w={elem.get('w', 0)}, h={elem.get('h', 0)}")
-            elif elem_type == 'text':
-                logger.info(f"   Element {idx + 1}: type={elem_type}, label='{elem_label}', "
-                          f"x={elem.get('x', 0)}, y={elem.get('y', 0)}, "
-                          f"w={elem.get('w', 0)}, h={elem.get('h', 0)}")
-        
-        logger.info("=" * 80)
-        logger.info("📊 ICON USAGE SUMMARY:")
-        for icon_name, count in icon_count.items():
-            logger.info(f"   {icon_name}: used {count} time(s)")
-        logger.info(f"   Total elements: {len(elements)}")
-        logger.info("=" * 80)
+        logger.info(f"🎨 Built {len(elements)} elements, icon usage: {icon_count}")
+        log_payload(
+            logger,
+            "🎨 Final elements",
+            [{k: v for k, v in elem.items() if k != 'svg_content'} for elem in elements],
+            level=logging.DEBUG
+        )
         
         return {
             "elements": elements,
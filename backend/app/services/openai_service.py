@@ -9,6 +9,9 @@ import os
 from dotenv import load_dotenv
 from typing import List, Optional
 from app.schemas.chat import ChatMessage, ChatRequest, ChatResponse
+from app.clients.image_scheduler import image_scheduler
+from app.clients.retry_policy import call_with_retry_sync
+from app.clients.usage_tracker import usage_tracker
 import logging
 
 # Set up logging
@@ -28,8 +31,9 @@ _client_instance = None
 def get_client():
     global _client_instance
     if _client_instance is None:
-        api_key = os.getenv("OPENAI_API_KEY")
-        _client_instance = OpenAI(api_key=api_key)
+        base_url = os.getenv("OPENAI_BASE_URL") or None
+        api_key = os.getenv("OPENAI_API_KEY") or ("standin" if base_url else None)
+        _client_instance = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
     return _client_instance
 
 # For backward compatibility
@@ -120,11 +124,14 @@ Output modality:"""
 
     try:
         logger.info("🔗 DEBUG: Connecting to OpenAI for intent analysis...")
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": analysis_prompt}],
-            max_tokens=10,
-            temperature=0
+        response = call_with_retry_sync(
+            lambda: client.chat.completions.create(
+                model="gpt-4o",
+                messages=[{"role": "user", "content": analysis_prompt}],
+                max_tokens=10,
+                temperature=0
+            ),
+            "intent_legacy"
         )
         
         raw_result = response.choices[0].message.content
@@ -149,10 +156,13 @@ def get_text_response(request: ChatRequest) -> str:
         logger.info(f"🔗 DEBUG: Connecting to OpenAI for text generation...")
         logger.info(f"🤖 DEBUG: Using model 'gpt-4o' for text generation")
         logger.info(f"📊 DEBUG: Sending {len(messages)} messages to OpenAI")
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            stream=False  # Keep non-streaming for now, will add streaming endpoint separately
+        response = call_with_retry_sync(
+            lambda: client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                stream=False  # Keep non-streaming for now, will add streaming endpoint separately
+            ),
+            "chat_text_legacy"
         )
         text_result = response.choices[0].message.content
         logger.info(f"✅ Text response generated successfully: {len(text_result)} characters")
@@ -171,18 +181,32 @@ def get_text_response_stream(request: ChatRequest):
         logger.info("🔗 DEBUG: Connecting to OpenAI for streaming text generation...")
         logger.info("🤖 DEBUG: Using model 'gpt-4o' for streaming text generation")
         logger.info(f"📊 DEBUG: Sending {len(messages)} messages to OpenAI")
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            stream=True
-        )
-        
-        logger.info("✅ Streaming response started")
-        chunk_count = 0
-        for chunk in response:
-            if chunk.choices[0].delta.content is not None:
-                chunk_count += 1
-                yield chunk.choices[0].delta.content
+        recorder = usage_tracker.call_recorder("chat_text_stream_legacy", model="gpt-4o")
+        failed = False
+        try:
+            response = call_with_retry_sync(
+                lambda: client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                ),
+                "chat_text_stream_legacy",
+                record_call=False
+            )
+            
+            logger.info("✅ Streaming response started")
+            chunk_count = 0
+            for chunk in response:
+                recorder.observe(chunk)
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    chunk_count += 1
+                    yield chunk.choices[0].delta.content
+        except Exception:
+            failed = True
+            raise
+        finally:
+            recorder.finish(failed=failed)
         logger.info(f"✅ Streaming complete: {chunk_count} chunks sent")
     except Exception as e:
         logger.error(f"❌ Streaming text generation failed: {type(e).__name__}: {e}")
@@ -214,7 +238,8 @@ Create a detailed, mathematically precise visual illustration for this education
         # Make the API call with GPT-4o's image generation capability
         logger.info(f"🤖 DEBUG: Using model 'gpt-4o-image' for image generation...")
         
-        response = client.images.generate(
+        response = image_scheduler.call_sync(
+            "generate", user_id=request.user_id,
             model="gpt-image-1",
             prompt=prompt,
             n=1,
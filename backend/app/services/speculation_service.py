@@ -0,0 +1,129 @@
+# backend/app/services/speculation_service.py
+"""
+Speculative execution of the text branch while intent analysis is running.
+
+When the local classifier can't decide the intent, /chat/stream would wait a full
+GPT-4o round trip before it starts the text stream. In speculative mode the text
+stream starts at the same time as the intent call and its chunks are buffered.
+If the intent turns out to be text_solo the buffered chunks are replayed
+immediately; otherwise the speculative stream is cancelled and counted as wasted.
+The route also cancels it when its response ends, so a client that disconnects
+before the body is read doesn't leave a paid completion running.
+"""
+import asyncio
+import logging
+import os
+import threading
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from app.schemas.chat import ChatRequest
+from app.services.chat_service import get_text_response_stream_async
+from app.services.intent_service import analyze_intent_async, resolve_intent_locally
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_INTENT_ENABLED = os.getenv("SPECULATIVE_INTENT_ENABLED", "1") == "1"
+
+_DONE = object()
+
+class SpeculativeTextStream:
+    """Runs the text stream in a background task and buffers chunks until consumed"""
+
+    def __init__(self, request: ChatRequest):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(request))
+
+    async def _run(self, request: ChatRequest):
+        try:
+            async for chunk in get_text_response_stream_async(request):
+                self._queue.put_nowait(chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._queue.put_nowait(e)
+        finally:
+            self._queue.put_nowait(_DONE)
+
+    async def stream(self) -> AsyncIterator[str]:
+        """Yield buffered chunks first, then live ones; stops the task if abandoned"""
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        """Stop the background stream; safe to call more than once"""
+        if not self._task.done():
+            self._task.cancel()
+
+class SpeculationStats:
+    """Counters for started, used and wasted speculations"""
+
+    def __init__(self):
+        self.started = 0
+        self.used = 0
+        self.wasted = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.started += 1
+
+    def finish(self, used: bool) -> Tuple[int, int]:
+        """Count a resolved speculation; returns (wasted, started) for logging"""
+        with self._lock:
+            if used:
+                self.used += 1
+            else:
+                self.wasted += 1
+            return self.wasted, self.started
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            started, used, wasted = self.started, self.used, self.wasted
+        return {
+            "enabled": SPECULATIVE_INTENT_ENABLED,
+            "started": started,
+            "used": used,
+            "wasted": wasted,
+            "waste_ratio": wasted / started if started else 0.0
+        }
+
+# Global instance
+speculation_stats = SpeculationStats()
+
+async def analyze_intent_speculative(request: ChatRequest) -> Tuple[str, Optional[SpeculativeTextStream]]:
+    """
+    Resolve the intent, speculatively streaming text while GPT-4o decides.
+    Returns the intent and, for text_solo, the already running text stream
+    (None means the caller should start its branch as usual).
+    """
+    local_intent = resolve_intent_locally(request)
+    if local_intent or not SPECULATIVE_INTENT_ENABLED:
+        intent = local_intent or await analyze_intent_async(request, skip_local=True)
+        return intent, None
+
+    speculation = SpeculativeTextStream(request)
+    speculation_stats.start()
+    try:
+        intent = await analyze_intent_async(request, skip_local=True)
+    except BaseException:
+        speculation.cancel()
+        speculation_stats.finish(used=False)
+        raise
+
+    if intent == "text_solo":
+        speculation_stats.finish(used=True)
+        logger.info("🏁 Speculative text stream used")
+        return intent, speculation
+
+    speculation.cancel()
+    wasted, started = speculation_stats.finish(used=False)
+    logger.info(f"🗑️ Speculative text stream discarded (intent: {intent}, {wasted}/{started} wasted)")
+    return intent, None
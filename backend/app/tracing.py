@@ -0,0 +1,230 @@
+# backend/app/tracing.py
+"""
+Request tracing and per-stage timing.
+
+Every HTTP request runs under a trace (see app.api.tracing.TracingMiddleware) that
+carries its request ID and the spans recorded while serving it. Code marks stages
+with the traced() decorator or the span() context manager; each span also feeds a
+per-stage histogram, and OpenAI calls get time-to-first-byte and total histograms
+per call site. Everything is exported in Prometheus text format at /metrics.
+
+The trace lives in a ContextVar, so it follows asyncio tasks and asyncio.to_thread /
+threadpool calls; spans recorded outside a request only update the histograms.
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRACE_SLOW_REQUEST_SECONDS = float(os.getenv("TRACE_SLOW_REQUEST_SECONDS", "10"))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "200"))
+
+# Seconds; covers cheap stages (prompt building, DB commits) up to multi-minute image generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+class Trace:
+    """Request ID plus the (stage, detail, start offset, seconds) spans of one request"""
+
+    def __init__(self, request_id: str, method: str, path: str):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, Optional[str], float, float]] = []
+        self.dropped = 0
+        # Spans may be recorded from worker threads that copied the request context
+        self._lock = threading.Lock()
+
+    def add_span(self, stage: str, detail: Optional[str], started: float, seconds: float):
+        with self._lock:
+            if len(self.spans) >= TRACE_MAX_SPANS:
+                self.dropped += 1
+                return
+            self.spans.append((stage, detail, started - self.started, seconds))
+
+    def summary(self) -> str:
+        """One line per trace for the logs: stage[detail]=seconds in start order"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s[2])
+            dropped = self.dropped
+        parts = [
+            f"{stage}[{detail}]={seconds:.3f}s" if detail else f"{stage}={seconds:.3f}s"
+            for stage, detail, _, seconds in spans
+        ]
+        if dropped:
+            parts.append(f"(+{dropped} spans dropped)")
+        return " ".join(parts) or "(no spans)"
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+@contextmanager
+def trace_scope(trace: Trace) -> Iterator[Trace]:
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Histogram:
+    """Thread-safe labelled histogram rendered in Prometheus text format"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in series:
+            label_text = ",".join(f'{name}="{_escape_label(value)}"' for name, value in zip(self.labelnames, labels))
+            prefix = label_text + "," if label_text else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound:g}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{self.name}_sum{suffix} {total:.6f}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+REQUEST_SECONDS = Histogram(
+    "visual4math_http_request_duration_seconds",
+    "HTTP request latency until the last body chunk, by route template",
+    ("method", "route", "status")
+)
+STAGE_SECONDS = Histogram(
+    "visual4math_stage_duration_seconds",
+    "Time spent in each traced stage",
+    ("stage",)
+)
+OPENAI_SECONDS = Histogram(
+    "visual4math_openai_duration_seconds",
+    "OpenAI latency per call site; phase is first_byte (response headers) or total",
+    ("call_site", "phase")
+)
+HISTOGRAMS = (REQUEST_SECONDS, STAGE_SECONDS, OPENAI_SECONDS)
+
+def record_span(stage: str, seconds: float, detail: Optional[str] = None,
+                started: Optional[float] = None, trace: Optional[Trace] = None):
+    """Record a finished stage; trace defaults to the current request's trace"""
+    STAGE_SECONDS.observe(seconds, stage)
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        if started is None:
+            started = time.perf_counter() - seconds
+        trace.add_span(stage, detail, started, seconds)
+
+@contextmanager
+def span(stage: str, detail: Optional[str] = None) -> Iterator[None]:
+    """Time the enclosed block as one stage of the current request"""
+    # Only reads the ContextVar, so it is safe to use inside async generators
+    trace = _current_trace.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - started, detail, started, trace)
+
+def traced(stage: str):
+    """Decorator form of span() for sync and async functions"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Call site of the OpenAI call in progress, set by app.clients.retry_policy so the
+# HTTP client's response hook can label time to first byte
+_openai_call_site: ContextVar[str] = ContextVar("openai_call_site", default="other")
+
+@contextmanager
+def openai_call_scope(call_site: str) -> Iterator[None]:
+    token = _openai_call_site.set(call_site)
+    try:
+        yield
+    finally:
+        _openai_call_site.reset(token)
+
+def observe_openai(phase: str, seconds: float, call_site: Optional[str] = None,
+                   trace: Optional[Trace] = None):
+    call_site = call_site or _openai_call_site.get()
+    OPENAI_SECONDS.observe(seconds, call_site, phase)
+    record_span(f"openai_{phase}", seconds, call_site, trace=trace)
+
+def openai_call_timer(call_site: str) -> Callable[[], Optional[float]]:
+    """Start timing a call the caller tracks itself (e.g. a stream); the returned
+    callback records the total once, whenever and wherever it runs, and returns it"""
+    trace = _current_trace.get()
+    started = time.perf_counter()
+    done = False
+
+    def finish() -> Optional[float]:
+        nonlocal done
+        if done:
+            return None
+        done = True
+        seconds = time.perf_counter() - started
+        observe_openai("total", seconds, call_site, trace)
+        return seconds
+    return finish
+
+def finish_trace(trace: Trace, route: str, status: int):
+    seconds = time.perf_counter() - trace.started
+    REQUEST_SECONDS.observe(seconds, trace.method, route, str(status))
+    if TRACE_SLOW_REQUEST_SECONDS > 0 and seconds >= TRACE_SLOW_REQUEST_SECONDS:
+        logger.warning(f"🐢 Slow request {trace.method} {route} -> {status} in {seconds:.2f}s "
+                       f"[{trace.request_id}]: {trace.summary()}")
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"⏱️ {trace.method} {route} -> {status} in {seconds:.3f}s "
+                     f"[{trace.request_id}]: {trace.summary()}")
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
@@ -7,20 +7,19 @@ Handles chat interactions, image generation, and research data collection.
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 import os
-import logging
 from dotenv import load_dotenv
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 import pathlib
 
 from app.api import router as api_router
+from app.api.deadline import RequestDeadlineMiddleware
+from app.api.tracing import TracingMiddleware
+from app.api.usage import UsageContextMiddleware
 from app.database.db import init_db
+from app.logging_config import configure_logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler()]
-)
+configure_logging()
 
 env_path = pathlib.Path(__file__).parent / '.env'
 if env_path.exists():
@@ -47,7 +46,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+app.add_middleware(RequestDeadlineMiddleware)
+app.add_middleware(UsageContextMiddleware)
+# Added last so it is outermost and times the whole request
+app.add_middleware(TracingMiddleware)
 
 app.include_router(api_router)
 
@@ -82,7 +86,7 @@ if os.path.exists(static_favicon_path):
 if os.path.exists(static_index_path):
     @app.get("/{full_path:path}")
     async def serve_spa(full_path: str):
-        if full_path.startswith(("api", "docs", "redoc", "chat", "image", "research")):
+        if full_path.startswith(("api", "docs", "redoc", "chat", "image", "research", "admin")):
             raise HTTPException(status_code=404)
         return FileResponse(static_index_path)
 
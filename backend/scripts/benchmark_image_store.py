@@ -0,0 +1,99 @@
+"""
+Benchmark storing base64 images: the normalizing path against the fast path.
+
+The normalizing path decodes every image, flattens it onto white and re-encodes
+it as PNG on the request path. The fast path checks the header and stores the
+original bytes, leaving normalization to the background worker. Both run on
+synthetic 1024x1024 RGBA PNGs (like gpt-image finals) in a temporary store; the
+background normalization cost is measured separately.
+
+Usage (from the backend directory):
+    python scripts/benchmark_image_store.py [--images 20] [--size 1024]
+"""
+import argparse
+import base64
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Keep the benchmark's images out of the real cache, and normalize explicitly below
+os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="image_store_bench_")
+os.environ["IMAGE_NORMALIZE_ENABLED"] = "0"
+
+from PIL import Image  # noqa: E402
+
+import app.services.image_storage_service as image_storage_service  # noqa: E402
+from app.services.image_store import image_store  # noqa: E402
+
+def make_image(size: int, seed: int) -> str:
+    """A data URL of an RGBA PNG with gradients, shapes and noise, so it compresses like a real image"""
+    rng = random.Random(seed)
+    img = Image.linear_gradient("L").resize((size, size)).convert("RGBA")
+    overlay = Image.effect_noise((size, size), rng.uniform(20, 60)).convert("RGBA")
+    img = Image.blend(img, overlay, 0.3)
+    for _ in range(12):
+        x, y = rng.randrange(size), rng.randrange(size)
+        box = (x, y, min(size, x + rng.randrange(50, 300)), min(size, y + rng.randrange(50, 300)))
+        img.paste((rng.randrange(256), rng.randrange(256), rng.randrange(256), 255), box)
+    output = BytesIO()
+    img.save(output, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(output.getvalue()).decode("ascii")
+
+def report(name: str, latencies_ms, stored_bytes: int):
+    ordered = sorted(latencies_ms)
+    p95 = ordered[int(0.95 * (len(ordered) - 1))]
+    print(f"\n{name}")
+    print(f"  per image mean / p50 / p95:  {statistics.mean(ordered):.1f}ms / {statistics.median(ordered):.1f}ms / {p95:.1f}ms")
+    print(f"  stored on the request path:  {stored_bytes / 1024 / 1024:.1f} MB")
+
+def run(images, fast_path: bool):
+    image_storage_service.IMAGE_STORE_FAST_PATH = fast_path
+    latencies, image_ids = [], []
+    for data_url in images:
+        start = time.perf_counter()
+        url = image_storage_service.store_image_from_base64(data_url)
+        latencies.append((time.perf_counter() - start) * 1000)
+        image_ids.append(url.rsplit("/", 1)[-1])
+    stored = sum(image_store.lookup(image_id).size for image_id in image_ids)
+    return latencies, stored, image_ids
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the image store's normalizing and fast paths")
+    parser.add_argument("--images", type=int, default=20, help="Images per path")
+    parser.add_argument("--size", type=int, default=1024, help="Width and height of the test images")
+    args = parser.parse_args()
+
+    print(f"Generating {2 * args.images} {args.size}x{args.size} RGBA PNGs in {image_store.root}...")
+    # Different images per path, so neither run hits the other's deduplicated entries
+    slow_images = [make_image(args.size, seed) for seed in range(args.images)]
+    fast_images = [make_image(args.size, seed) for seed in range(args.images, 2 * args.images)]
+
+    slow_latencies, slow_stored, _ = run(slow_images, fast_path=False)
+    report("Normalizing path (decode, flatten, PNG re-encode)", slow_latencies, slow_stored)
+
+    fast_latencies, fast_stored, fast_ids = run(fast_images, fast_path=True)
+    report("Fast path (header check, original bytes)", fast_latencies, fast_stored)
+
+    background, normalized_bytes = [], 0
+    for image_id in fast_ids:
+        start = time.perf_counter()
+        normalized = image_storage_service.image_normalizer.normalize(image_id)
+        background.append((time.perf_counter() - start) * 1000)
+        normalized_bytes += normalized.size
+    print("\nBackground normalization (optimized PNG, off the request path)")
+    print(f"  per image mean:              {statistics.mean(background):.1f}ms")
+    print(f"  normalized derivatives:      {normalized_bytes / 1024 / 1024:.1f} MB")
+
+    saved = statistics.mean(slow_latencies) - statistics.mean(fast_latencies)
+    print(f"\nRequest-path time saved per image: {saved:.1f}ms "
+          f"({statistics.mean(slow_latencies) / max(statistics.mean(fast_latencies), 1e-6):.0f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark the local intent classifier against logged GPT-4o labels.
+
+Trains on the older part of the log, evaluates on the newest part and reports
+accuracy against the GPT-4o labels, fast-path coverage at the configured
+threshold, local latency, and the intent latency saved per request. Fast-path
+decisions that were audited by GPT-4o (INTENT_AUDIT_SAMPLE_RATE) give the accuracy
+of the answers that were actually served without GPT-4o.
+
+Usage (from the backend directory):
+    python scripts/benchmark_intent_classifier.py [--log intent_log.jsonl] [--holdout 0.2]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import app.services.intent_classifier as intent_classifier  # noqa: E402
+from app.services.intent_classifier import (  # noqa: E402
+    INTENT_LOG_PATH, INTENT_FAST_PATH_THRESHOLD, SEED_SAMPLES,
+    NaiveBayesIntentModel, extract_features, load_intent_samples
+)
+
+def evaluate(name, classify, samples, threshold, mean_llm_latency_ms):
+    correct = 0
+    covered = 0
+    covered_correct = 0
+    latencies = []
+    for sample in samples:
+        start = time.perf_counter()
+        intent, confidence = classify(sample["user_input"], sample.get("has_image_in_history", False))
+        latencies.append((time.perf_counter() - start) * 1000)
+        if intent == sample["intent"]:
+            correct += 1
+        if intent and confidence >= threshold:
+            covered += 1
+            covered_correct += intent == sample["intent"]
+
+    total = len(samples)
+    coverage = covered / total
+    # Requests below the threshold fall back to GPT-4o, whose label is correct by definition
+    end_to_end_accuracy = (covered_correct + (total - covered)) / total
+    mean_local_ms = statistics.mean(latencies)
+    saved_ms = coverage * mean_llm_latency_ms - mean_local_ms
+    print(f"\n{name}")
+    print(f"  raw accuracy vs GPT-4o:      {correct / total:.1%}")
+    print(f"  fast-path coverage:          {coverage:.1%} (threshold {threshold})")
+    print(f"  fast-path accuracy:          {covered_correct / covered:.1%}" if covered else "  fast-path accuracy:          n/a")
+    print(f"  end-to-end accuracy:         {end_to_end_accuracy:.1%}")
+    print(f"  local latency mean / p95:    {mean_local_ms:.2f}ms / {sorted(latencies)[int(0.95 * (total - 1))]:.2f}ms")
+    print(f"  intent latency saved / req:  {saved_ms:.0f}ms (GPT-4o mean {mean_llm_latency_ms:.0f}ms)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local intent classifier")
+    parser.add_argument("--log", default=INTENT_LOG_PATH, help="JSONL file with logged GPT-4o intent labels")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of newest samples used for evaluation")
+    parser.add_argument("--threshold", type=float, default=INTENT_FAST_PATH_THRESHOLD)
+    args = parser.parse_args()
+
+    samples = sorted(load_intent_samples(args.log), key=lambda s: s.get("timestamp", 0))
+    if not samples:
+        # Nothing logged yet: evaluate on the seed examples only
+        samples = [
+            {"user_input": text, "has_image_in_history": has_image, "intent": label}
+            for text, has_image, label in SEED_SAMPLES
+        ]
+        train, test = [], samples
+        print(f"No logged samples at {args.log}; evaluating heuristics on {len(test)} seed examples")
+    else:
+        split = max(1, int(len(samples) * (1 - args.holdout)))
+        train, test = samples[:split], samples[split:] or samples
+        print(f"Training on {len(train)} samples, evaluating on {len(test)}")
+
+    llm_latencies = [s["llm_latency_ms"] for s in samples if s.get("llm_latency_ms")]
+    mean_llm_latency_ms = statistics.mean(llm_latencies) if llm_latencies else 1000.0
+
+    evaluate("Heuristics only", intent_classifier.heuristic_intent, test, args.threshold, mean_llm_latency_ms)
+
+    audited = [s for s in samples if s.get("audit")]
+    if audited:
+        agreed = sum(s.get("local_intent") == s["intent"] for s in audited)
+        print(f"\nServed fast-path decisions audited by GPT-4o: {len(audited)}")
+        print(f"  fast-path accuracy as served: {agreed / len(audited):.1%}")
+
+    if train:
+        training = [(extract_features(t, h), label) for t, h, label in SEED_SAMPLES]
+        training += [(extract_features(s["user_input"], s.get("has_image_in_history", False)), s["intent"]) for s in train]
+        intent_classifier._model = NaiveBayesIntentModel.train(training)
+        intent_classifier._model_loaded = True
+        evaluate("Heuristics + Naive Bayes", intent_classifier.classify_intent, test, args.threshold, mean_llm_latency_ms)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
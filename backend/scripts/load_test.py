@@ -0,0 +1,461 @@
+"""
+End-to-end load test and latency benchmark for the backend API.
+
+Simulated participants run a weighted mix of study traffic:
+- tool1: streamed chat turns (POST /chat/stream)
+- tool2: problem parsing plus a streamed layout image (POST /parse/parse-mwp, /image/generate-image-stream)
+- tool3: manipulatives (POST /manipulatives/generate, GET /manipulatives/icons)
+- tracking: login, submissions and logout (/tracking/*)
+
+For every endpoint it reports p50/p95/p99 latency, time to first event for streams,
+requests/s, errors and event-loop lag while that endpoint was in flight. Results
+are written as JSON and can be compared against an earlier run.
+
+By default the backend runs in-process (uvicorn in a background thread) with its
+database, dataset, image cache and LLM cache in a temporary directory, so the
+measured event-loop lag is the server's own. --standin starts the OpenAI stand-in
+(scripts/openai_standin.py) in replay mode so no API credits are used.
+With --base-url an already running server is tested instead; the lag is then the
+load generator's.
+
+Usage (from the backend directory):
+    python scripts/load_test.py --standin [--users 24] [--duration 60] [--out load_test_results.json]
+    python scripts/load_test.py --base-url http://127.0.0.1:8000 [--mix tool1=4,tool2=2,tool3=2,tracking=1]
+    python scripts/load_test.py --standin --compare baseline.json [--max-regression 0.2]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+PROBLEMS = [
+    "Marin has nine apples and Donald has two apples. How many apples do Marin and Donald have together?",
+    "If Carl has a total of 89 stamps and Kevin has 57, how many more stamps does Carl have than Kevin?",
+    "For the school play, the chairs have been put into 27 rows with 16 chairs in each row. How many chairs are there?",
+    "Lexie collected 21 paper clips and wants to put them into 3 boxes equally. How many paper clips go in each box?",
+    "There were 36 dogs and 29 cats in a pet center. After 20 dogs were adopted, how many pets were left?",
+]
+CHAT_TURNS = [
+    "Can you explain how to solve this problem step by step?",
+    "Draw a picture that shows the apples of both children.",
+    "Explain the problem and show it with a visual.",
+    "Why do we subtract here instead of adding?",
+]
+TEST_USER_IDS = [f"visual4mathtest{i}" for i in range(1, 13)]
+DEFAULT_MIX = "tool1=4,tool2=2,tool3=2,tracking=1"
+LAG_INTERVAL = 0.01
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def layout_png() -> bytes:
+    """A small layout screenshot like the one Tool 2 uploads"""
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", (512, 512), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((40, 40, 240, 240), outline=(0, 0, 0), width=3)
+    draw.rectangle((280, 40, 480, 240), outline=(0, 0, 0), width=3)
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+# --- measurements ---
+
+class LoopLagMonitor:
+    """Samples how late a periodic sleep wakes up on the event loop it runs on"""
+
+    def __init__(self):
+        self.samples: List[Tuple[float, float]] = []  # (monotonic time, lag seconds)
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            now = time.monotonic()
+            self.samples.append((now, max(0.0, now - expected)))
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+class Recorder:
+    """Request intervals, latencies and errors per endpoint"""
+
+    def __init__(self):
+        self.results: Dict[str, Dict[str, List]] = {}
+
+    def add(self, endpoint: str, start: float, end: float, first_event: Optional[float], ok: bool):
+        result = self.results.setdefault(endpoint, {"intervals": [], "latencies": [], "first_event": [], "errors": 0})
+        result["intervals"].append((start, end))
+        if ok:
+            result["latencies"].append(end - start)
+            if first_event is not None:
+                result["first_event"].append(first_event - start)
+        else:
+            result["errors"] += 1
+
+    def summarize(self, duration: float, lag_samples: List[Tuple[float, float]]) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, result in sorted(self.results.items()):
+            intervals = sorted(result["intervals"])
+            lags = _lags_during(intervals, lag_samples)
+            latencies = result["latencies"]
+            summary = {
+                "requests": len(intervals),
+                "errors": result["errors"],
+                "requests_per_second": len(intervals) / duration,
+                "latency_ms": _distribution(latencies),
+                "loop_lag_ms": _distribution(lags),
+            }
+            if result["first_event"]:
+                summary["first_event_ms"] = _distribution(result["first_event"])
+            endpoints[endpoint] = summary
+        all_lags = [lag for _, lag in lag_samples]
+        total = sum(len(r["intervals"]) for r in self.results.values())
+        return {
+            "requests": total,
+            "errors": sum(r["errors"] for r in self.results.values()),
+            "requests_per_second": total / duration,
+            "loop_lag_ms": _distribution(all_lags),
+            "endpoints": endpoints,
+        }
+
+def _distribution(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": percentile(values, 0.50) * 1000,
+        "p95": percentile(values, 0.95) * 1000,
+        "p99": percentile(values, 0.99) * 1000,
+        "max": max(values) * 1000 if values else 0.0,
+        "mean": statistics.mean(values) * 1000 if values else 0.0,
+    }
+
+def _lags_during(intervals: List[Tuple[float, float]], lag_samples: List[Tuple[float, float]]) -> List[float]:
+    """Lag samples taken while at least one of the (sorted) intervals was in flight"""
+    lags = []
+    index = 0
+    furthest_end = float("-inf")
+    for sampled_at, lag in lag_samples:
+        while index < len(intervals) and intervals[index][0] <= sampled_at:
+            furthest_end = max(furthest_end, intervals[index][1])
+            index += 1
+        if sampled_at <= furthest_end:
+            lags.append(lag)
+    return lags
+
+# --- scenarios ---
+
+class Participant:
+    """One simulated study participant running scenarios until the deadline"""
+
+    def __init__(self, index: int, client: httpx.AsyncClient, recorder: Recorder, think_time: float,
+                 layout_image: bytes):
+        self.index = index
+        self.user_id = TEST_USER_IDS[index % len(TEST_USER_IDS)]
+        self.client = client
+        self.recorder = recorder
+        self.think_time = think_time
+        self.layout_image = layout_image
+        self.session_id: Optional[int] = None
+        # Attributes the participant's OpenAI usage (see /admin/usage)
+        self.headers = {"X-User-ID": self.user_id}
+
+    async def request(self, endpoint: str, method: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.monotonic()
+        kwargs.setdefault("headers", self.headers)
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.recorder.add(endpoint, start, time.monotonic(), None, ok)
+        return response
+
+    async def stream(self, endpoint: str, path: str, **kwargs) -> bool:
+        """POST and read an SSE response to the end; errors inside the stream count as failures"""
+        start = time.monotonic()
+        first_event = None
+        ok = False
+        kwargs.setdefault("headers", self.headers)
+        try:
+            async with self.client.stream("POST", path, **kwargs) as response:
+                ok = response.status_code < 400
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    if first_event is None:
+                        first_event = time.monotonic()
+                    if '"type": "error"' in line or '"type":"error"' in line:
+                        ok = False
+        except httpx.HTTPError:
+            ok = False
+        self.recorder.add(endpoint, start, time.monotonic(), first_event, ok)
+        return ok
+
+    async def tool1(self):
+        problem = random.choice(PROBLEMS)
+        history = [{"role": "user", "content": problem}]
+        for turn in random.sample(CHAT_TURNS, 2):
+            await self.stream("POST /chat/stream", "/chat/stream", json={
+                "user_input": turn, "conversation_history": history, "user_id": self.user_id
+            })
+            history.append({"role": "user", "content": turn})
+            await self.think()
+
+    async def tool2(self):
+        problem = random.choice(PROBLEMS)
+        await self.request("POST /parse/parse-mwp", "POST", "/parse/parse-mwp", json={"problem_text": problem})
+        await self.think()
+        await self.stream("POST /image/generate-image-stream", "/image/generate-image-stream",
+                          data={"prompt": f"=== LAYOUT SPECIFICATION ===\n{problem}", "user_id": self.user_id},
+                          files={"layout_image": ("layout.png", self.layout_image, "image/png")})
+
+    async def tool3(self):
+        problem = random.choice(PROBLEMS)
+        await self.request("POST /manipulatives/generate", "POST", "/manipulatives/generate",
+                           json={"problem_text": problem})
+        await self.request("GET /manipulatives/icons", "GET", "/manipulatives/icons")
+
+    async def tracking(self):
+        if self.session_id is None:
+            response = await self.request("POST /tracking/auth", "POST", "/tracking/auth",
+                                          json={"user_id": self.user_id})
+            if response is None or response.status_code >= 400:
+                return
+            self.session_id = response.json()["session_id"]
+        ids = {"user_id": self.user_id, "session_id": self.session_id}
+        await self.request("POST /tracking/tool-a/image", "POST", "/tracking/tool-a/image",
+                           json={**ids, "image_url": "/images/loadtest", "user_input": "load test"})
+        await self.request("POST /tracking/tool-c/canvas", "POST", "/tracking/tool-c/canvas",
+                           json={**ids, "canvas_data": {"elements": [{"id": "a", "x": 10, "y": 20}]}})
+        if random.random() < 0.2:
+            await self.request("POST /tracking/session/end", "POST", "/tracking/session/end", json=ids)
+            self.session_id = None
+
+    async def think(self):
+        if self.think_time:
+            await asyncio.sleep(random.expovariate(1.0 / self.think_time))
+
+    async def run(self, mix: Dict[str, float], deadline: float):
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        # Stagger the start so participants don't move in lockstep
+        await asyncio.sleep(random.uniform(0, self.think_time or 0.1))
+        while time.monotonic() < deadline:
+            await getattr(self, random.choices(names, weights)[0])()
+            await self.think()
+
+# --- servers ---
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing is listening on port {port}")
+
+def start_standin(args) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    command = [sys.executable, os.path.join(BACKEND_DIR, "scripts", "openai_standin.py"), "replay",
+               "--port", str(port), "--latency", args.standin_latency,
+               "--latency-scale", str(args.standin_latency_scale)]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR)
+    wait_for_port(port)
+    return process, f"http://127.0.0.1:{port}/v1"
+
+def start_backend(workdir: str) -> Tuple[str, LoopLagMonitor]:
+    """Run the app with uvicorn in a background thread, isolated in workdir"""
+    os.environ["DATASET_DIR"] = os.path.join(workdir, "dataset")
+    os.environ["CACHE_DIR"] = os.path.join(workdir, "cached_images")
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "llm_cache.db")
+    os.environ["INTENT_LOG_PATH"] = os.path.join(workdir, "intent_log.jsonl")
+
+    import uvicorn
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from main import app
+    from app.database.db import get_db
+    from app.models.tracking import Base
+
+    # Tracking submissions go to a throwaway database instead of visual4math.db
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+                           connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_test_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = get_test_db
+    monitor = LoopLagMonitor()
+    app.add_event_handler("startup", monitor.start)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="load-test-backend", daemon=True).start()
+    wait_for_port(port)
+    return f"http://127.0.0.1:{port}", monitor
+
+# --- reporting ---
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("tool1", "tool2", "tool3", "tracking"):
+            raise ValueError(f"Unknown scenario: {name}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n{'endpoint':<36} {'req':>6} {'err':>5} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'lag p99':>8}")
+    for endpoint, summary in report["endpoints"].items():
+        latency = summary["latency_ms"]
+        print(f"{endpoint:<36} {summary['requests']:>6} {summary['errors']:>5} "
+              f"{summary['requests_per_second']:>7.2f} {latency['p50']:>7.0f}ms {latency['p95']:>7.0f}ms "
+              f"{latency['p99']:>7.0f}ms {summary['loop_lag_ms']['p99']:>6.1f}ms")
+    lag = report["loop_lag_ms"]
+    print(f"\ntotal: {report['requests']} requests, {report['errors']} errors, "
+          f"{report['requests_per_second']:.2f} req/s, {report['meta']['lag_source']} loop lag "
+          f"p50 {lag['p50']:.1f}ms / p99 {lag['p99']:.1f}ms / max {lag['max']:.1f}ms")
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> bool:
+    """Print p95 and throughput changes per endpoint; False if any p95 regressed too much"""
+    print(f"\ncompared with {baseline['meta']['timestamp']}:")
+    ok = True
+    for endpoint, summary in report["endpoints"].items():
+        before = baseline["endpoints"].get(endpoint)
+        if before is None:
+            continue
+        p95, p95_before = summary["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        change = (p95 - p95_before) / p95_before if p95_before else 0.0
+        regressed = change > max_regression
+        ok = ok and not regressed
+        print(f"  {endpoint:<36} p95 {p95_before:>7.0f}ms -> {p95:>7.0f}ms ({change:+.0%})"
+              f"  req/s {before['requests_per_second']:.2f} -> {summary['requests_per_second']:.2f}"
+              + ("  REGRESSION" if regressed else ""))
+    return ok
+
+async def run_load(base_url: str, args, mix: Dict[str, float], server_monitor: Optional[LoopLagMonitor]):
+    recorder = Recorder()
+    client_monitor = LoopLagMonitor()
+    if server_monitor is None:
+        client_monitor.start()
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        start = time.monotonic()
+        deadline = start + args.duration
+        layout_image = layout_png()
+        participants = [Participant(i, client, recorder, args.think_time, layout_image) for i in range(args.users)]
+        await asyncio.gather(*(participant.run(mix, deadline) for participant in participants))
+        duration = time.monotonic() - start
+    client_monitor.stop()
+    lag_samples = (server_monitor or client_monitor).samples
+    return recorder.summarize(duration, lag_samples), duration
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test and latency benchmark for the backend API")
+    parser.add_argument("--base-url", help="Test a running server instead of starting one in-process")
+    parser.add_argument("--standin", action="store_true", help="Start the OpenAI stand-in in replay mode")
+    parser.add_argument("--standin-latency", default="recorded", help="Latency spec passed to the stand-in")
+    parser.add_argument("--standin-latency-scale", type=float, default=1.0)
+    parser.add_argument("--users", type=int, default=24, help="Concurrent simulated participants")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to generate load for")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean pause between a participant's actions")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights, e.g. tool1=4,tool2=2,tool3=2,tracking=1")
+    parser.add_argument("--timeout", type=float, default=180.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default="load_test_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed relative p95 increase per endpoint before --compare fails")
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        print(e)
+        return 1
+    random.seed(args.seed)
+
+    standin = None
+    workdir = None
+    server_monitor = None
+    try:
+        if args.standin:
+            standin, standin_url = start_standin(args)
+            os.environ["OPENAI_BASE_URL"] = standin_url
+            print(f"OpenAI stand-in running at {standin_url}")
+        base_url = args.base_url
+        if base_url is None:
+            workdir = tempfile.TemporaryDirectory(prefix="visual4math-loadtest-")
+            base_url, server_monitor = start_backend(workdir.name)
+        print(f"Running {args.users} participants for {args.duration:.0f}s against {base_url} (mix {args.mix})")
+
+        report, duration = asyncio.run(run_load(base_url, args, mix, server_monitor))
+    finally:
+        if standin is not None:
+            standin.terminate()
+            standin.wait()
+
+    report["meta"] = {
+        "timestamp": datetime.now().isoformat(),
+        "base_url": args.base_url or "in-process",
+        "standin": args.standin,
+        "standin_latency": args.standin_latency if args.standin else None,
+        "users": args.users,
+        "duration_seconds": duration,
+        "think_time": args.think_time,
+        "mix": mix,
+        "lag_source": "server" if server_monitor is not None else "client",
+    }
+    print_report(report)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.out}")
+    if workdir is not None:
+        workdir.cleanup()
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.max_regression):
+            return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
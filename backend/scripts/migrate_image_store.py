@@ -0,0 +1,86 @@
+"""
+Move images from the old flat cache directory into the sharded image store.
+
+Older versions wrote every image to CACHE_DIR/{id}.png, with {id}_metadata.json
+sidecars and image proxy downloads as CACHE_DIR/{md5(url)}.png. This moves each
+image into objects/ab/cd/ (a rename, no copy), indexes it, folds the sidecar
+metadata into the index and maps proxy downloads back to their URL hash. Image
+IDs don't change, so existing /images/{id} URLs keep working. The server adopts
+unmigrated images lazily on first access, so it can keep running meanwhile.
+
+Usage (from the backend directory):
+    python scripts/migrate_image_store.py [--dry-run] [--keep-sidecars]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.services.image_store import CACHE_DIR, generate_image_id, image_store  # noqa: E402
+
+IMAGE_FILE = re.compile(r"^([0-9a-f]{16})\.png$")
+PROXY_FILE = re.compile(r"^([0-9a-f]{32})\.png$")
+SIDECAR_FILE = re.compile(r"^([0-9a-f]{16})_metadata\.json$")
+
+def migrate(dry_run: bool = False, keep_sidecars: bool = False) -> dict:
+    counts = {"images": 0, "proxied": 0, "metadata": 0, "bytes": 0, "skipped": 0, "failed": 0}
+    entries = sorted(
+        (entry for entry in os.scandir(CACHE_DIR)
+         if entry.is_file() and not entry.path.startswith(image_store.index_path)),
+        # Images before sidecars, so metadata always has a row to land in
+        key=lambda entry: SIDECAR_FILE.match(entry.name) is not None
+    )
+    for entry in entries:
+        try:
+            image_match = IMAGE_FILE.match(entry.name)
+            proxy_match = PROXY_FILE.match(entry.name)
+            sidecar_match = SIDECAR_FILE.match(entry.name)
+            if image_match:
+                counts["images"] += 1
+                counts["bytes"] += entry.stat().st_size
+                if not dry_run:
+                    image_store.adopt_file(entry.path, image_match.group(1), created=entry.stat().st_mtime)
+            elif proxy_match:
+                counts["proxied"] += 1
+                counts["bytes"] += entry.stat().st_size
+                if not dry_run:
+                    with open(entry.path, "rb") as f:
+                        image_id = generate_image_id(f.read())
+                    record = image_store.adopt_file(entry.path, image_id, created=entry.stat().st_mtime)
+                    image_store.map_proxied_url(proxy_match.group(1), record)
+            elif sidecar_match:
+                counts["metadata"] += 1
+                if not dry_run:
+                    with open(entry.path, encoding="utf-8") as f:
+                        metadata = json.load(f)
+                    if image_store.set_metadata(sidecar_match.group(1), metadata) and not keep_sidecars:
+                        os.remove(entry.path)
+            else:
+                counts["skipped"] += 1
+        except Exception as e:
+            counts["failed"] += 1
+            print(f"Failed to migrate {entry.name}: {e}")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate the flat image cache into the sharded image store")
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be migrated")
+    parser.add_argument("--keep-sidecars", action="store_true",
+                        help="Leave the _metadata.json files in place after indexing them")
+    args = parser.parse_args()
+
+    print(f"Migrating {CACHE_DIR} -> {image_store.objects_dir}{' (dry run)' if args.dry_run else ''}")
+    counts = migrate(dry_run=args.dry_run, keep_sidecars=args.keep_sidecars)
+    print(f"Images: {counts['images']}, proxy downloads: {counts['proxied']}, "
+          f"metadata sidecars: {counts['metadata']}, {counts['bytes'] / 1024 / 1024:.1f} MB")
+    print(f"Skipped (not store files): {counts['skipped']}, failed: {counts['failed']}")
+    if not args.dry_run:
+        print(f"Store now holds: {image_store.get_stats()}")
+    return 1 if counts["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
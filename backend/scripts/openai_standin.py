@@ -0,0 +1,376 @@
+"""
+Local OpenAI stand-in for offline load testing.
+
+In `record` mode the stand-in forwards chat.completions, images.generate and
+images.edit requests (streaming or not) to the real API and stores every
+successful response, including the timing of each streamed event (partial images,
+text chunks). In `replay` mode it serves those recordings without network access
+or API credits, with a configurable latency distribution. Requests that were never
+recorded get another recording of the same endpoint, or a synthesized response.
+
+Point the backend at it (both the async and the sync client):
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 uvicorn main:app
+
+Usage (from the backend directory):
+    python scripts/openai_standin.py record [--port 8100] [--recordings openai_recordings]
+    python scripts/openai_standin.py replay [--latency recorded|fixed:MS|uniform:LO:HI|lognormal:MEDIAN:SIGMA]
+        [--latency-scale 1.0] [--on-miss any|synthesize|error] [--error-rate 0.0] [--rpm 500]
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RECORDINGS_DIR = os.path.join(BACKEND_DIR, "openai_recordings")
+OPENAI_UPSTREAM_URL = os.getenv("OPENAI_UPSTREAM_URL", "https://api.openai.com")
+
+ENDPOINTS = {
+    "/v1/chat/completions": "chat_completions",
+    "/v1/images/generations": "images_generate",
+    "/v1/images/edits": "images_edit",
+}
+# Response headers worth keeping in a recording
+RECORDED_HEADERS = ("content-type", "x-ratelimit-limit-requests", "x-ratelimit-remaining-requests",
+                    "x-ratelimit-reset-requests", "x-ratelimit-limit-tokens", "x-ratelimit-remaining-tokens",
+                    "x-ratelimit-reset-tokens")
+
+# --- request keys ---
+
+async def request_fingerprint(request: Request, body: bytes) -> Dict[str, Any]:
+    """The parts of a request that decide its response; files are reduced to hashes"""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        fingerprint = {}
+        for name, value in form.multi_items():
+            if hasattr(value, "read"):
+                fingerprint[name] = hashlib.sha256(await value.read()).hexdigest()
+            else:
+                fingerprint[name] = value
+        return fingerprint
+    try:
+        return json.loads(body or b"{}")
+    except json.JSONDecodeError:
+        return {"raw": hashlib.sha256(body).hexdigest()}
+
+def is_streaming(fingerprint: Dict[str, Any]) -> bool:
+    return str(fingerprint.get("stream", "")).lower() in ("true", "1")
+
+def make_key(endpoint: str, fingerprint: Dict[str, Any]) -> str:
+    payload = json.dumps(fingerprint, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{endpoint}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]}"
+
+# --- recordings ---
+
+class RecordingStore:
+    """One JSON file per request key, each holding the recorded responses for it"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._by_key: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_kind: Dict[tuple, List[Dict[str, Any]]] = {}
+        self._cursors: Dict[Any, Any] = {}
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".json"):
+                with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                    for recording in json.load(f):
+                        self._index(name[:-len(".json")], recording)
+
+    def _index(self, key: str, recording: Dict[str, Any]):
+        self._by_key.setdefault(key, []).append(recording)
+        self._by_kind.setdefault((recording["endpoint"], recording["stream"]), []).append(recording)
+
+    def add(self, key: str, recording: Dict[str, Any]):
+        self._index(key, recording)
+        path = os.path.join(self.directory, f"{key}.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._by_key[key], f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _next(self, cursor_key, recordings: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # Round-robin so repeated requests replay every recorded variant
+        cursor = self._cursors.get(cursor_key)
+        if cursor is None:
+            cursor = self._cursors[cursor_key] = itertools.cycle(range(len(recordings)))
+        return recordings[next(cursor) % len(recordings)]
+
+    def find(self, key: str) -> Optional[Dict[str, Any]]:
+        recordings = self._by_key.get(key)
+        return self._next(key, recordings) if recordings else None
+
+    def find_similar(self, endpoint: str, stream: bool) -> Optional[Dict[str, Any]]:
+        recordings = self._by_kind.get((endpoint, stream))
+        return self._next((endpoint, stream), recordings) if recordings else None
+
+    def __len__(self):
+        return sum(len(recordings) for recordings in self._by_key.values())
+
+# --- latency ---
+
+class LatencyModel:
+    """Time to first byte from a distribution (or the recording); stream gaps follow the recording"""
+
+    def __init__(self, spec: str, scale: float, stream_gap_ms: float):
+        self.scale = scale
+        self.stream_gap = stream_gap_ms / 1000.0
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        expected = {"recorded": 0, "fixed": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"Invalid latency spec: {spec}")
+
+    def first_byte(self, recorded: Optional[float]) -> float:
+        if self.kind == "fixed":
+            seconds = self.params[0] / 1000.0
+        elif self.kind == "uniform":
+            seconds = random.uniform(self.params[0], self.params[1]) / 1000.0
+        elif self.kind == "lognormal":
+            median_ms, sigma = self.params
+            seconds = random.lognormvariate(math.log(median_ms), sigma) / 1000.0
+        else:
+            seconds = recorded if recorded is not None else 0.2
+        return seconds * self.scale
+
+    def gap(self, recorded: Optional[float]) -> float:
+        return (recorded if recorded is not None else self.stream_gap) * self.scale
+
+# --- synthesized responses ---
+
+_placeholder_png: Optional[str] = None
+
+def placeholder_png_b64() -> str:
+    """A small gray PNG standing in for generated images"""
+    global _placeholder_png
+    if _placeholder_png is None:
+        from PIL import Image
+        output = io.BytesIO()
+        Image.new("RGB", (256, 256), (200, 200, 200)).save(output, format="PNG")
+        _placeholder_png = base64.b64encode(output.getvalue()).decode("ascii")
+    return _placeholder_png
+
+def _sse(payload: Dict[str, Any], event: Optional[str] = None) -> str:
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(payload)}\n\n"
+
+def synthesize(endpoint: str, fingerprint: Dict[str, Any]) -> Dict[str, Any]:
+    """A plausible response in the recording format, for requests nothing was recorded for"""
+    model = fingerprint.get("model", "gpt-4o")
+    created = int(time.time())
+    stream = is_streaming(fingerprint)
+    if endpoint == "chat_completions":
+        # Intent classification asks for a one-word answer
+        text = "text_solo" if fingerprint.get("max_tokens") and int(fingerprint["max_tokens"]) <= 20 \
+            else "This is a stand-in response for offline load testing."
+        if not stream:
+            body = {
+                "id": "chatcmpl-standin", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+            return {"endpoint": endpoint, "stream": False, "status": 200, "latency": None,
+                    "headers": {"content-type": "application/json"}, "body": json.dumps(body)}
+        events = []
+        for word in text.split(" "):
+            chunk = {"id": "chatcmpl-standin", "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+            events.append({"gap": None, "data": _sse(chunk)})
+        events.append({"gap": None, "data": "data: [DONE]\n\n"})
+        return {"endpoint": endpoint, "stream": True, "status": 200, "latency": None,
+                "headers": {"content-type": "text/event-stream"}, "events": events}
+
+    image_b64 = placeholder_png_b64()
+    prefix = "image_edit" if endpoint == "images_edit" else "image_generation"
+    if not stream:
+        body = {"created": created, "data": [{"b64_json": image_b64}]}
+        return {"endpoint": endpoint, "stream": False, "status": 200, "latency": None,
+                "headers": {"content-type": "application/json"}, "body": json.dumps(body)}
+    events = []
+    for index in range(int(fingerprint.get("partial_images") or 0)):
+        payload = {"type": f"{prefix}.partial_image", "b64_json": image_b64, "partial_image_index": index,
+                   "created_at": created}
+        events.append({"gap": None, "data": _sse(payload, payload["type"])})
+    payload = {"type": f"{prefix}.completed", "b64_json": image_b64, "created_at": created,
+               "usage": {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}}
+    events.append({"gap": None, "data": _sse(payload, payload["type"])})
+    return {"endpoint": endpoint, "stream": True, "status": 200, "latency": None,
+            "headers": {"content-type": "text/event-stream"}, "events": events}
+
+# --- rate limit emulation ---
+
+class RateLimitWindow:
+    """Sliding one-minute request window that fills in x-ratelimit-*-requests headers"""
+
+    def __init__(self, rpm: int):
+        self.rpm = rpm
+        self.calls: deque = deque()
+
+    def headers(self) -> Dict[str, str]:
+        now = time.monotonic()
+        while self.calls and now - self.calls[0] > 60:
+            self.calls.popleft()
+        self.calls.append(now)
+        reset = 60 - (now - self.calls[0]) if self.calls else 0
+        return {
+            "x-ratelimit-limit-requests": str(self.rpm),
+            "x-ratelimit-remaining-requests": str(max(0, self.rpm - len(self.calls))),
+            "x-ratelimit-reset-requests": f"{reset:.1f}s",
+        }
+
+# --- app ---
+
+def create_app(mode: str, store: RecordingStore, latency: LatencyModel, on_miss: str,
+               error_rate: float, rpm: int) -> FastAPI:
+    app = FastAPI(title="OpenAI stand-in")
+    window = RateLimitWindow(rpm)
+    stats = {"recorded": 0, "replayed": 0, "similar": 0, "synthesized": 0, "missed": 0, "injected_errors": 0}
+    upstream = httpx.AsyncClient(base_url=OPENAI_UPSTREAM_URL, timeout=httpx.Timeout(600.0, connect=10.0))
+
+    @app.get("/standin/stats")
+    async def standin_stats():
+        return {"mode": mode, "recordings": len(store), **stats}
+
+    async def record(endpoint: str, key: str, fingerprint: Dict[str, Any], request: Request, body: bytes):
+        headers = {"content-type": request.headers.get("content-type", "application/json")}
+        api_key = os.getenv("OPENAI_API_KEY")
+        headers["authorization"] = f"Bearer {api_key}" if api_key else request.headers.get("authorization", "")
+        start = time.perf_counter()
+        upstream_request = upstream.build_request("POST", request.url.path, content=body, headers=headers)
+        response = await upstream.send(upstream_request, stream=True)
+        kept_headers = {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers}
+
+        if not is_streaming(fingerprint) or response.status_code != 200:
+            content = await response.aread()
+            await response.aclose()
+            if response.status_code == 200:
+                store.add(key, {"endpoint": endpoint, "stream": False, "status": 200,
+                                "latency": time.perf_counter() - start, "headers": kept_headers,
+                                "body": content.decode("utf-8")})
+                stats["recorded"] += 1
+            return Response(content, status_code=response.status_code, headers=kept_headers)
+
+        async def relay():
+            events = []
+            first_byte = None
+            last = None
+            buffer = b""
+            try:
+                async for chunk in response.aiter_bytes():
+                    now = time.perf_counter()
+                    if first_byte is None:
+                        first_byte = now - start
+                        last = now
+                    buffer += chunk
+                    # Record whole SSE frames with the time since the previous one
+                    while b"\n\n" in buffer:
+                        frame, buffer = buffer.split(b"\n\n", 1)
+                        events.append({"gap": now - last if events else None,
+                                       "data": frame.decode("utf-8") + "\n\n"})
+                        last = now
+                    yield chunk
+                store.add(key, {"endpoint": endpoint, "stream": True, "status": 200, "latency": first_byte,
+                                "headers": kept_headers, "events": events})
+                stats["recorded"] += 1
+            finally:
+                await response.aclose()
+
+        return StreamingResponse(relay(), status_code=200, headers=kept_headers, media_type="text/event-stream")
+
+    async def replay(endpoint: str, key: str, fingerprint: Dict[str, Any]):
+        if error_rate and random.random() < error_rate:
+            stats["injected_errors"] += 1
+            return JSONResponse({"error": {"message": "Rate limit reached (injected by stand-in)",
+                                           "type": "requests", "code": "rate_limit_exceeded"}},
+                                status_code=429, headers={"retry-after": "1"})
+
+        recording = store.find(key)
+        if recording is not None:
+            stats["replayed"] += 1
+        elif on_miss == "error":
+            stats["missed"] += 1
+            return JSONResponse({"error": {"message": f"No recording for {key}", "type": "standin_miss"}},
+                                status_code=404)
+        else:
+            recording = store.find_similar(endpoint, is_streaming(fingerprint)) if on_miss == "any" else None
+            if recording is not None:
+                stats["similar"] += 1
+            else:
+                recording = synthesize(endpoint, fingerprint)
+                stats["synthesized"] += 1
+
+        headers = {**recording["headers"], **window.headers()}
+        await asyncio.sleep(latency.first_byte(recording.get("latency")))
+        if not recording["stream"]:
+            return Response(recording["body"], status_code=recording["status"], headers=headers)
+
+        async def events():
+            for index, event in enumerate(recording["events"]):
+                if index:
+                    await asyncio.sleep(latency.gap(event.get("gap")))
+                yield event["data"].encode("utf-8")
+
+        return StreamingResponse(events(), status_code=recording["status"], headers=headers,
+                                 media_type="text/event-stream")
+
+    async def handle(request: Request):
+        endpoint = ENDPOINTS[request.url.path]
+        body = await request.body()
+        fingerprint = await request_fingerprint(request, body)
+        key = make_key(endpoint, fingerprint)
+        if mode == "record":
+            return await record(endpoint, key, fingerprint, request, body)
+        return await replay(endpoint, key, fingerprint)
+
+    for path in ENDPOINTS:
+        app.add_api_route(path, handle, methods=["POST"])
+    app.add_event_handler("shutdown", upstream.aclose)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Record/replay OpenAI stand-in server")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--recordings", default=DEFAULT_RECORDINGS_DIR, help="Directory with recorded responses")
+    parser.add_argument("--latency", default="recorded",
+                        help="Time to first byte: recorded, fixed:MS, uniform:LO_MS:HI_MS or lognormal:MEDIAN_MS:SIGMA")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply all replay delays by this")
+    parser.add_argument("--stream-gap-ms", type=float, default=50.0, help="Gap between synthesized stream events")
+    parser.add_argument("--on-miss", choices=["any", "synthesize", "error"], default="any",
+                        help="Unrecorded requests: reuse a recording of the same endpoint, synthesize, or fail")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of replayed requests answered with 429")
+    parser.add_argument("--rpm", type=int, default=500, help="Requests per minute reported in rate limit headers")
+    args = parser.parse_args()
+
+    try:
+        latency = LatencyModel(args.latency, args.latency_scale, args.stream_gap_ms)
+    except ValueError as e:
+        print(e)
+        return 1
+    store = RecordingStore(args.recordings)
+    print(f"OpenAI stand-in ({args.mode}) with {len(store)} recordings in {args.recordings}")
+    print(f"Point the backend at it with OPENAI_BASE_URL=http://{args.host}:{args.port}/v1")
+    app = create_app(args.mode, store, latency, args.on_miss, args.error_rate, args.rpm)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
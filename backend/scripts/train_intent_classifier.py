@@ -0,0 +1,50 @@
+"""
+Train the local fast-path intent classifier from logged GPT-4o intent labels.
+
+Usage (from the backend directory):
+    python scripts/train_intent_classifier.py [--log intent_log.jsonl] [--out intent_model.json]
+"""
+import argparse
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.services.intent_classifier import (  # noqa: E402
+    INTENT_LOG_PATH, INTENT_MODEL_PATH, SEED_SAMPLES,
+    NaiveBayesIntentModel, extract_features, load_intent_samples
+)
+
+def build_training_set(samples, include_seed=True):
+    training = []
+    if include_seed:
+        training += [(extract_features(text, has_image), label) for text, has_image, label in SEED_SAMPLES]
+    training += [
+        (extract_features(s["user_input"], s.get("has_image_in_history", False)), s["intent"])
+        for s in samples
+    ]
+    return training
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local intent classifier")
+    parser.add_argument("--log", default=INTENT_LOG_PATH, help="JSONL file with logged GPT-4o intent labels")
+    parser.add_argument("--out", default=INTENT_MODEL_PATH, help="Where to write the trained model")
+    parser.add_argument("--no-seed", action="store_true", help="Don't include the built-in seed examples")
+    args = parser.parse_args()
+
+    samples = load_intent_samples(args.log)
+    training = build_training_set(samples, include_seed=not args.no_seed)
+    if not training:
+        print("No training samples found")
+        return 1
+
+    model = NaiveBayesIntentModel.train(training)
+    model.save(args.out)
+    print(f"Trained on {len(training)} samples ({len(samples)} logged) -> {args.out}")
+    for label, count in sorted(model.class_counts.items()):
+        print(f"  {label}: {count}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
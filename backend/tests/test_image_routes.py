@@ -0,0 +1,49 @@
+# backend/tests/test_image_routes.py
+"""Conditional GETs of stored images: revalidation never turns an unknown ID into a 304."""
+import os
+from io import BytesIO
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import app.services.image_storage_service as image_storage_service
+from app.api.routes import images
+from app.services.image_store import ImageStore
+
+UNKNOWN_ID = "0123456789abcdef"
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ImageStore(str(tmp_path), os.path.join(tmp_path, "image_index.db"))
+    monkeypatch.setattr(image_storage_service, "image_store", store)
+    return store
+
+@pytest.fixture
+def client(store):
+    app = FastAPI()
+    app.include_router(images.router, prefix="/images")
+    return TestClient(app)
+
+@pytest.fixture
+def image_id(store):
+    buffer = BytesIO()
+    Image.new("RGB", (4, 4), "red").save(buffer, "PNG")
+    return store.put_bytes(buffer.getvalue()).id
+
+@pytest.mark.parametrize("if_none_match", [None, f'"{UNKNOWN_ID}"', f'W/"{UNKNOWN_ID}"', "*"])
+def test_unknown_image_is_404(client, if_none_match):
+    headers = {"If-None-Match": if_none_match} if if_none_match else {}
+    assert client.get(f"/images/{UNKNOWN_ID}", headers=headers).status_code == 404
+
+@pytest.mark.parametrize("if_none_match", ['"{id}"', 'W/"{id}"', "*"])
+def test_stored_image_revalidates(client, image_id, if_none_match):
+    response = client.get(f"/images/{image_id}", headers={"If-None-Match": if_none_match.format(id=image_id)})
+    assert response.status_code == 304
+    assert response.headers["etag"] == f'"{image_id}"'
+
+def test_stored_image_with_stale_etag_is_served(client, image_id):
+    response = client.get(f"/images/{image_id}", headers={"If-None-Match": '"something-else"'})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
@@ -0,0 +1,34 @@
+# backend/tests/test_intent_classifier.py
+"""The local intent fast path must not decide on the rules alone (no trained model)."""
+import pytest
+
+import app.services.intent_classifier as intent_classifier
+from app.services.intent_classifier import INTENT_FAST_PATH_THRESHOLD, classify_intent, fast_path_intent
+
+PLAIN_QUESTIONS = [
+    "can you help me with fractions?",
+    "I want to understand this problem",
+    "Can you tell me whether 12 is prime?",
+    "Can you explain how to solve 3 + 4?",
+    "What is 3/4 of 12?",
+]
+
+@pytest.fixture
+def no_trained_model(monkeypatch):
+    monkeypatch.setattr(intent_classifier, "_model", None)
+    monkeypatch.setattr(intent_classifier, "_model_loaded", True)
+    monkeypatch.setattr(intent_classifier, "INTENT_FAST_PATH_ENABLED", True)
+
+@pytest.mark.parametrize("text", PLAIN_QUESTIONS)
+def test_plain_questions_go_to_gpt(no_trained_model, text):
+    assert fast_path_intent(text, False) is None
+
+@pytest.mark.parametrize("has_image", [False, True])
+@pytest.mark.parametrize("text", PLAIN_QUESTIONS + [
+    "Draw a graph of y=x^2",
+    "Make this image bigger",
+    "help me to create some images for math word problem",
+])
+def test_rules_alone_stay_below_threshold(no_trained_model, text, has_image):
+    _, confidence = classify_intent(text, has_image)
+    assert confidence < INTENT_FAST_PATH_THRESHOLD
@@ -0,0 +1,41 @@
+# backend/tests/test_usage_tracker.py
+"""Every model the services call must have a price, or its cost is recorded as $0."""
+import re
+from pathlib import Path
+
+import pytest
+
+from app.clients.usage_tracker import UsageTracker, estimate_cost, model_prices
+
+APP_DIR = Path(__file__).resolve().parents[1] / "app"
+
+def models_in_use():
+    pattern = re.compile(r'\bmodel="([^"]+)"')
+    return sorted({model for path in APP_DIR.rglob("*.py") for model in pattern.findall(path.read_text())})
+
+def test_services_call_known_models():
+    assert {"gpt-4o", "gpt-4o-mini", "gpt-image-1", "gpt-image-1.5"} <= set(models_in_use())
+
+@pytest.mark.parametrize("model", models_in_use())
+def test_models_in_use_are_priced(model):
+    assert model_prices(model) is not None
+    assert estimate_cost(model, 1000, 4000) > 0
+
+def test_gpt_image_1_5_is_priced_on_its_own():
+    assert estimate_cost("gpt-image-1.5", 1000, 4000) != estimate_cost("gpt-image-1", 1000, 4000)
+
+@pytest.mark.parametrize("snapshot, base", [
+    ("gpt-4o-2024-08-06", "gpt-4o"),
+    ("gpt-4o-mini-2024-07-18", "gpt-4o-mini"),
+    ("gpt-image-1.5-2025-12-16", "gpt-image-1.5"),
+])
+def test_snapshots_use_their_base_price(snapshot, base):
+    assert model_prices(snapshot) == model_prices(base)
+
+def test_unpriced_calls_are_counted(tmp_path):
+    tracker = UsageTracker(str(tmp_path / "usage.db"), 60, 3600, 1000)
+    tracker.record("test", 0.1, model="some-new-model")
+    tracker.record("test", 0.1, model="gpt-4o")
+    stats = tracker.get_stats()
+    assert stats["unpriced_calls"] == 1
+    assert stats["unpriced_models"] == ["some-new-model"]
@@ -1,6 +1,6 @@
 // src/components/ChatInterface.tsx
 import { useState, useRef } from "react";
-import { sendChatMessage } from "../services/chatApi";
+import { ChatConversation, sendChatMessage } from "../services/chatApi";
 import type { ChatMessage, ChatResponse } from "../services/chatApi";
 
 export default function ChatInterface() {
@@ -9,6 +9,7 @@ export default function ChatInterface() {
   const [isLoading, setIsLoading] = useState(false);
   const [selectedImage, setSelectedImage] = useState<string | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
+  const [conversation] = useState(() => new ChatConversation());
 
   const handleSend = async () => {
     if (!input.trim()) return;
@@ -35,7 +36,10 @@ export default function ChatInterface() {
       const response: ChatResponse = await sendChatMessage(
         input,
         selectedImage || undefined,
-        messages  // This should be the history BEFORE the current message
+        messages,  // This should be the history BEFORE the current message
+        undefined,
+        undefined,
+        conversation
       );
 
       console.log("📥 Received response:", response.type, response.content.slice(0, 100));
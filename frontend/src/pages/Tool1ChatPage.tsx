@@ -2,7 +2,7 @@ import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { sessionManager } from '../utils/sessionManager';
 import { toolAProblems } from '../data/mathProblems';
-import { sendChatMessage, sendChatMessageStreamImage, sendChatMessageStreamUnified } from "../services/chatApi";
+import { ChatConversation, sendChatMessage, sendChatMessageStreamImage, sendChatMessageStreamUnified } from "../services/chatApi";
 import type { ChatMessage, ImageRegion } from "../services/chatApi";
 import MarkdownText from "../components/MarkdownText";
 import TimeProportionalProgress from '../components/TimeProportionalProgress';
@@ -41,6 +41,7 @@ export default function Tool1ChatPage() {
     const [isLoading, setIsLoading] = useState(false);
     const [abortController, setAbortController] = useState<AbortController | null>(null);
     const messagesEndRef = useRef<HTMLDivElement>(null);
+    const [conversation] = useState(() => new ChatConversation());  // Server-side history sync for this page
     const generatingTimersRef = useRef<Map<string, ReturnType<typeof setInterval>>>(new Map()); // Track timers for each message
     
     // Image editing state
@@ -520,7 +521,8 @@ export default function Tool1ChatPage() {
                             undefined,
                             conversationHistory,
                             imageRegion,
-                            undefined
+                            undefined,
+                            conversation
                         );
                         
                         const assistantMessage: ChatMessage = {
@@ -550,7 +552,8 @@ export default function Tool1ChatPage() {
                     undefined,
                     conversationHistory,
                     imageRegion,
-                    undefined
+                    undefined,
+                    conversation
                 );
                 
                 const assistantMessage: ChatMessage = {
@@ -869,7 +872,8 @@ export default function Tool1ChatPage() {
                 undefined,
                 conversationHistory,
                 undefined,
-                undefined
+                undefined,
+                conversation
             );
         } finally {
             setIsLoading(false);
@@ -23,21 +23,89 @@ export interface ChatRequest {
   conversation_history: ChatMessage[];
   image_region?: ImageRegion;  // For image editing with brush
   referenced_image_id?: string;  // ID of clicked image
+  conversation_id?: string;  // Server-side conversation; history then only holds new messages
+  last_message_id?: string;  // Last message ID the server acknowledged
 }
 
 export interface ChatResponse {
   type: "text_solo" | "image_solo" | "both";
   content: string;
   image_url?: string;
+  conversation_id?: string;
+  message_id?: string;  // ID of this reply on the server
+  history_length?: number;  // Messages of the sent history the server now holds
+  history_message_id?: string;  // ID of the last of them, sent back as last_message_id
 }
 
+type ConversationSync = Pick<ChatResponse, "conversation_id" | "history_length" | "history_message_id">;
+
+const newConversationId = (): string =>
+  `conv_${Date.now()}_${Math.random().toString(36).slice(2, 11)}`;
+
+const sameMessage = (a: ChatMessage, b: ChatMessage): boolean =>
+  a.message_id && b.message_id ? a.message_id === b.message_id : a.role === b.role && a.content === b.content;
+
+// Server-side conversation of one chat view: after the first turn only the messages
+// after the server's sync point are sent. Each view keeps its own instance.
+export class ChatConversation {
+  private conversationId: string | null = null;
+  private lastMessageId: string | undefined;
+  private syncedLength = 0;  // Number of local history messages the server already has
+  private syncedLast: ChatMessage | null = null;  // The last of them, to notice a replaced history
+
+  // Full history under a fresh conversation ID (first turn, or server state was lost)
+  start(history: ChatMessage[]) {
+    this.reset();
+    this.conversationId = newConversationId();
+    return { conversation_id: this.conversationId, last_message_id: undefined, conversation_history: history };
+  }
+
+  delta(history: ChatMessage[]) {
+    const synced = this.syncedLength;
+    if (!this.conversationId || history.length < synced ||
+        (this.syncedLast && !sameMessage(history[synced - 1], this.syncedLast))) {
+      return this.start(history);
+    }
+    return {
+      conversation_id: this.conversationId,
+      last_message_id: this.lastMessageId,
+      conversation_history: history.slice(synced)
+    };
+  }
+
+  // Sync from what the server reports it holds of the sent history; the turn's
+  // user message and reply are sent with the next delta, as this view records them
+  acknowledge(history: ChatMessage[], sync?: ConversationSync) {
+    if (!sync?.conversation_id || sync.history_length === undefined) {
+      this.reset();
+      return;
+    }
+    this.conversationId = sync.conversation_id;
+    this.syncedLength = Math.min(sync.history_length, history.length);
+    this.lastMessageId = this.syncedLength ? sync.history_message_id : undefined;
+    this.syncedLast = this.syncedLength ? history[this.syncedLength - 1] : null;
+  }
+
+  reset() {
+    this.conversationId = null;
+    this.lastMessageId = undefined;
+    this.syncedLength = 0;
+    this.syncedLast = null;
+  }
+}
+
+// Without a ChatConversation the full history is sent every turn
+const historyFields = (history: ChatMessage[], conversation?: ChatConversation) =>
+  conversation ? conversation.delta(history) : { conversation_history: history };
+
 // Main function to send chat messages
 export const sendChatMessage = async (
   userInput: string,
   userImage?: string,
   conversationHistory: ChatMessage[] = [],
   imageRegion?: ImageRegion,
-  referencedImageId?: string
+  referencedImageId?: string,
+  conversation?: ChatConversation
 ): Promise<ChatResponse> => {
   console.log("🔗 ChatAPI: Preparing request to backend");
   console.log("📝 User input:", userInput);
@@ -57,17 +125,26 @@ export const sendChatMessage = async (
   const payload: ChatRequest = {
     user_input: userInput,
     user_image: userImage,
-    conversation_history: conversationHistory,
     image_region: imageRegion,
-    referenced_image_id: referencedImageId
+    referenced_image_id: referencedImageId,
+    ...historyFields(conversationHistory, conversation)
   };
   
   console.log("📤 Sending payload to backend...");
   const url = API_BASE_URL ? `${API_BASE_URL}/chat/` : "/chat/";
   // Set timeout to 5 minutes (300000ms) for image editing operations
-  const response = await axios.post<ChatResponse>(url, payload, {
+  const postChat = (body: ChatRequest) => axios.post<ChatResponse>(url, body, {
     timeout: 300000  // 5 minutes - enough for image editing (can take 60-90s)
   });
+  let response;
+  try {
+    response = await postChat(payload);
+  } catch (error) {
+    if (!conversation || !axios.isAxiosError(error) || error.response?.status !== 409) throw error;
+    // Server no longer has the conversation (restart/expiry): resend the full history
+    response = await postChat({ ...payload, ...conversation.start(conversationHistory) });
+  }
+  conversation?.acknowledge(conversationHistory, response.data);
   console.log("📥 Received response from backend:", response.data.type);
   console.log("📝 Response content length:", response.data.content.length);
   
@@ -92,7 +169,8 @@ export const sendChatMessageStreamUnified = async (
   userImage?: string,
   conversationHistory: ChatMessage[] = [],
   imageRegion?: ImageRegion,
-  referencedImageId?: string
+  referencedImageId?: string,
+  conversation?: ChatConversation
 ): Promise<void> => {
   console.log("🌊 ChatAPI Stream: Starting unified streaming request");
   console.log("📝 User input:", userInput);
@@ -101,20 +179,25 @@ export const sendChatMessageStreamUnified = async (
   const payload: ChatRequest = {
     user_input: userInput,
     user_image: userImage,
-    conversation_history: conversationHistory,
     image_region: imageRegion,
-    referenced_image_id: referencedImageId
+    referenced_image_id: referencedImageId,
+    ...historyFields(conversationHistory, conversation)
   };
 
   console.log("📤 Sending streaming request to backend...");
   const url = API_BASE_URL ? `${API_BASE_URL}/chat/stream` : "/chat/stream";
-  const response = await fetch(url, {
+  const postStream = (body: ChatRequest) => fetch(url, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
     },
-    body: JSON.stringify(payload),
+    body: JSON.stringify(body),
   });
+  let response = await postStream(payload);
+  if (response.status === 409 && conversation) {
+    // Server no longer has the conversation (restart/expiry): resend the full history
+    response = await postStream({ ...payload, ...conversation.start(conversationHistory) });
+  }
 
   console.log("📥 Stream response status:", response.status);
 
@@ -157,6 +240,7 @@ export const sendChatMessageStreamUnified = async (
                 } else if (data.type === 'error') {
                   onError(data.message);
                 } else if (data.type === 'done') {
+                  conversation?.acknowledge(conversationHistory, data);
                   if (fullText) {
                     onTextComplete(fullText);
                   }
@@ -199,6 +283,7 @@ export const sendChatMessageStreamUnified = async (
             } else if (data.type === 'error') {
               onError(data.message);
             } else if (data.type === 'done') {
+              conversation?.acknowledge(conversationHistory, data);
               if (fullText) {
                 onTextComplete(fullText);
               }
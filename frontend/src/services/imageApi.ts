@@ -88,50 +88,79 @@ export const generateImageFromPromptStream = async (
       };
     }
     
-    const response = await fetch(url, {
+    let response = await fetch(url, {
       method: "POST",
       headers,
       body,
     });
 
-    if (!response.ok) {
-      throw new Error(`HTTP ${response.status}: ${await response.text()}`);
-    }
+    // The backend keeps generating if the connection drops; resume from the last event we saw
+    let streamId: string | null = null;
+    let lastEventId = -1;
+    let resumeAttempts = 0;
+    const maxResumeAttempts = 3;
 
-    const reader = response.body?.getReader();
-    const decoder = new TextDecoder();
+    while (true) {
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${await response.text()}`);
+      }
 
-    if (!reader) {
-      throw new Error("No response body");
-    }
+      const reader = response.body?.getReader();
+      const decoder = new TextDecoder();
 
-    let buffer = "";
-    while (true) {
-      const { done, value } = await reader.read();
-      if (done) break;
+      if (!reader) {
+        throw new Error("No response body");
+      }
+
+      let buffer = "";
+      try {
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) break;
 
-      buffer += decoder.decode(value, { stream: true });
-      const lines = buffer.split("\n");
-      buffer = lines.pop() || "";
+          buffer += decoder.decode(value, { stream: true });
+          const lines = buffer.split("\n");
+          buffer = lines.pop() || "";
 
-      for (const line of lines) {
-        if (line.startsWith("data: ")) {
-          try {
-            const data = JSON.parse(line.slice(6));
-            if (data.type === "partial_image") {
-              onPartialImage(data.image_b64, data.index);
-            } else if (data.type === "completed") {
-              onComplete(data.image_url);
-              return;
-            } else if (data.type === "error") {
-              onError(data.message);
-              return;
+          for (const line of lines) {
+            if (line.startsWith("id: ")) {
+              lastEventId = parseInt(line.slice(4), 10);
+            } else if (line.startsWith("data: ")) {
+              try {
+                const data = JSON.parse(line.slice(6));
+                if (data.type === "stream") {
+                  streamId = data.stream_id;
+                } else if (data.type === "partial_image") {
+                  onPartialImage(data.image_b64, data.index);
+                } else if (data.type === "completed") {
+                  onComplete(data.image_url);
+                  return;
+                } else if (data.type === "error") {
+                  onError(data.message);
+                  return;
+                }
+              } catch (e) {
+                console.error("Failed to parse SSE data:", e);
+              }
             }
-          } catch (e) {
-            console.error("Failed to parse SSE data:", e);
           }
         }
+      } catch (readError) {
+        console.warn("Image stream interrupted:", readError);
       }
+
+      // Stream ended without a result: reconnect to the running generation
+      if (!streamId || resumeAttempts >= maxResumeAttempts) {
+        throw new Error("Image stream ended unexpectedly");
+      }
+      resumeAttempts += 1;
+      console.log(`🔁 Resuming image stream ${streamId} after event ${lastEventId}`);
+      const resumeUrl = API_BASE_URL
+        ? `${API_BASE_URL}/image/streams/${streamId}`
+        : `/image/streams/${streamId}`;
+      response = await fetch(resumeUrl, {
+        headers: { "Last-Event-ID": String(lastEventId) },
+      });
     }
   } catch (error) {
     onError(error instanceof Error ? error.message : "Unknown error");
@@ -1,23 +1,29 @@
 import os
 from openai import OpenAI
 from dotenv import load_dotenv
-import time
+try:
+    # Inside the backend, use its shared retry/deadline policy
+    from app.clients.retry_policy import call_with_retry_sync
+except ImportError:
+    call_with_retry_sync = None
 # Load environment variables from .env file
 load_dotenv(override=True)
 client = OpenAI(
     api_key=os.environ.get("OPENAI_API_KEY"),  # This is the default and can be omitted
+    # Standalone runs fall back to the SDK's bounded backoff
+    max_retries=0 if call_with_retry_sync else 5,
 )
 def generate_response(prompt, model):
-    while True:
-        try:
-            completion = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}]
-             )
-            return completion.choices[0].message.content
-        except Exception as e:
-            print(f"Error {e} occurred while generating response. Retrying in 2 seconds...")
-            time.sleep(2)
+    def create():
+        return client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    if call_with_retry_sync is not None:
+        completion = call_with_retry_sync(create, "visual_language_gpt")
+    else:
+        completion = create()
+    return completion.choices[0].message.content
 
 def generate_prompt(mwp,formula=None):
     prompt_base = (f'''